@@ -0,0 +1,75 @@
+import subprocess
+import threading
+import time
+from AudioCapture.ring_buffer import PcmRingBuffer
+
+
+DEFAULT_DEVICE = "hw:0,1"
+DEFAULT_RATE = 44100
+DEFAULT_CHANNELS = 2
+DEFAULT_SAMPLE_WIDTH = 2  # S16_LE
+BUFFER_SECONDS = 60
+READ_SIZE = 4096
+
+
+# One long-lived capture reading raw PCM from a pipe (arecord stdout) or any
+# binary stream (a raw PCM file) into a ring buffer.
+# Every read stores a (time, frames) anchor so wall clock timestamps, like a
+# track change seen on tidal-hifi, can be mapped to a frame position.
+class CaptureStream:
+    def __init__(self, reader, rate=DEFAULT_RATE, channels=DEFAULT_CHANNELS,
+                 sample_width=DEFAULT_SAMPLE_WIDTH, buffer_seconds=BUFFER_SECONDS, process=None):
+        self.reader = reader
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_bytes = channels * sample_width
+        self.ring = PcmRingBuffer(int(buffer_seconds * rate), self.frame_bytes)
+        self.process = process
+        self.finished = threading.Event()
+        self._anchor = (time.time(), 0)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @classmethod
+    def from_arecord(cls, device=DEFAULT_DEVICE, rate=DEFAULT_RATE, channels=DEFAULT_CHANNELS, **kwargs):
+        process = subprocess.Popen(
+            ["arecord", "-q", "-D", device, "-f", "S16_LE", "-r", str(rate), "-c", str(channels), "-t", "raw"],
+            stdout=subprocess.PIPE,
+        )
+        return cls(process.stdout, rate=rate, channels=channels, sample_width=2, process=process, **kwargs)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(open(path, "rb"), **kwargs)
+
+    def start(self):
+        self._anchor = (time.time(), 0)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while True:
+                data = self.reader.read(READ_SIZE)
+                if not data:
+                    break
+                self.ring.write(data)
+                self._anchor = (time.time(), self.ring.written)
+        finally:
+            self.finished.set()
+            # wake up anyone waiting for frames that will never come
+            self.ring.wake()
+
+    def frame_at(self, timestamp):
+        anchor_time, anchor_frames = self._anchor
+        return max(0, anchor_frames + int(round((timestamp - anchor_time) * self.rate)))
+
+    def wait_for(self, frame, timeout=None):
+        return self.ring.wait_for(frame, timeout, stop=self.finished)
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+        self._thread.join(timeout=2)
+        self.reader.close()
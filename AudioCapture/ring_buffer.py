@@ -0,0 +1,68 @@
+import threading
+
+
+# Preallocated circular buffer of PCM frames.
+# Positions are absolute frame counts since the capture started, so a frame
+# can be addressed the same way before and after the buffer wraps.
+class PcmRingBuffer:
+    def __init__(self, capacity_frames, frame_bytes):
+        self.capacity = capacity_frames
+        self.frame_bytes = frame_bytes
+        self.buffer = bytearray(capacity_frames * frame_bytes)
+        self.written = 0  # frames written since start
+        self._partial = b""  # bytes of an incomplete frame from the last write
+        self._cond = threading.Condition()
+
+    @property
+    def oldest(self):
+        return max(0, self.written - self.capacity)
+
+    def write(self, data):
+        data = self._partial + bytes(data)
+        usable = len(data) - len(data) % self.frame_bytes
+        self._partial = data[usable:]
+        frames = usable // self.frame_bytes
+        if not frames:
+            return 0
+        if frames > self.capacity:
+            # only the newest frames fit
+            skip = frames - self.capacity
+            data = data[skip * self.frame_bytes:usable]
+        else:
+            skip = 0
+            data = data[:usable]
+        with self._cond:
+            start = (self.written + skip) % self.capacity
+            offset = start * self.frame_bytes
+            first = min(len(data), len(self.buffer) - offset)
+            self.buffer[offset:offset + first] = data[:first]
+            if first < len(data):
+                self.buffer[:len(data) - first] = data[first:]
+            self.written += frames
+            self._cond.notify_all()
+        return frames
+
+    def read(self, start, end):
+        # frames [start, end), clamped to what is still in the buffer
+        with self._cond:
+            start = max(start, self.oldest)
+            end = min(end, self.written)
+            if end <= start:
+                return b""
+            offset = (start % self.capacity) * self.frame_bytes
+            size = (end - start) * self.frame_bytes
+            first = min(size, len(self.buffer) - offset)
+            data = bytes(self.buffer[offset:offset + first])
+            if first < size:
+                data += bytes(self.buffer[:size - first])
+            return data
+
+    def wait_for(self, frame, timeout=None, stop=None):
+        # stop: event that ends the wait early, like the end of the stream
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.written >= frame or (stop is not None and stop.is_set()), timeout)
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
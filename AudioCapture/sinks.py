@@ -0,0 +1,42 @@
+import subprocess
+import wave
+from QueueConverter.converter import flac_command
+
+
+# Destinations for the frames of one track, see TrackSplitter.
+
+
+class WavSink:
+    def __init__(self, filename, capture):
+        self.filename = filename
+        self._wave = wave.open(filename, "wb")
+        self._wave.setnchannels(capture.channels)
+        self._wave.setsampwidth(capture.sample_width)
+        self._wave.setframerate(capture.rate)
+
+    def write(self, data):
+        self._wave.writeframesraw(data)
+
+    def close(self):
+        self._wave.close()
+        return True
+
+
+class FlacSink:
+    # PCM goes straight into a flac encoder through its stdin, tags and cover
+    # are set when the encoder starts, so the track is written once, compressed
+    def __init__(self, filename, capture, tags, art_filename=None):
+        self.filename = filename
+        raw_format = (capture.rate, capture.channels, capture.sample_width)
+        self._process = subprocess.Popen(flac_command(filename, tags, art_filename, raw_format),
+                                         stdin=subprocess.PIPE)
+
+    def write(self, data):
+        self._process.stdin.write(data)
+
+    def close(self):
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            print(f"❌ flac encoder failed for {self.filename}")
+            return False
+        return True
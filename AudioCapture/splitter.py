@@ -0,0 +1,82 @@
+import threading
+from AudioCapture.sinks import WavSink
+
+
+HOLDBACK_SECONDS = 10  # max lag of a track change notification
+DRAIN_INTERVAL = 0.5
+
+
+# Cuts the continuous capture into one file per track at the frame offsets it
+# is given. Those come from wall clock times (CaptureStream.frame_at) and
+# tidal-hifi reports the position in whole seconds, so a cut can be up to a
+# second off the real track boundary; only the cut itself is frame exact.
+# A background thread drains the ring buffer into the current track file but
+# stays HOLDBACK_SECONDS behind the capture, so a boundary reported late
+# still lands in frames not yet written.
+class TrackSplitter:
+    def __init__(self, capture, holdback_seconds=HOLDBACK_SECONDS):
+        self.capture = capture
+        self.holdback = int(holdback_seconds * capture.rate)
+        self.drained = 0  # next frame to write
+        self.current = None  # sink of the track being written
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._drain_loop, daemon=True)
+        self._thread.start()
+
+    def _write_until(self, end_frame):
+        # called with the lock held
+        ring = self.capture.ring
+        if self.drained < ring.oldest:
+            print(f"⚠️ Capture overrun, {ring.oldest - self.drained} frames lost")
+            self.drained = ring.oldest
+        if end_frame <= self.drained:
+            return
+        data = ring.read(self.drained, end_frame)
+        if self.current:
+            self.current.write(data)
+        self.drained += len(data) // ring.frame_bytes
+
+    def _drain_loop(self):
+        while not self._stop.wait(DRAIN_INTERVAL):
+            with self._lock:
+                self._write_until(self.capture.ring.written - self.holdback)
+
+    def start_track(self, filename, start_frame, sink=None):
+        # sink defaults to a WAV file, see AudioCapture.sinks
+        with self._lock:
+            if start_frame < self.drained:
+                print(f"⚠️ Track start {self.drained - start_frame} frames late, already drained")
+            else:
+                # frames before the start belong to no track
+                self._write_until(start_frame)
+                self.drained = max(self.drained, start_frame)
+            self.current = sink or WavSink(filename, self.capture)
+
+    def end_track(self, end_frame, timeout=5, discard_frames=0):
+        # frames up to end_frame go to the current file, the last discard_frames
+        # of them are dropped (tail trim, must be under the holdback).
+        # Returns the file name, None if the sink failed.
+        self.capture.wait_for(end_frame, timeout)
+        with self._lock:
+            if end_frame < self.drained:
+                print(f"⚠️ Track end {self.drained - end_frame} frames late, already drained")
+            self._write_until(end_frame - discard_frames)
+            self.drained = max(self.drained, end_frame)
+            sink, self.current = self.current, None
+        if sink is None:
+            return None
+        return sink.filename if sink.close() else None
+
+    def split(self, boundary_frame, next_filename, next_sink=None):
+        filename = self.end_track(boundary_frame)
+        self.start_track(next_filename, boundary_frame, next_sink)
+        return filename
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            if self.current:
+                self.current.close()
+                self.current = None
@@ -0,0 +1,129 @@
+import os
+import struct
+import wave
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+DEFAULT_THRESHOLD_DB = -50.0  # dBFS, windows below are silence
+DEFAULT_WINDOW_MS = 10
+DEFAULT_SEARCH_SECONDS = 3  # only the first/last seconds are searched for a boundary
+DEFAULT_MIN_GAP_MS = 150  # shortest silence taken as a track boundary
+DEFAULT_MAX_BLEED_MS = 1000  # longest neighbour track audio before/after a boundary, the detection lag
+SAMPLE_TYPES = {2: "<i2", 4: "<i4"}
+
+
+def read_wav_mmap(path):
+    # returns (samples memmap shaped (frames, channels), rate, sample_width, data offset)
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(size - 16 + size % 2, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+    if fmt is None:
+        raise ValueError(f"{path} has no fmt chunk")
+    audio_format, channels, rate, _, _, bits = fmt
+    sample_width = bits // 8
+    if audio_format not in (1, 0xFFFE) or sample_width not in SAMPLE_TYPES:
+        raise ValueError(f"{path}: only 16/32 bit PCM is supported")
+    # arecord leaves size 0 or 0xFFFFFFFF when it is killed, trust the file size then
+    data_size = min(size, os.path.getsize(path) - offset) if size else os.path.getsize(path) - offset
+    frames = data_size // (channels * sample_width)
+    samples = np.memmap(path, dtype=SAMPLE_TYPES[sample_width], mode="r", offset=offset,
+                        shape=(frames, channels))
+    return samples, rate, sample_width, offset
+
+
+def window_rms_db(samples, window, sample_width):
+    # RMS of every full window over all channels, in dBFS
+    windows = len(samples) // window
+    if not windows:
+        return np.empty(0, dtype=np.float32)
+    x = np.asarray(samples[:windows * window], dtype=np.float32).reshape(windows, -1)
+    x /= float(2 ** (8 * sample_width - 1))
+    rms = np.sqrt(np.mean(x * x, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def _silent_runs(silent):
+    # (start, end) window indexes of the runs of True
+    padded = np.concatenate(([False], silent, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges.reshape(-1, 2)
+
+
+def find_bounds(samples, rate, sample_width, threshold_db=DEFAULT_THRESHOLD_DB, window_ms=DEFAULT_WINDOW_MS,
+                search_seconds=DEFAULT_SEARCH_SECONDS, min_gap_ms=DEFAULT_MIN_GAP_MS,
+                max_bleed_ms=DEFAULT_MAX_BLEED_MS):
+    # (start_frame, end_frame) of the track between the leading and trailing boundaries.
+    # Start: after the leading silence, or after a silence gap that follows at most
+    # max_bleed_ms of audio (the previous track bleeding in). End: at the trailing
+    # silence, or at a gap followed by at most max_bleed_ms of audio (the onset of
+    # the next track). A pause further into the track is music, nothing is cut there.
+    frames = len(samples)
+    window = max(1, int(rate * window_ms / 1000))
+    search = min(int(rate * search_seconds) // window, frames // window // 2)
+    min_gap = max(1, int(min_gap_ms / window_ms))
+    max_bleed = int(max_bleed_ms / window_ms)
+    if search <= 0:
+        return 0, frames
+
+    head = window_rms_db(samples[:search * window], window, sample_width) < threshold_db
+    tail_start = frames - search * window
+    tail = window_rms_db(samples[tail_start:], window, sample_width) < threshold_db
+
+    start = 0
+    for run_start, run_end in _silent_runs(head):
+        if run_start > max_bleed:
+            break
+        if run_start == 0 or run_end - run_start >= min_gap:
+            start = run_end * window
+            break
+
+    end = frames
+    for run_start, run_end in _silent_runs(tail)[::-1]:
+        if len(tail) - run_end > max_bleed:
+            break
+        if run_end == len(tail) or run_end - run_start >= min_gap:
+            end = tail_start + run_start * window
+            break
+    if end <= start:
+        return 0, frames
+    return start, end
+
+
+def trim_file(path, output=None, **options):
+    # writes the trimmed copy, PCM bytes are copied as they are
+    samples, rate, sample_width, _ = read_wav_mmap(path)
+    start, end = find_bounds(samples, rate, sample_width, **options)
+    output = output or f"{os.path.splitext(path)[0]}_trimmed.wav"
+    tmp_output = f"{output}.tmp"
+    with wave.open(tmp_output, "wb") as out:
+        out.setnchannels(samples.shape[1])
+        out.setsampwidth(sample_width)
+        out.setframerate(rate)
+        out.writeframes(samples[start:end].tobytes())
+    del samples  # close the map before replacing, output may be the input
+    os.replace(tmp_output, output)
+    return output, float(start / rate), float((end - start) / rate)
+
+
+def trim_directory(path, workers=None, in_place=False, **options):
+    files = sorted(os.path.join(path, f) for f in os.listdir(path)
+                   if f.lower().endswith(".wav") and not f.endswith("_trimmed.wav"))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(trim_file, f, f if in_place else None, **options) for f in files]
+        return [future.result() for future in futures]
@@ -0,0 +1,347 @@
+import bisect
+import datetime
+import json
+import random
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+import requests
+import spotipy
+import tidalapi
+from ClientSpotify.spotify_client import SpotifyClient
+from ClientTidal.tidal_client import TidalClient
+from ClientTidal.playlist_index import PlaylistIndex
+
+
+QUALITIES = ["LOW", "HIGH", "LOSSLESS", "HI_RES"]
+MEDIA_TAGS = {"LOSSLESS": ["LOSSLESS"], "HI_RES": ["HIRES_LOSSLESS", "LOSSLESS"]}
+NO_ISRC_EVERY = 10  # one track in 10 has no ISRC, matched by text search
+ONLY_ONE_SERVICE_EVERY = 20  # one in 20 exists on one service only
+
+
+def make_catalog(size, seed=0):
+    # synthetic tracks known to both fake services
+    rnd = random.Random(seed)
+    catalog = []
+    for n in range(size):
+        on_spotify = on_tidal = True
+        if n % ONLY_ONE_SERVICE_EVERY == ONLY_ONE_SERVICE_EVERY - 1:
+            on_spotify, on_tidal = (True, False) if n % 2 else (False, True)
+        catalog.append({
+            "n": n,
+            "artist": f"Artist {n % max(1, size // 10)}",
+            "title": f"Title {n}",
+            "isrc": None if n % NO_ISRC_EVERY == 0 else f"QZBEN{n:07d}",
+            "spotify_id": f"sp{n:020d}" if on_spotify else None,
+            "tidal_id": 100000 + n if on_tidal else None,
+            "duration_ms": rnd.randint(120, 300) * 1000,
+            "quality": rnd.choice(QUALITIES),
+        })
+    return catalog
+
+
+# Counts every call by endpoint, adds latency and answers a share of the calls
+# with a 429 in the form each client library raises it.
+class FakeBackend:
+    def __init__(self, name, latency=0.0, error_rate=0.0, retry_after=0.0, seed=0):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.throttled = 0
+        self.hooks = []  # called after every call, like requests response hooks
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _rate_limited(self):
+        # a plain requests backend: an HTTPError carrying the 429 response
+        response = requests.Response()
+        response.status_code = 429
+        response.headers["Retry-After"] = str(self.retry_after)
+        raise requests.HTTPError("429 Too Many Requests", response=response)
+
+    def hit(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+            throttle = self._random.random() < self.error_rate
+            if throttle:
+                self.throttled += 1
+        if self.latency:
+            time.sleep(self.latency)
+        for hook in self.hooks:
+            hook(None)
+        if throttle:
+            self._rate_limited()
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+
+class FakeSpotifyBackend(FakeBackend):
+    def _rate_limited(self):
+        raise spotipy.SpotifyException(429, -1, "API rate limit exceeded",
+                                       headers={"Retry-After": str(self.retry_after)})
+
+
+# tidalapi raises a bare TooManyRequests and keeps the response, with its
+# Retry-After, on session.request.latest_err_response
+class FakeTidalBackend(FakeBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latest_err_response = requests.Response()
+
+    def _rate_limited(self):
+        response = requests.Response()
+        response.status_code = 429
+        response.headers["Retry-After"] = str(self.retry_after)
+        self.latest_err_response = response
+        raise tidalapi.exceptions.TooManyRequests
+
+
+# Replays a listening session on a virtual clock: tracks play back to back,
+# the benchmark moves `clock` forward instead of sleeping.
+class ListeningSession:
+    def __init__(self, tracks):
+        self.clock = 0.0
+        self.tracks = list(tracks)
+        self.starts = []
+        self.ends = []
+        start = 0.0
+        for track in self.tracks:
+            self.starts.append(start)
+            start += track["duration_ms"] / 1000
+            self.ends.append(start)
+        self.end = start
+
+    def current(self):
+        i = bisect.bisect_right(self.starts, self.clock) - 1
+        if i < 0 or self.clock >= self.ends[i]:
+            return None, 0
+        return self.tracks[i], int((self.clock - self.starts[i]) * 1000)
+
+    def played_after(self, after_ms):
+        first = bisect.bisect_right(self.ends, (after_ms or 0) / 1000)
+        last = bisect.bisect_right(self.ends, self.clock)
+        return [(self.ends[i], self.tracks[i]) for i in range(first, last)]
+
+
+# Stand-in for spotipy.Spotify, only the calls SpotifyClient makes.
+class FakeSpotipy:
+    def __init__(self, backend, catalog, playlists=None, session=None):
+        self.backend = backend
+        self.catalog = [t for t in catalog if t["spotify_id"]]
+        self.playlists = playlists or {}  # playlist id -> [catalog track]
+        self.snapshots = Counter()  # playlist id -> edits, the snapshot_id
+        self.session = session  # ListeningSession for the playback calls
+        self._by_isrc = {t["isrc"]: t for t in self.catalog if t["isrc"]}
+        self._by_text = {(t["artist"].lower(), t["title"].lower()): t for t in self.catalog}
+        self._by_id = {t["spotify_id"]: t for t in self.catalog}
+
+    @staticmethod
+    def _track_json(track):
+        return {
+            "id": track["spotify_id"],
+            "uri": f"spotify:track:{track['spotify_id']}",
+            "name": track["title"],
+            "duration_ms": track["duration_ms"],
+            "external_ids": {"isrc": track["isrc"]} if track["isrc"] else {},
+            "artists": [{"name": track["artist"]}],
+        }
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, additional_types=None):
+        self.backend.hit("playlist_items")
+        tracks = self.playlists.get(playlist_id, [])[offset:offset + limit]
+        return {"items": [{"track": self._track_json(t)} for t in tracks]}
+
+    def playlist(self, playlist_id, fields=None):
+        self.backend.hit("playlist")
+        return {"snapshot_id": f"snapshot-{self.snapshots[playlist_id]}"}
+
+    def search(self, q, type="track", limit=1):
+        self.backend.hit("search")
+        if q.startswith("isrc:"):
+            track = self._by_isrc.get(q[len("isrc:"):])
+        else:
+            artist, _, title = q[len("artist:"):].partition(" track:")
+            track = self._by_text.get((artist.lower(), title.lower()))
+        return {"tracks": {"items": [self._track_json(track)] if track else []}}
+
+    def playlist_add_items(self, playlist_id, items):
+        self.backend.hit("playlist_add_items")
+        self.playlists.setdefault(playlist_id, []).extend(self._by_id[i] for i in items)
+        self.snapshots[playlist_id] += 1
+        return {"snapshot_id": f"snapshot-{self.snapshots[playlist_id]}"}
+
+    def current_playback(self):
+        self.backend.hit("current_playback")
+        track, progress_ms = self.session.current() if self.session else (None, 0)
+        if not track:
+            return None
+        return {"is_playing": True, "progress_ms": progress_ms, "item": self._track_json(track)}
+
+    def current_user_recently_played(self, limit=50, after=None):
+        self.backend.hit("recently_played")
+        played = self.session.played_after(after) if self.session else []
+        return {"items": [{"played_at": f"{end:015.3f}", "track": self._track_json(track)}
+                          for end, track in played[-limit:]]}
+
+
+def fake_track(track):
+    # same attributes the code reads from tidalapi.media.Track
+    artist = SimpleNamespace(name=track["artist"])
+    return SimpleNamespace(id=track["tidal_id"], name=track["title"], isrc=track["isrc"], artist=artist,
+                           artists=[artist], duration=track["duration_ms"] // 1000, audio_quality=track["quality"])
+
+
+class FakePlaylist:
+    def __init__(self, session, playlist_id, name, description="", tracks=None):
+        self.session = session
+        self.id = playlist_id
+        self.name = name
+        self.description = description
+        self._tracks = list(tracks or [])
+        self.last_updated = datetime.datetime.now(datetime.timezone.utc)
+
+    @property
+    def num_tracks(self):
+        return len(self._tracks)
+
+    def tracks(self, limit=None, offset=0):
+        self.session.hit("playlist_tracks")
+        end = offset + limit if limit else None
+        return [fake_track(t) for t in self._tracks[offset:end]]
+
+    def _write(self, endpoint):
+        # tidalapi re-reads the playlist for its ETag after every write
+        self.session.hit(endpoint)
+        self.session.hit("playlist_etag")
+        self.last_updated = datetime.datetime.now(datetime.timezone.utc)
+
+    def add(self, media_ids, allow_duplicates=False, position=-1, limit=100):
+        self._write("playlist_add")
+        self._tracks.extend(self.session.by_id[int(i)] for i in media_ids)
+        return list(media_ids)
+
+    def remove_by_indices(self, indices):
+        self._write("playlist_remove")
+        indices = set(indices)
+        self._tracks = [t for i, t in enumerate(self._tracks) if i not in indices]
+        return True
+
+    def delete(self):
+        self.session.hit("playlist_delete")
+        self.session.playlists.pop(self.id, None)
+
+    def edit(self, title=None, description=None):
+        self.session.hit("playlist_edit")
+        self.name = title or self.name
+        self.description = description or self.description
+
+
+class FakeTidalRequest:
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def latest_err_response(self):
+        # a plain FakeBackend keeps no error response
+        response = getattr(self.session.backend, "latest_err_response", None)
+        return requests.Response() if response is None else response
+
+    def map_request(self, url, params=None, parse=None):
+        self.session.hit("user_playlists")
+        params = params or {}
+        offset, limit = params.get("offset", 0), params.get("limit", 50)
+        return list(self.session.playlists.values())[offset:offset + limit]
+
+    def request(self, method, path, params=None, base_url=None):
+        self.session.hit("tracks_by_isrc")
+        data = []
+        for isrc in (params or {}).get("filter[isrc]", []):
+            track = self.session.by_isrc.get(isrc)
+            if track:
+                data.append({"id": str(track["tidal_id"]),
+                             "attributes": {"isrc": isrc, "mediaTags": MEDIA_TAGS.get(track["quality"], [])}})
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"data": data}).encode()
+        return response
+
+
+# Stand-in for tidalapi.Session, only the calls TidalClient and PlaylistIndex make.
+class FakeTidalSession:
+    def __init__(self, backend, catalog, playlists=None):
+        self.backend = backend
+        catalog = [t for t in catalog if t["tidal_id"]]
+        self.by_id = {t["tidal_id"]: t for t in catalog}
+        self.by_isrc = {t["isrc"]: t for t in catalog if t["isrc"]}
+        self._by_text = {f"{t['artist']} {t['title']}".lower(): t for t in catalog}
+        self.playlists = {}
+        self._next_id = 1
+        self.user = SimpleNamespace(id=1, create_playlist=self._create_playlist,
+                                    playlist=SimpleNamespace(parse_factory=None))
+        self.request = FakeTidalRequest(self)
+        self.request_session = SimpleNamespace(hooks={"response": backend.hooks})
+        self.config = SimpleNamespace(openapi_v2_location="https://openapi.tidal.com/v2/")
+        for name, tracks in (playlists or {}).items():
+            self._add_playlist(name, "", tracks)
+
+    def hit(self, endpoint):
+        self.backend.hit(endpoint)
+
+    def _add_playlist(self, name, description, tracks=None):
+        playlist = FakePlaylist(self, f"pl-{self._next_id}", name, description, tracks)
+        self._next_id += 1
+        self.playlists[playlist.id] = playlist
+        return playlist
+
+    def _create_playlist(self, name, description=""):
+        self.hit("create_playlist")
+        return self._add_playlist(name, description)
+
+    def playlist(self, playlist_id):
+        self.hit("playlist")
+        if playlist_id not in self.playlists:
+            raise tidalapi.exceptions.ObjectNotFound(playlist_id)
+        return self.playlists[playlist_id]
+
+    def search(self, query, models=None, limit=50):
+        self.hit("search")
+        track = self._by_text.get(query.lower())
+        return {"tracks": [fake_track(track)] if track else []}
+
+    def get_tracks_by_isrc(self, isrc):
+        self.hit("track_by_isrc")
+        track = self.by_isrc.get(isrc)
+        if not track:
+            raise tidalapi.exceptions.ObjectNotFound(isrc)
+        return [fake_track(track)]
+
+
+def spotify_client(fake, match_cache=None, rate_limiter=None, metrics=None):
+    # the real SpotifyClient around the fake, no OAuth
+    client = SpotifyClient.__new__(SpotifyClient)
+    client.sp = fake
+    client.match_cache = match_cache
+    client.rate_limiter = rate_limiter
+    client.metrics = metrics
+    client.http_cache = None
+    client.timer = None
+    return client
+
+
+def tidal_client(session, match_cache=None, rate_limiter=None, metrics=None):
+    # the real TidalClient around the fake session, no login
+    client = TidalClient.__new__(TidalClient)
+    client.session = session
+    client.db_path = None
+    client.match_cache = match_cache
+    client.rate_limiter = rate_limiter
+    client.playlist_index_path = None
+    client.metrics = metrics
+    client.http_cache = None
+    client.timer = None
+    client.playlist_index = PlaylistIndex(session, None, call=client._call)
+    return client
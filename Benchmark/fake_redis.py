@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import defaultdict
+
+
+# In-process stand-in for redis.Redis(decode_responses=True), only the list,
+# sorted set and hash commands RedisTaskQueue uses. Thread safe, so a queue
+# and its workers can share one instance like they would share a server.
+class FakeRedis:
+    def __init__(self):
+        self.lists = defaultdict(list)  # key -> values, index 0 is the left end
+        self.zsets = defaultdict(dict)  # key -> {member: score}
+        self.hashes = defaultdict(dict)
+        self._cond = threading.Condition()
+
+    def llen(self, key):
+        with self._cond:
+            return len(self.lists[key])
+
+    def lpush(self, key, *values):
+        with self._cond:
+            for value in values:
+                self.lists[key].insert(0, value)
+            self._cond.notify_all()
+            return len(self.lists[key])
+
+    def rpush(self, key, *values):
+        with self._cond:
+            self.lists[key].extend(values)
+            self._cond.notify_all()
+            return len(self.lists[key])
+
+    def lrange(self, key, start, end):
+        with self._cond:
+            values = self.lists[key]
+            return list(values[start:] if end == -1 else values[start:end + 1])
+
+    def lrem(self, key, count, value):
+        # count > 0 only, from the left like Redis
+        with self._cond:
+            values = self.lists[key]
+            removed = 0
+            while value in values and removed < count:
+                values.remove(value)
+                removed += 1
+            return removed
+
+    def blmove(self, source, destination, timeout, src="RIGHT", dest="LEFT"):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self.lists[source]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            value = self.lists[source].pop(-1 if src == "RIGHT" else 0)
+            if dest == "LEFT":
+                self.lists[destination].insert(0, value)
+            else:
+                self.lists[destination].append(value)
+            return value
+
+    def zadd(self, key, mapping, nx=False):
+        with self._cond:
+            added = 0
+            for member, score in mapping.items():
+                if nx and member in self.zsets[key]:
+                    continue
+                added += member not in self.zsets[key]
+                self.zsets[key][member] = score
+            return added
+
+    def zrem(self, key, *members):
+        with self._cond:
+            return sum(1 for member in members if self.zsets[key].pop(member, None) is not None)
+
+    def zscore(self, key, member):
+        with self._cond:
+            return self.zsets[key].get(member)
+
+    def zrangebyscore(self, key, low, high):
+        low = float(low)
+        high = float(high)
+        with self._cond:
+            members = sorted(self.zsets[key].items(), key=lambda item: item[1])
+            return [member for member, score in members if low <= score <= high]
+
+    def hincrby(self, key, field, amount=1):
+        with self._cond:
+            self.hashes[key][field] = int(self.hashes[key].get(field, 0)) + amount
+            return self.hashes[key][field]
+
+    def hdel(self, key, *fields):
+        with self._cond:
+            return sum(1 for field in fields if self.hashes[key].pop(field, None) is not None)
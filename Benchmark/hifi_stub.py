@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Local stand-in for the tidal-hifi API (/current, /play, /pause, /next).
+# Plays the given tracks back to back for track_seconds each and remembers
+# when every track really started, so the recorder's detection lag can be
+# measured. Answers {} once the last track has ended.
+class TidalHiFiStub:
+    def __init__(self, tracks, track_seconds=1.0, latency=0.0):
+        self.tracks = tracks
+        self.track_seconds = track_seconds
+        self.latency = latency
+        self.calls = Counter()
+        self.delays = []  # latencies of the next calls, then latency
+        self.clients = set()  # (host, port) of every connection seen
+        self.started = {}  # track index -> wall clock start
+        self._index = 0
+        self._playing = False
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def finished(self):
+        with self._lock:
+            self._advance()
+            return self._index >= len(self.tracks)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _advance(self):
+        # called with the lock held
+        if not self._playing or self._index >= len(self.tracks):
+            return
+        now = time.time()
+        while self._index < len(self.tracks) and now - self.started[self._index] >= self.track_seconds:
+            self._start(self._index + 1, self.started[self._index] + self.track_seconds)
+
+    def _start(self, index, at):
+        self._index = index
+        if index < len(self.tracks):
+            self.started[index] = at
+
+    def _current(self):
+        with self._lock:
+            self._advance()
+            if not self._playing or self._index >= len(self.tracks):
+                return {}
+            track = self.tracks[self._index]
+            elapsed = int(time.time() - self.started[self._index])
+        return {
+            "title": track["title"],
+            "artists": track["artist"],
+            "artist": track["artist"],
+            "album": "",
+            "status": "playing",
+            "url": f"https://tidal.com/browse/track/{track['tidal_id']}?u",
+            "current": f"0:{elapsed:02d}",
+            "currentInSeconds": elapsed,
+            "duration": "",
+            "durationInSeconds": 0,
+            "image": "",
+            "favorite": False,
+            "player": {"status": "playing", "shuffle": False, "repeat": "off"},
+        }
+
+    def _command(self, path):
+        with self._lock:
+            self._advance()
+            if path == "/play" and not self._playing:
+                self._playing = True
+                if self._index not in self.started:
+                    self._start(self._index, time.time())
+            elif path == "/pause":
+                self._playing = False
+            elif path == "/next":
+                self._start(self._index + 1, time.time())
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                stub.calls[path] += 1
+                stub.clients.add(self.client_address)
+                with stub._lock:
+                    latency = stub.delays.pop(0) if stub.delays else stub.latency
+                if latency:
+                    time.sleep(latency)
+                if path == "/current":
+                    body = json.dumps(stub._current()).encode()
+                elif path in ("/play", "/pause", "/next"):
+                    stub._command(path)
+                    body = b"OK"
+                else:
+                    self.send_error(404)
+                    return
+                # headers and body in one write, a split write stalls on delayed ACKs
+                self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                                 b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+
+            def log_message(self, format, *args):
+                pass
+
+        Handler.protocol_version = "HTTP/1.1"
+        return Handler
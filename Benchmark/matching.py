@@ -0,0 +1,105 @@
+import json
+import os
+from types import SimpleNamespace
+from Benchmark.fake_backends import FakeBackend, spotify_client, tidal_client
+from ClientTidal.tidal_client import TidalClient
+
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "matching.json")
+
+
+def load_fixtures(path=FIXTURES_PATH):
+    # labelled searches: the query, the candidates a search returns, the indexes that are a right match
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _tidal_track(i, candidate):
+    # the attributes of tidalapi.media.Track the ranking reads
+    artists = [SimpleNamespace(name=name) for name in candidate["artists"]]
+    version = candidate.get("version")
+    return SimpleNamespace(id=i, name=candidate["title"], version=version,
+                           full_name=f"{candidate['title']} ({version})" if version else candidate["title"],
+                           duration=candidate.get("duration"), artists=artists, artist=artists[0],
+                           audio_quality=candidate.get("quality", "LOSSLESS"))
+
+
+def _spotify_item(i, candidate):
+    return {"id": str(i), "uri": f"spotify:track:{i}", "name": candidate["title"],
+            "duration_ms": candidate["duration"] * 1000 if candidate.get("duration") else None,
+            "artists": [{"name": name} for name in candidate["artists"]]}
+
+
+# Both services answer every search with the candidates of the current case
+class FixtureSpotipy:
+    def __init__(self, backend):
+        self.backend = backend
+        self.case = None
+
+    def search(self, q, type="track", limit=10):
+        self.backend.hit("search")
+        items = [_spotify_item(i, c) for i, c in enumerate(self.case["candidates"])]
+        return {"tracks": {"items": items[:limit]}}
+
+
+class FixtureTidalSession:
+    def __init__(self, backend):
+        self.backend = backend
+        self.case = None
+
+    def search(self, query, models=None, limit=50):
+        self.backend.hit("search")
+        return {"tracks": [_tidal_track(i, c) for i, c in enumerate(self.case["candidates"])][:limit]}
+
+
+def previous_choice(case):
+    # what the clients picked before ranking: Tidal the highest quality hit, Spotify the first
+    candidates = case["candidates"]
+    if not candidates:
+        return None
+    if case["service"] == "spotify":
+        return 0
+    tracks = [_tidal_track(i, c) for i, c in enumerate(candidates)]
+    return max(tracks, key=TidalClient.quality_rank).id
+
+
+def _rates(choices, cases, searches):
+    matched = [(choice, case) for choice, case in zip(choices, cases) if choice is not None]
+    right = sum(1 for choice, case in matched if choice in case["expected"])
+    findable = sum(1 for case in cases if case["expected"])
+    return {
+        "precision": round(right / len(matched), 3) if matched else 0.0,
+        "recall": round(right / findable, 3) if findable else 0.0,
+        "wrong_matches": len(matched) - right,
+        "queries_per_right_match": round(searches / right, 3) if right else None,
+    }
+
+
+def evaluate(cases):
+    # every case through the real clients, one search each
+    spotify_backend = FakeBackend("spotify")
+    tidal_backend = FakeBackend("tidal")
+    fake_spotify = FixtureSpotipy(spotify_backend)
+    tidal_session = FixtureTidalSession(tidal_backend)
+    spotify = spotify_client(fake_spotify)
+    tidal = tidal_client(tidal_session)
+    choices = []
+    for case in cases:
+        duration_ms = case["duration"] * 1000 if case.get("duration") else None
+        if case["service"] == "spotify":
+            fake_spotify.case = case
+            found = spotify.search_track(case["artist"], case["title"], duration_ms=duration_ms)
+            choices.append(int(found["id"]) if found else None)
+        else:
+            tidal_session.case = case
+            found = tidal.find_best_quality_track(case["artist"], case["title"], duration_ms=duration_ms)
+            choices.append(found.id if found else None)
+    searches = spotify_backend.total_calls() + tidal_backend.total_calls()
+    previous = _rates([previous_choice(case) for case in cases], cases, len(cases))
+    return {
+        **_rates(choices, cases, searches),
+        "searches": searches,
+        "previous": previous,
+        "misranked": [f"{case['artist']} – {case['title']}" for choice, case in zip(choices, cases)
+                      if (choice is None) != (not case["expected"]) or (choice is not None and choice not in case["expected"])],
+    }
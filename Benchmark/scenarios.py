@@ -0,0 +1,265 @@
+import contextlib
+import importlib.util
+import os
+import resource
+import statistics
+import tempfile
+import time
+from AudioCapture.capture import CaptureStream, DEFAULT_RATE, DEFAULT_CHANNELS, DEFAULT_SAMPLE_WIDTH
+from AudioCapture.splitter import TrackSplitter
+from Benchmark.fake_backends import (make_catalog, FakeSpotifyBackend, FakeTidalBackend, FakeSpotipy,
+                                     FakeTidalSession, ListeningSession, spotify_client, tidal_client)
+from Benchmark.hifi_stub import TidalHiFiStub
+from Benchmark.matching import load_fixtures, evaluate
+from ClientTidalHiFi.tidalhifi_client import TidalHiFiClient
+from QueueConverter.consumer import Consumer
+from QueueConverter.library_index import LibraryIndex
+from QueueConverter.session_journal import SessionJournal
+from QueueConverter.task_queue import TaskQueue
+from SyncEngine.match_cache import MatchCache
+from SyncEngine.playback_scheduler import PlaybackScheduler
+from SyncEngine.rate_limiter import RateLimiter
+from SyncEngine.sync_state import SyncStateStore
+
+
+SCENARIOS = ("sync", "resync", "daily", "recorder", "matching")
+SPOTIFY_PLAYLIST_ID = "spotify:playlist:benchmark"
+TIDAL_PLAYLIST_NAME = "benchmark"
+RIPPED_EVERY = 4  # one recorder track in 4 is already in the library
+
+
+def load_script(filename):
+    # the root scripts have dashes in their names, they read config.cfg on import
+    name = os.path.splitext(os.path.basename(filename))[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _backends(options):
+    spotify = FakeSpotifyBackend("spotify", options["latency"], options["error_rate"],
+                                 options["retry_after"], options["seed"])
+    tidal = FakeTidalBackend("tidal", options["latency"], options["error_rate"],
+                             options["retry_after"], options["seed"] + 1)
+    return spotify, tidal
+
+
+def _clients(fake_spotify, tidal_session, options):
+    match_cache = MatchCache(None)
+    spotify = spotify_client(fake_spotify, match_cache, RateLimiter("Spotify", options["rate"]))
+    tidal = tidal_client(tidal_session, match_cache, RateLimiter("Tidal", options["rate"]))
+    return spotify, tidal
+
+
+def _calls(size, *backends):
+    calls = sum(b.total_calls() for b in backends)
+    return {
+        "calls": calls,
+        "calls_per_track": round(calls / max(1, size), 3),
+        "throttled": sum(b.throttled for b in backends),
+        "endpoints": {f"{b.name}.{endpoint}": n for b in backends for endpoint, n in sorted(b.calls.items())},
+    }
+
+
+def bench_sync(size, options):
+    # sync-lists both ways: Spotify has the first 80%, Tidal the last 50%
+    catalog = make_catalog(size, options["seed"])
+    spotify_backend, tidal_backend = _backends(options)
+    spotify_tracks = [t for t in catalog[:int(size * 0.8)] if t["spotify_id"]]
+    tidal_tracks = [t for t in catalog[size // 2:] if t["tidal_id"]]
+    fake_spotify = FakeSpotipy(spotify_backend, catalog, {SPOTIFY_PLAYLIST_ID: spotify_tracks})
+    tidal_session = FakeTidalSession(tidal_backend, catalog, {TIDAL_PLAYLIST_NAME: tidal_tracks})
+    spotify, tidal = _clients(fake_spotify, tidal_session, options)
+
+    sync_lists = load_script("sync-lists.py").SyncLists(spotify, tidal, workers=options["workers"])
+    summary = sync_lists.sync(TIDAL_PLAYLIST_NAME, SPOTIFY_PLAYLIST_ID, "B")
+    return {
+        "added": sum(side["added"] for side in summary.values()),
+        "not_found": sum(side["not_found"] for side in summary.values()),
+        **_calls(size, spotify_backend, tidal_backend),
+    }
+
+
+def bench_resync(size, options):
+    # sync-lists with a sync state: a first full sync (not counted), a run with
+    # nothing changed, then a run after 1% new tracks on Spotify
+    catalog = make_catalog(size, options["seed"])
+    spotify_backend, tidal_backend = _backends(options)
+    spotify_tracks = [t for t in catalog[:int(size * 0.8)] if t["spotify_id"]]
+    tidal_tracks = [t for t in catalog[size // 2:] if t["tidal_id"]]
+    fake_spotify = FakeSpotipy(spotify_backend, catalog, {SPOTIFY_PLAYLIST_ID: spotify_tracks})
+    tidal_session = FakeTidalSession(tidal_backend, catalog, {TIDAL_PLAYLIST_NAME: tidal_tracks})
+    spotify, tidal = _clients(fake_spotify, tidal_session, options)
+    state = SyncStateStore(os.path.join(tempfile.mkdtemp(prefix="sync-state-"), "sync_state.json"))
+    sync_lists = load_script("sync-lists.py").SyncLists(spotify, tidal, workers=options["workers"], state=state)
+    sync_lists.sync(TIDAL_PLAYLIST_NAME, SPOTIFY_PLAYLIST_ID, "B")
+
+    def counted_sync():
+        before = spotify_backend.total_calls() + tidal_backend.total_calls()
+        started = time.perf_counter()
+        summary = sync_lists.sync(TIDAL_PLAYLIST_NAME, SPOTIFY_PLAYLIST_ID, "B")
+        calls = spotify_backend.total_calls() + tidal_backend.total_calls() - before
+        return summary, calls, time.perf_counter() - started
+
+    _, unchanged_calls, unchanged_wall = counted_sync()
+    new_tracks = [t for t in catalog[int(size * 0.8):int(size * 0.81)] if t["spotify_id"]]
+    fake_spotify.playlists[SPOTIFY_PLAYLIST_ID] += new_tracks
+    fake_spotify.snapshots[SPOTIFY_PLAYLIST_ID] += 1
+    summary, delta_calls, delta_wall = counted_sync()
+    return {
+        "wall_s": round(unchanged_wall + delta_wall, 3),
+        "unchanged_calls": unchanged_calls,
+        "delta_tracks": len(new_tracks),
+        "delta_calls": delta_calls,
+        "added": sum(side["added"] for side in summary.values()),
+        "calls": unchanged_calls + delta_calls,
+        "calls_per_track": round((unchanged_calls + delta_calls) / max(1, size), 3),
+        "throttled": spotify_backend.throttled + tidal_backend.throttled,
+    }
+
+
+def bench_daily(size, options):
+    # daily-mix loop over `size` tracks played back to back, on a virtual clock
+    catalog = make_catalog(size, options["seed"])
+    spotify_backend, tidal_backend = _backends(options)
+    played = [t for t in catalog if t["spotify_id"]]
+    session = ListeningSession(played)
+    fake_spotify = FakeSpotipy(spotify_backend, catalog, session=session)
+    tidal_session = FakeTidalSession(tidal_backend, catalog)
+    # daily-mix-sync leaves 429s to spotipy's own retries, here the limiters stand in
+    spotify, tidal = _clients(fake_spotify, tidal_session, options)
+
+    daily_mix = load_script("daily-mix-sync.py")
+    tidal_playlist = tidal._get_or_create_playlist("spotify-daily-mix", "From Spotify Daily Mix")
+    tidal_playlist = tidal.clear_playlist(tidal_playlist)
+    scheduler = PlaybackScheduler()
+    tidal_playlist_ids = set()
+    processed_ids = set()
+    last_poll_ms = 0
+    polls = 0
+    while True:
+        poll_ms = int(session.clock * 1000)
+        state = daily_mix.poll_once(spotify, tidal, tidal_playlist, tidal_playlist_ids, processed_ids,
+                                    last_poll_ms)
+        last_poll_ms = poll_ms
+        polls += 1
+        if session.clock > session.end:
+            break
+        session.clock += scheduler.next_wait(state)
+    return {
+        "polls": polls,
+        "synced": len(processed_ids),
+        "missed": len(played) - len(processed_ids),
+        **_calls(size, spotify_backend, tidal_backend),
+    }
+
+
+class SilenceSource:
+    # endless digital silence at the real time rate, in place of arecord
+    def __init__(self, rate=DEFAULT_RATE, frame_bytes=DEFAULT_CHANNELS * DEFAULT_SAMPLE_WIDTH):
+        self.rate = rate
+        self.frame_bytes = frame_bytes
+        self.started = None
+        self.sent = 0
+        self.closed = False
+
+    def read(self, size):
+        if self.closed:
+            return b""
+        now = time.time()
+        if self.started is None:
+            self.started = now
+        self.sent += size // self.frame_bytes
+        time.sleep(max(0.0, self.started + self.sent / self.rate - now))
+        return bytes(size)
+
+    def close(self):
+        self.closed = True
+
+
+def discard_recording(task):
+    # conversion stand-in, flac may not be installed where the benchmark runs
+    os.unlink(task["tmp_file_name"])
+    return f"{task['original_file_name']}.flac", {"encode": 0.0}
+
+
+def bench_recorder(size, options):
+    # tidal2flac state machine against the tidal-hifi stub, silence as audio
+    import tidal2flac
+
+    catalog = make_catalog(size + 1, options["seed"])
+    tracks = [t for t in catalog if t["tidal_id"]]
+    tracks, end_marker = tracks[:size], tracks[size] if len(tracks) > size else tracks[-1]
+    workdir = tempfile.mkdtemp(prefix="tidal2flac-bench-")
+    os.chdir(workdir)
+    library = LibraryIndex(workdir).refresh()
+    for track in tracks[::RIPPED_EVERY]:
+        library.add(track["tidal_id"], f"ripped-{track['n']}.flac")
+    journal = SessionJournal(os.path.join(workdir, "session.jsonl"))
+    task_queue = TaskQueue()
+    recorder = tidal2flac.Recorder(task_queue, library=library, journal=journal)
+    recorder.capture = CaptureStream(SilenceSource()).start()
+    recorder.splitter = TrackSplitter(recorder.capture)
+    consumer = Consumer(task_queue, workers=1, convert=discard_recording,
+                        on_result=recorder.conversion_finished)
+    consumer.start()
+
+    stub = TidalHiFiStub(tracks + [end_marker], options["track_seconds"], options["latency"]).start()
+    tidalui = TidalHiFiClient(stub.url)
+    index_of = {str(t["tidal_id"]): i for i, t in enumerate(tracks + [end_marker])}
+    lags = []
+    previous_track_data = None
+    started = time.perf_counter()
+    tidalui.play()
+    for changed_at, song_data in tidalui.watch_track_changes(options["poll"]):
+        index = index_of[tidalui.track_id(song_data)]
+        lags.append(changed_at - stub.started[index])
+        previous_track_data = tidal2flac.on_track_change(tidalui, recorder, previous_track_data,
+                                                         changed_at, song_data)
+        if index == len(tracks):
+            break
+    recorder.close()
+    task_queue.join()
+    consumer.stop()
+    consumer.join()
+    journal.close()
+    stub.stop()
+    wall = time.perf_counter() - started
+    calls = sum(stub.calls.values())
+    return {
+        "wall_s": round(wall, 3),
+        "skipped": stub.calls["/next"],
+        "recorded": sum(1 for entry in journal.tracks.values() if entry["state"] == "encoded"),
+        "lag_ms_mean": round(1000 * statistics.mean(lags), 1),
+        "lag_ms_max": round(1000 * max(lags), 1),
+        "calls": calls,
+        "calls_per_track": round(calls / max(1, size), 3),
+        "endpoints": {f"tidal-hifi{path}": n for path, n in sorted(stub.calls.items())},
+    }
+
+
+def bench_matching(size, options):
+    # search ranking against the labelled fixture set, size is the number of cases
+    cases = load_fixtures()[:size]
+    result = evaluate(cases)
+    return {**result, "calls": result["searches"], "calls_per_track": round(result["searches"] / max(1, len(cases)), 3)}
+
+
+BENCHMARKS = {"sync": bench_sync, "resync": bench_resync, "daily": bench_daily, "recorder": bench_recorder,
+              "matching": bench_matching}
+
+
+def run(scenario, size, options):
+    # runs in a fresh process, so peak memory is the scenario's own
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        result = BENCHMARKS[scenario](size, options)
+        wall = time.perf_counter() - started
+    return {
+        "scenario": scenario,
+        "tracks": size,
+        "wall_s": round(wall, 3),
+        **result,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
@@ -1,32 +1,118 @@
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+import threading
+from collections import namedtuple
+from contextlib import nullcontext
+from SyncEngine.paging import iter_items
+from SyncEngine.http_cache import DEFAULT_SEARCH_TTL
+from SyncEngine.track_ranking import SEARCH_LIMIT, track_key, best_match, search_title
 
 
+PLAYLIST_PAGE_SIZE = 100  # max allowed by the Web API
+PLAYLIST_FIELDS = "items(track(id,uri,name,duration_ms,external_ids(isrc),artists(name)))"
+# responses kept by the HTTP cache: playlist pages always revalidated (ETag), searches for a day
+HTTP_CACHE_RULES = [(r"/v1/playlists/[^/]+/tracks", 0), (r"/v1/search", DEFAULT_SEARCH_TTL)]
+
+SpotifyTrack = namedtuple("SpotifyTrack", ["id", "uri", "artist", "title", "isrc", "duration_ms"])
+PlaybackState = namedtuple("PlaybackState", ["track", "is_playing", "progress_ms"])
+
+
+# The spotipy client is built on first use: spotipy is imported and the OAuth
+# token read only by runs that talk to Spotify. spotipy checks the cached
+# token's expiry locally and refreshes it only when it is about to expire.
 class SpotifyClient:
-    def __init__(self, client_id, client_secret, redirect_uri):
+    def __init__(self, client_id, client_secret, redirect_uri, match_cache=None, rate_limiter=None, metrics=None,
+                 http_cache=None, timer=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.match_cache = match_cache
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics  # SyncEngine.metrics.ApiMetrics
+        self.http_cache = http_cache
+        self.timer = timer  # SyncEngine.startup_timing.StartupTimer
+        self._sp = None
+        self._sp_lock = threading.Lock()
+
+    @property
+    def sp(self):
+        if self._sp is None:
+            with self._sp_lock:
+                if self._sp is None:
+                    with self.timer.phase("spotify client") if self.timer else nullcontext():
+                        self._sp = self._connect()
+        return self._sp
+
+    @sp.setter
+    def sp(self, value):
+        self._sp = value
+
+    def _connect(self):
+        import spotipy
+        from spotipy.oauth2 import SpotifyOAuth
+
+        # with a rate limiter 429s are handled there only (Retry-After shared by all threads):
+        # not in the forcelist, and urllib3 must not honour Retry-After on its own either
+        status_forcelist = (500, 502, 503, 504) if self.rate_limiter else spotipy.Spotify.default_retry_codes
         # https://developer.spotify.com/documentation/web-api/concepts/scopes
-        self.sp = spotipy.Spotify(
+        sp = spotipy.Spotify(
+            status_forcelist=status_forcelist,
             auth_manager=SpotifyOAuth(
-                client_id=client_id,
-                client_secret=client_secret,
-                redirect_uri=redirect_uri,
-                scope="playlist-read-private playlist-modify-private playlist-modify-public user-read-playback-state user-read-currently-playing",
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+                redirect_uri=self.redirect_uri,
+                scope="playlist-read-private playlist-modify-private playlist-modify-public user-read-playback-state user-read-currently-playing user-read-recently-played",
             )
         )
+        if self.rate_limiter:
+            # urllib3 still retries a 429 that carries Retry-After, even outside the forcelist
+            from requests.adapters import HTTPAdapter
 
-    def get_playlist_tracks(self, playlist_id):
-        results = self.sp.playlist_tracks(playlist_id)
-        tracks = []
-        for item in results["items"]:
+            retry = sp._session.get_adapter("https://").max_retries.new(respect_retry_after_header=False)
+            adapter = HTTPAdapter(max_retries=retry)
+            sp._session.mount("http://", adapter)
+            sp._session.mount("https://", adapter)
+        if self.http_cache:
+            self.http_cache.install(sp._session, HTTP_CACHE_RULES)
+        return sp
+
+    def _call(self, fn, *args, **kwargs):
+        if self.metrics:
+            fn = self.metrics.wrap("spotify", fn)
+        if self.rate_limiter:
+            return self.rate_limiter.call(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    def _fetch_playlist_page(self, playlist_id, offset, limit):
+        results = self._call(self.sp.playlist_items, playlist_id, fields=PLAYLIST_FIELDS, limit=limit,
+                             offset=offset, additional_types=("track",))
+        return results["items"]
+
+    def _to_track(self, track):
+        return SpotifyTrack(
+            id=track["id"],
+            uri=track["uri"],
+            artist=track["artists"][0]["name"] if track["artists"] else "",
+            title=track["name"],
+            isrc=(track.get("external_ids") or {}).get("isrc"),
+            duration_ms=track.get("duration_ms"),
+        )
+
+    def iter_playlist_tracks(self, playlist_id, page_size=PLAYLIST_PAGE_SIZE):
+        # walks the whole playlist page by page, prefetching the next page
+        fetch_page = lambda offset, limit: self._fetch_playlist_page(playlist_id, offset, limit)
+        for item in iter_items(fetch_page, page_size):
             track = item["track"]
-            if track:
-                artist = track["artists"][0]["name"]
-                name = track["name"]
-                tracks.append((artist, name))
-        return tracks
+            if track and track.get("id"):
+                yield self._to_track(track)
+
+    def get_playlist_snapshot(self, playlist_id):
+        # one small call, the snapshot_id changes with every edit of the playlist
+        return self._call(self.sp.playlist, playlist_id, fields="snapshot_id")["snapshot_id"]
+
+    def get_playlist_tracks(self, playlist_id):
+        return [(t.artist, t.title) for t in self.iter_playlist_tracks(playlist_id)]
 
     def get_current_playing_track(self):
-        current = self.sp.current_playback()
+        current = self._call(self.sp.current_playback)
         if current and current["is_playing"]:
             item = current["item"]
             artist = item["artists"][0]["name"]
@@ -35,30 +121,88 @@ class SpotifyClient:
         else:
             return None
     
-    def search_track(self, artist, title):
-        query = f"artist:{artist} track:{title}"
-        results = self.sp.search(q=query, type="track", limit=1)
-        if results["tracks"]["items"]:
-            track = results["tracks"]["items"][0]
-            return {
+    def get_playback_state(self):
+        # keeps progress and duration so callers can wake up when the track ends
+        current = self._call(self.sp.current_playback)
+        if not current:
+            return None
+        item = current.get("item")
+        track = self._to_track(item) if item and item.get("id") else None
+        return PlaybackState(track=track, is_playing=current["is_playing"],
+                             progress_ms=current.get("progress_ms") or 0)
+
+    def get_recently_played(self, after_ms=None):
+        # one request, up to 50 finished tracks after the given unix time in ms, oldest first
+        results = self._call(self.sp.current_user_recently_played, limit=50, after=after_ms)
+        items = results.get("items", []) if results else []
+        played = [(item["played_at"], self._to_track(item["track"]))
+                  for item in items if item.get("track") and item["track"].get("id")]
+        return [track for played_at, track in sorted(played, key=lambda p: p[0])]
+
+    @staticmethod
+    def candidate_key(item):
+        duration = item["duration_ms"] / 1000 if item.get("duration_ms") else None
+        return track_key([a["name"] for a in item["artists"]], item["name"], duration)
+
+    def search_track(self, artist, title, source_id=None, duration_ms=None):
+        cache_key = None
+        if self.match_cache:
+            cache_key = self.match_cache.make_key(artist, title, source_id)
+            found, cached = self.match_cache.get("spotify", cache_key)
+            if found:
+                return cached
+        query = f"artist:{artist} track:{search_title(title)}"
+        results = self._call(self.sp.search, q=query, type="track", limit=SEARCH_LIMIT)
+        # one page of candidates ranked locally, the first hit is often a live or remastered version
+        track, _ = best_match(track_key(artist, title, duration_ms / 1000 if duration_ms else None),
+                              results["tracks"]["items"], self.candidate_key)
+        spotify_track = None
+        if track:
+            spotify_track = {
                 "id": track["id"],
                 "name": track["name"],
                 "artist": track["artists"][0]["name"],
                 "uri": track["uri"]
             }
-        return None
+        if self.match_cache:
+            self.match_cache.put("spotify", cache_key, spotify_track)
+        return spotify_track
     
-    def add_track_to_playlist(self, playlist_id, track_id):
-        # Check if the track is already in the playlist
-        existing_tracks = self.sp.playlist_tracks(playlist_id)
-        existing_track_ids = {item["track"]["id"] for item in existing_tracks["items"]}
+    def search_isrc(self, isrc):
+        # the Web API has no multi-ISRC lookup, an isrc: query is exact though
+        if self.match_cache:
+            found, cached = self.match_cache.get("spotify-isrc", isrc)
+            if found:
+                return cached
+        results = self._call(self.sp.search, q=f"isrc:{isrc}", type="track", limit=1)
+        items = results["tracks"]["items"]
+        track_id = items[0]["id"] if items else None
+        if self.match_cache:
+            self.match_cache.put("spotify-isrc", isrc, track_id)
+        return track_id
+
+    def add_track_to_playlist(self, playlist_id, track_id, existing_track_ids=None):
+        # Check if the track is already in the playlist, pass existing_track_ids
+        # to avoid re-reading the playlist on every call
+        if existing_track_ids is None:
+            existing_track_ids = {t.id for t in self.iter_playlist_tracks(playlist_id)}
         if track_id in existing_track_ids:
             print(f"🔁 Track {track_id} is already in playlist {playlist_id}")
             return
         # Add the track to the playlist        
         try:
-            self.sp.playlist_add_items(playlist_id, [track_id])
+            self._call(self.sp.playlist_add_items, playlist_id, [track_id])
+            existing_track_ids.add(track_id)
             return True
         except Exception as e:
             print(f"❌ Error adding track to playlist: {e}")
         return False
+
+    def add_track_ids_to_playlist(self, playlist_id, track_ids):
+        # one call, up to 100 ids
+        try:
+            self._call(self.sp.playlist_add_items, playlist_id, list(track_ids))
+            return True
+        except Exception as e:
+            print(f"❌ Error adding tracks to playlist: {e}")
+        return False
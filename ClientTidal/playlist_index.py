@@ -0,0 +1,118 @@
+import threading
+import time
+from tinydb import TinyDB
+from SyncEngine.paging import iter_items
+
+
+INDEX_MAX_AGE = 24 * 3600  # rebuild the persisted index after a day
+PLAYLISTS_PAGE_SIZE = 50
+
+
+# name -> playlist ids of the user's playlists.
+# Listed at most once per session (paginated), persisted to a TinyDB file and
+# reused on the next run while fresh. A stale id or a name missing from a
+# persisted index triggers one rebuild.
+# Shared by concurrent syncs: hold `lock` around a lookup and the create that
+# may follow it.
+class PlaylistIndex:
+    def __init__(self, session, path=None, max_age=INDEX_MAX_AGE, call=None):
+        self.session = session
+        self.path = path
+        self.max_age = max_age
+        self._call = call or (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+        self.ids = None  # name -> [playlist id, ...]
+        self.objects = {}  # playlist id -> playlist fetched in this session
+        self.built = False  # listed in this session
+        self.lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        docs = TinyDB(self.path).all()
+        if not docs:
+            return
+        doc = docs[0]
+        if str(doc.get("user_id")) != str(self.session.user.id):
+            return
+        if time.time() - doc.get("updated", 0) > self.max_age:
+            return
+        self.ids = doc["playlists"]
+
+    def _save(self):
+        if not self.path:
+            return
+        db = TinyDB(self.path)
+        db.truncate()
+        db.insert({"user_id": str(self.session.user.id), "updated": time.time(), "playlists": self.ids})
+
+    def _fetch_page(self, offset, limit):
+        user = self.session.user
+        return self._call(self.session.request.map_request, "users/%s/playlists" % user.id,
+                          params={"limit": limit, "offset": offset}, parse=user.playlist.parse_factory)
+
+    def build(self):
+        self.ids = {}
+        for playlist in iter_items(self._fetch_page, PLAYLISTS_PAGE_SIZE):
+            self.ids.setdefault(playlist.name, []).append(playlist.id)
+            self.objects[playlist.id] = playlist
+        self.built = True
+        self._save()
+        print(f"Tidal playlist index built: {len(self.ids)} names")
+
+    def _fetch(self, playlist_id):
+        import tidalapi
+
+        if playlist_id in self.objects:
+            return self.objects[playlist_id]
+        try:
+            playlist = self._call(self.session.playlist, playlist_id)
+        except tidalapi.exceptions.ObjectNotFound:
+            return None
+        self.objects[playlist_id] = playlist
+        return playlist
+
+    def _fetch_named(self, name):
+        playlists = [self._fetch(playlist_id) for playlist_id in self.ids.get(name, [])]
+        return [p for p in playlists if p is not None and p.name == name]
+
+    def find_all(self, name):
+        with self.lock:
+            if self.ids is None:
+                self.build()
+            playlists = self._fetch_named(name)
+            if not playlists and not self.built:
+                # persisted index may be out of date, list once and retry
+                self.build()
+                playlists = self._fetch_named(name)
+            return playlists
+
+    def find(self, name):
+        playlists = self.find_all(name)
+        return playlists[0] if playlists else None
+
+    def forget(self, name):
+        # long running processes: the playlists of that name are fetched again
+        # (last_updated, num_tracks) and a missing name lists the playlists again
+        with self.lock:
+            for playlist_id in (self.ids or {}).get(name, []):
+                self.objects.pop(playlist_id, None)
+            self.built = False
+
+    def add(self, playlist):
+        with self.lock:
+            self.objects[playlist.id] = playlist
+            if self.ids is None:
+                return
+            self.ids.setdefault(playlist.name, []).append(playlist.id)
+            self._save()
+
+    def remove(self, playlist):
+        with self.lock:
+            ids = self.ids.get(playlist.name, []) if self.ids else []
+            if playlist.id in ids:
+                ids.remove(playlist.id)
+                if not ids:
+                    del self.ids[playlist.name]
+            self.objects.pop(playlist.id, None)
+            self._save()
@@ -1,18 +1,113 @@
-import tidalapi
 from tinydb import TinyDB
 import base64
+import datetime
+import math
+import threading
+from contextlib import contextmanager, nullcontext
+from types import SimpleNamespace
+from SyncEngine.paging import iter_items
+from ClientTidal.playlist_index import PlaylistIndex
+from SyncEngine.http_cache import DEFAULT_SEARCH_TTL
+from SyncEngine.track_ranking import track_key, best_match, search_title
 # docs: https://tidalapi.netlify.app/
 
 
+ISRC_BATCH_SIZE = 20  # ISRCs per openapi v2 /tracks request
+SEARCH_LIMIT = 50  # tidalapi's default page, versions of a track are ranked over all of it
+QUALITY_TAGS = ["HIRES_LOSSLESS", "LOSSLESS"]
+QUALITY_ORDER = ["LOW", "HIGH", "LOSSLESS", "HI_RES", "HI_RES_LOSSLESS"]  # audio_quality, worst first
+REMOVE_CHUNK_SIZE = 100  # indices per DELETE call
+ADD_BATCH_SIZE = 100  # ids per add call
+CLEAR_STRATEGIES = ("auto", "indices", "recreate")
+REPLACE_STRATEGIES = ("swap", "in-place")
+# responses kept by the HTTP cache: playlist pages always revalidated, searches and ISRC lookups for a day.
+# The playlist itself is never cached, tidalapi reads its ETag for every write.
+HTTP_CACHE_RULES = [(r"/v1/playlists/[^/]+/(items|tracks)", 0), (r"/v1/search", DEFAULT_SEARCH_TTL),
+                    (r"/v2/tracks\?", DEFAULT_SEARCH_TTL)]
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)  # refresh before, not after a call fails on it
+
+
+# The tidalapi session is opened on first use: tidalapi is imported, the
+# tokens read and the login done only by runs that talk to Tidal. The token
+# expiry is checked locally and the token refreshed (and saved) only when
+# it is about to expire.
 class TidalClient:
-    def __init__(self, session_path):
-        self.session = tidalapi.Session()
+    def __init__(self, session_path, match_cache=None, rate_limiter=None, playlist_index_path=None, metrics=None,
+                 http_cache=None, timer=None):
         self.db_path = session_path
+        self.match_cache = match_cache
+        self.rate_limiter = rate_limiter
+        self.playlist_index_path = playlist_index_path
+        self.metrics = metrics  # SyncEngine.metrics.ApiMetrics
+        self.http_cache = http_cache
+        self.timer = timer  # SyncEngine.startup_timing.StartupTimer
+        self._session = None
+        self._playlist_index = None
+        self._init_lock = threading.RLock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._init_lock:
+                if self._session is None:
+                    with self.timer.phase("tidal login") if self.timer else nullcontext():
+                        self._session = self._login()
+        return self._session
+
+    @session.setter
+    def session(self, value):
+        self._session = value
+
+    @property
+    def playlist_index(self):
+        if self._playlist_index is None:
+            with self._init_lock:
+                if self._playlist_index is None:
+                    self._playlist_index = PlaylistIndex(self.session, self.playlist_index_path, call=self._call)
+        return self._playlist_index
+
+    @playlist_index.setter
+    def playlist_index(self, value):
+        self._playlist_index = value
+
+    def _login(self):
+        import tidalapi
 
-        if not self._load_session_tokens():
-            self.session.login_oauth_simple()
-            self._save_session_tokens()
+        session = tidalapi.Session()
+        if self.http_cache:
+            self.http_cache.install(session.request_session, HTTP_CACHE_RULES)
+        if not self._load_session_tokens(session):
+            session.login_oauth_simple()
+            self._save_session_tokens(session)
+        return session
 
+    def _raising_http_errors(self, fn):
+        # tidalapi raises a bare TooManyRequests on a 429, the response (and its
+        # Retry-After) is only kept on the session; turned into the HTTPError the
+        # rate limiter and the metrics understand
+        import requests
+        import tidalapi
+
+        def call(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except tidalapi.exceptions.TooManyRequests as e:
+                response = getattr(self.session.request, "latest_err_response", None)
+                if response is None or response.status_code != 429:
+                    response = requests.Response()
+                    response.status_code = 429
+                raise requests.HTTPError("429 Too Many Requests", response=response) from e
+
+        call.__name__ = getattr(fn, "__name__", "call")
+        return call
+
+    def _call(self, fn, *args, **kwargs):
+        fn = self._raising_http_errors(fn)
+        if self.metrics:
+            fn = self.metrics.wrap("tidal", fn)
+        if self.rate_limiter:
+            return self.rate_limiter.call(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
 
     def _encode(self, s):
         return base64.b64encode(str(s).encode()).decode()
@@ -20,82 +115,216 @@ class TidalClient:
     def _decode(self, s):
         return base64.b64decode(s.encode()).decode()
 
-    def _save_session_tokens(self):
+    def _save_session_tokens(self, session):
         db = TinyDB(self.db_path)
         db.truncate()
         db.insert(
             {
-                "token_type": self._encode(self.session.token_type),
-                "access_token": self._encode(self.session.access_token),
-                "refresh_token": self._encode(self.session.refresh_token),
-                "expiry_time": self._encode(self.session.expiry_time),
+                "token_type": self._encode(session.token_type),
+                "access_token": self._encode(session.access_token),
+                "refresh_token": self._encode(session.refresh_token),
+                "expiry_time": self._encode(session.expiry_time),
             }
         )
 
-    def _load_session_tokens(self):
+    @staticmethod
+    def _parse_expiry(value):
+        # saved as str(datetime) in UTC, "None" when tidalapi did not set one
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _load_session_tokens(self, session):
         db = TinyDB(self.db_path)
         tokens = db.all()
         if not tokens:
             return False
         t = tokens[0]
+        token_type = self._decode(t["token_type"])
+        access_token = self._decode(t["access_token"])
+        refresh_token = self._decode(t["refresh_token"])
+        expiry_time = self._parse_expiry(self._decode(t["expiry_time"]))
+        refreshed = False
         try:
-            self.session.load_oauth_session(
-                token_type=self._decode(t["token_type"]),
-                access_token=self._decode(t["access_token"]),
-                refresh_token=self._decode(t["refresh_token"]),
-                expiry_time=self._decode(t["expiry_time"]),
-            )
+            if expiry_time and expiry_time - TOKEN_REFRESH_MARGIN < datetime.datetime.utcnow():
+                # expired or about to, one refresh now instead of a rejected call and a refresh later
+                if not session.token_refresh(refresh_token):
+                    return False
+                token_type, access_token, expiry_time = session.token_type, session.access_token, session.expiry_time
+                refreshed = True
+            if not session.load_oauth_session(token_type=token_type, access_token=access_token,
+                                              refresh_token=refresh_token, expiry_time=expiry_time):
+                return False
         except Exception as e:
             print(f"Loading session error: {e}")
             return False
+        if refreshed:
+            self._save_session_tokens(session)
         return True
 
     def _get_or_create_playlist(self, name, description):
-        for p in self.session.user.playlists():
-            if p.name == name:
-                return p
-        return self.session.user.create_playlist(name, description=description)
-    
+        # one lookup and create at a time, concurrent syncs never create the same name twice
+        with self.playlist_index.lock:
+            playlist = self.playlist_index.find(name)
+            if playlist:
+                return playlist
+            return self._create_playlist(name, description)
+
+    def _create_playlist(self, name, description):
+        playlist = self._call(self.session.user.create_playlist, name, description=description)
+        self.playlist_index.add(playlist)
+        return playlist
+
     def get_playlist(self, name, description=None):         
-        for p in self.session.user.playlists():
-            if p.name == name:
-                return p
-        return None
+        return self.playlist_index.find(name)
     
     def force_create_playlist(self, name, description):
-        for p in self.session.user.playlists():
-            if p.name == name:
-                print(f"Playlist {name} already exists.")
-                print(f"ID: {p.id}")
-                print(f"deleted...")
-                p.delete()
+        for p in self.playlist_index.find_all(name):
+            print(f"Playlist {name} already exists.")
+            print(f"ID: {p.id}")
+            print(f"deleted...")
+            self._call(p.delete)
+            self.playlist_index.remove(p)
 
         print(f"Creating playlist {name}.")
-        return self.session.user.create_playlist(name, description=description)
+        return self._create_playlist(name, description)
+
+    def get_playlist_version(self, playlist):
+        # from the playlist as last fetched (tidalapi re-reads it after every write),
+        # None when Tidal did not send lastUpdated
+        last_updated = getattr(playlist, "last_updated", None)
+        if last_updated is None:
+            return None
+        return f"{last_updated.isoformat()}|{playlist.num_tracks}"
+
+    def iter_playlist_tracks(self, playlist, page_size=100):
+        # playlist.tracks() without limit only returns the first page
+        fetch_page = lambda offset, limit: self._call(playlist.tracks, limit=limit, offset=offset)
+        yield from iter_items(fetch_page, page_size)
+
+    @staticmethod
+    def candidate_key(track):
+        artists = [a.name for a in getattr(track, "artists", None) or []] or [track.artist.name]
+        return track_key(artists, track.name, getattr(track, "duration", None), getattr(track, "version", None))
 
-    def find_track(self, artist, title):
-        results = self.session.search(
-            f"{artist} {title}", models=[tidalapi.models.Track]
+    @staticmethod
+    def quality_rank(track):
+        return QUALITY_ORDER.index(track.audio_quality) if track.audio_quality in QUALITY_ORDER else 0
+
+    def _search_candidates(self, artist, title):
+        # one page of track results, ranked locally
+        import tidalapi
+
+        results = self._call(self.session.search, f"{artist} {search_title(title)}", models=[tidalapi.media.Track],
+                             limit=SEARCH_LIMIT)
+        return results["tracks"]
+
+    def find_track(self, artist, title, duration_ms=None):
+        query = track_key(artist, title, duration_ms / 1000 if duration_ms else None)
+        track, _ = best_match(query, self._search_candidates(artist, title), self.candidate_key)
+        return track
+
+    def _track_from_cache(self, cached):
+        # lightweight stand-in exposing the attributes callers use on tidalapi tracks
+        return SimpleNamespace(
+            id=cached["id"],
+            name=cached["name"],
+            audio_quality=cached["audio_quality"],
+            artist=SimpleNamespace(name=cached["artist"]),
         )
-        if results.tracks:
-            return results.tracks[0]
-        return None
 
-    def find_best_quality_track(self, artist, title):
-        query = f"{artist} {title}"
-        results = self.session.search(query)
-        tracks = results["tracks"]
+    def _fetch_isrc_batch(self, isrcs):
+        # one openapi v2 request for several ISRCs, same endpoint as session.get_tracks_by_isrc
+        res = self.session.request.request(
+            "GET",
+            "tracks",
+            params={"filter[isrc]": list(isrcs)},
+            base_url=self.session.config.openapi_v2_location,
+        )
+        res.raise_for_status()
+        candidates = {}
+        for item in res.json().get("data", []):
+            attributes = item.get("attributes", {})
+            isrc = attributes.get("isrc")
+            if not isrc:
+                continue
+            tags = attributes.get("mediaTags") or []
+            rank = min([QUALITY_TAGS.index(t) for t in tags if t in QUALITY_TAGS] or [len(QUALITY_TAGS)])
+            if isrc not in candidates or rank < candidates[isrc][0]:
+                candidates[isrc] = (rank, int(item["id"]))
+        return {isrc: track_id for isrc, (rank, track_id) in candidates.items()}
 
-        if not tracks:
-            print(f"Not found: {artist} – {title}")
+    def _find_track_id_by_isrc(self, isrc):
+        import tidalapi
+
+        try:
+            tracks = self._call(self.session.get_tracks_by_isrc, isrc)
+        except (tidalapi.exceptions.ObjectNotFound, tidalapi.exceptions.InvalidISRC):
             return None
+        return tracks[0].id if tracks else None
+
+    def find_track_ids_by_isrc(self, isrcs, batch_size=ISRC_BATCH_SIZE):
+        # returns {isrc: tidal track id or None}, resolved in batches
+        found = {}
+        pending = []
+        for isrc in dict.fromkeys(isrcs):
+            if self.match_cache:
+                hit, cached = self.match_cache.get("tidal-isrc", isrc)
+                if hit:
+                    found[isrc] = cached
+                    continue
+            pending.append(isrc)
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i:i + batch_size]
+            failed = set()  # lookup errors, None but not cached as "not found"
+            try:
+                ids = self._call(self._fetch_isrc_batch, batch)
+            except Exception as e:
+                print(f"ISRC batch lookup error, resolving one by one: {e}")
+                ids = {}
+                for isrc in batch:
+                    try:
+                        ids[isrc] = self._find_track_id_by_isrc(isrc)
+                    except Exception as e:
+                        print(f"❌ TIDAL ISRC search error {isrc}: {e}")
+                        failed.add(isrc)
+            for isrc in batch:
+                found[isrc] = ids.get(isrc)
+                if self.match_cache and isrc not in failed:
+                    self.match_cache.put("tidal-isrc", isrc, found[isrc])
+        return found
 
-        # Ordenamos por calidad descendente
-        quality_order = ["LOW", "HIGH", "LOSSLESS", "HI_RES"]
-        quality_score = {q: i for i, q in enumerate(quality_order)}
+    def find_best_quality_track(self, artist, title, source_id=None, duration_ms=None):
+        cache_key = None
+        if self.match_cache:
+            cache_key = self.match_cache.make_key(artist, title, source_id)
+            found, cached = self.match_cache.get("tidal", cache_key)
+            if found:
+                if cached is None:
+                    print(f"Not found (cached): {artist} – {title}")
+                    return None
+                return self._track_from_cache(cached)
+
+        # best artist/title/duration/version match, the highest quality among equally good ones
+        query = track_key(artist, title, duration_ms / 1000 if duration_ms else None)
+        best_track, _ = best_match(query, self._search_candidates(artist, title), self.candidate_key,
+                                   self.quality_rank)
+
+        if not best_track:
+            print(f"Not found: {artist} – {title}")
+            if self.match_cache:
+                self.match_cache.put("tidal", cache_key, None)
+            return None
 
-        best_track = max(tracks, key=lambda t: quality_score.get(t.audio_quality, 0))
         # print(f"🎵 {best_track.artist.name} – {best_track.name} ({best_track.audio_quality})")
+        if self.match_cache:
+            self.match_cache.put("tidal", cache_key, {
+                "id": best_track.id,
+                "name": best_track.name,
+                "artist": best_track.artist.name,
+                "audio_quality": best_track.audio_quality,
+            })
         return best_track
 
     def add_tracks_to_playlist(self, tracks):
@@ -114,16 +343,119 @@ class TidalClient:
             added += 1
         print(f"✅ {added} new tracks added to the playlist.")
 
-    def add_track_to_playlist_by_id(self, playlist, track_id):
-        for track in playlist.tracks():
-            if track.id == track_id:
-                print(f"🔁 Already on the playlist {track.name}")
-                return track.id
-        playlist.add([track_id])
+    def add_track_to_playlist_by_id(self, playlist, track_id, existing_ids=None):
+        # pass existing_ids to avoid walking the whole playlist on every call
+        if existing_ids is None:
+            existing_ids = {track.id for track in self.iter_playlist_tracks(playlist)}
+        if track_id in existing_ids:
+            print(f"🔁 Already on the playlist {track_id}")
+            return track_id
+        self._call(playlist.add, [track_id])
+        existing_ids.add(track_id)
         print(f"🎵 Added to Tidal by: {track_id}")
 
-    def remove_all_tracks_from_playlist(self, playlist):
-        for track in playlist.tracks():
-            playlist.remove_by_id(track.id)
-            print(f"❌ Removed: {track.name}")
+    def add_track_ids_to_playlist(self, playlist, track_ids):
+        # one call, up to 100 ids
+        try:
+            self._call(playlist.add, list(track_ids))
+            return True
+        except Exception as e:
+            print(f"❌ Error adding tracks to playlist: {e}")
+        return False
+
+    @contextmanager
+    def _count_requests(self):
+        # counts HTTP requests made through the tidalapi session while active
+        counter = {"calls": 0}
+
+        def hook(response, *args, **kwargs):
+            counter["calls"] += 1
 
+        hooks = self.session.request_session.hooks["response"]
+        hooks.append(hook)
+        try:
+            yield counter
+        finally:
+            hooks.remove(hook)
+
+    def _estimate_clear_calls(self, num_tracks):
+        # every tidalapi playlist write re-reads the playlist for its ETag (2 calls)
+        return {
+            "indices": 2 * math.ceil(num_tracks / REMOVE_CHUNK_SIZE),
+            "recreate": 2,  # delete + create, the playlist gets a new id
+        }
+
+    def _estimate_add_calls(self, num_tracks):
+        return 2 * math.ceil(num_tracks / ADD_BATCH_SIZE)
+
+    def _clear_by_indices(self, playlist):
+        while playlist.num_tracks:
+            indices = range(min(playlist.num_tracks, REMOVE_CHUNK_SIZE))
+            if not self._call(playlist.remove_by_indices, indices):
+                print(f"❌ Error clearing playlist {playlist.name}")
+                return False
+        return True
+
+    def _recreate_playlist(self, playlist):
+        name, description = playlist.name, playlist.description or ""
+        self._call(playlist.delete)
+        self.playlist_index.remove(playlist)
+        return self._create_playlist(name, description)
+
+    def clear_playlist(self, playlist, strategy="auto"):
+        # returns the playlist to use afterwards, "recreate" changes its id
+        estimates = self._estimate_clear_calls(playlist.num_tracks)
+        if strategy == "auto":
+            strategy = min(("indices", "recreate"), key=lambda s: estimates[s])
+        print(f"Clearing {playlist.num_tracks} tracks, estimated calls: "
+              f"indices {estimates['indices']}, recreate {estimates['recreate']} -> {strategy}")
+        with self._count_requests() as counter:
+            if strategy == "recreate":
+                playlist = self._recreate_playlist(playlist)
+            else:
+                self._clear_by_indices(playlist)
+        print(f"❌ Cleared playlist {playlist.name} with {counter['calls']} API calls")
+        return playlist
+
+    def _add_in_batches(self, playlist, track_ids):
+        for i in range(0, len(track_ids), ADD_BATCH_SIZE):
+            if not self.add_track_ids_to_playlist(playlist, track_ids[i:i + ADD_BATCH_SIZE]):
+                return False
+        return True
+
+    def replace_playlist_tracks(self, playlist, track_ids, strategy="swap"):
+        # swap: fill a new playlist and swap it in under the same name, the old
+        # content stays visible until the new one is complete.
+        # in-place: clear by index ranges and add, keeps the playlist id.
+        track_ids = list(dict.fromkeys(track_ids))
+        add_calls = self._estimate_add_calls(len(track_ids))
+        estimates = {
+            "swap": 1 + add_calls + 2,  # create + adds + delete old + rename
+            "in-place": self._estimate_clear_calls(playlist.num_tracks)["indices"] + add_calls,
+        }
+        print(f"Replacing {playlist.num_tracks} tracks with {len(track_ids)}, estimated calls: "
+              f"swap {estimates['swap']}, in-place {estimates['in-place']} -> {strategy}")
+        with self._count_requests() as counter:
+            if strategy == "in-place":
+                if self._clear_by_indices(playlist):
+                    self._add_in_batches(playlist, track_ids)
+            else:
+                name, description = playlist.name, playlist.description or ""
+                new_playlist = self._call(self.session.user.create_playlist,
+                                          f"{name} (syncing)", description=description)
+                if not self._add_in_batches(new_playlist, track_ids):
+                    self._call(new_playlist.delete)
+                    print(f"❌ Replace of {name} aborted, playlist left untouched")
+                    return playlist
+                self._call(playlist.delete)
+                self.playlist_index.remove(playlist)
+                self._call(new_playlist.edit, title=name, description=description)
+                new_playlist.name = name
+                self.playlist_index.add(new_playlist)
+                playlist = new_playlist
+        print(f"✅ Replaced playlist {playlist.name} with {counter['calls']} API calls")
+        return playlist
+
+    def remove_all_tracks_from_playlist(self, playlist):
+        # kept for callers that need the same playlist id
+        return self.clear_playlist(playlist, strategy="indices")
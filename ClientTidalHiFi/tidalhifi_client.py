@@ -1,13 +1,51 @@
+import re
+import time
 import requests
+from requests.adapters import HTTPAdapter
+
+
+REQUEST_TIMEOUT = 2  # seconds, the API is local
+REQUEST_RETRIES = 1  # on a timeout or a dropped connection, not for /next
+WATCH_INTERVAL = 0.05  # 50 ms between /current polls when watching
+IDLE_INTERVAL = 1  # when tidal-hifi does not answer
 
 
 class TidalHiFiClient:
-    def __init__(self, srv_url):
+    def __init__(self, srv_url, timeout=REQUEST_TIMEOUT, metrics=None, retries=REQUEST_RETRIES):
         self.srv_url = srv_url
+        self.timeout = timeout
+        self.retries = retries
+        self.metrics = metrics  # SyncEngine.metrics.ApiMetrics
+        # one keep-alive connection reused by every call
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+    def _get(self, path, retry=True):
+        # retry: the call is safe to repeat, a second /next would skip a track
+        attempts = 1 + (self.retries if retry else 0)
+        for attempt in range(attempts):
+            try:
+                return self._get_once(path)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == attempts - 1:
+                    raise
+
+    def _get_once(self, path):
+        if not self.metrics:
+            return self.session.get(f"{self.srv_url}{path}", timeout=self.timeout)
+        started = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.srv_url}{path}", timeout=self.timeout)
+        except requests.RequestException as e:
+            self.metrics.observe("tidal-hifi", path, type(e).__name__, time.perf_counter() - started)
+            raise
+        status = "ok" if response.ok else str(response.status_code)
+        self.metrics.observe("tidal-hifi", path, status, time.perf_counter() - started)
+        return response
 
-    def get_current_song_data(self):
+    def get_current_song_data(self, quiet=False):
         try:
-            response = requests.get(f"{self.srv_url}/current")
+            response = self._get("/current")
             response.raise_for_status()
             data = response.json()
 
@@ -16,21 +54,62 @@ class TidalHiFiClient:
             else:
                 return None
         except requests.RequestException as e:
-            print(f"Error getting current song: {e}")
+            if not quiet:
+                print(f"Error getting current song: {e}")
             return None
 
+    @staticmethod
+    def track_id(song_data):
+        # Tidal track id from the url like https://tidal.com/browse/track/94072682?u
+        match = re.search(r'track/(\d+)', song_data.get("url") or "")
+        return match.group(1) if match else None
+
+    @staticmethod
+    def track_key(song_data):
+        # track id, title + artists when the url has none
+        return TidalHiFiClient.track_id(song_data) or f"{song_data.get('title')} - {song_data.get('artists')}"
+
+    def watch_track_changes(self, interval=WATCH_INTERVAL):
+        # tidal-hifi has no push endpoint, so /current is polled over the kept-alive
+        # connection. Yields (detected_at, song_data) as soon as the track changes,
+        # the first yield is the track playing when the watch starts.
+        current_key = None
+        error_reported = False
+        while True:
+            song_data = self.get_current_song_data(quiet=error_reported)
+            detected_at = time.time()
+            if not song_data:
+                error_reported = True
+                time.sleep(IDLE_INTERVAL)
+                continue
+            error_reported = False
+            key = self.track_key(song_data)
+            if key != current_key:
+                current_key = key
+                yield detected_at, song_data
+            time.sleep(interval)
+
     def play(self):
         try:
-            response = requests.get(f"{self.srv_url}/play")
+            response = self._get("/play")
             response.raise_for_status()
             return True
         except requests.RequestException as e:
             print(f"Play error: {e}")
             return False
 
+    def next(self):
+        try:
+            response = self._get("/next", retry=False)
+            response.raise_for_status()
+            return True
+        except requests.RequestException as e:
+            print(f"Next error: {e}")
+            return False
+
     def pause(self):
         try:
-            response = requests.get(f"{self.srv_url}/pause")
+            response = self._get("/pause")
             response.raise_for_status()
             return True
         except requests.RequestException as e:
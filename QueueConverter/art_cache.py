@@ -0,0 +1,152 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import requests
+
+
+DEFAULT_CACHE_DIR = "art-cache"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 3600  # revalidate with the server after a week
+ENCODE_WINDOW = 1800  # seconds a used image is never evicted, a streamed track's flac holds it that long
+FETCH_LOCKS = 16  # URL stripes, one download per cover at a time without serialising the others
+ART_TIMEOUT = 10
+
+
+# Album art cache shared by the recorder and the converter processes.
+# Images are stored once by content hash (sha256), an index maps each URL to
+# its hash plus the ETag/Last-Modified used to revalidate it. The least
+# recently used images are evicted over max_bytes, never one used within the
+# encode window. The index is guarded by a file lock held only to read and
+# write it; downloads take a lock per URL stripe instead, so a cover wanted
+# by several tracks at once is downloaded once and a slow download does not
+# hold up the other workers. A failed revalidation serves the stale copy.
+class ArtCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock_path = os.path.join(cache_dir, ".lock")
+        self.http = requests.Session()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @contextmanager
+    def _flocked(self, path):
+        with open(path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _locked_index(self):
+        with self._flocked(self.lock_path):
+            index = {}
+            if os.path.isfile(self.index_path):
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            yield index
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+
+    def _fetch_lock(self, url):
+        stripe = int(hashlib.sha256(url.encode()).hexdigest(), 16) % FETCH_LOCKS
+        return self._flocked(os.path.join(self.cache_dir, f".fetch-{stripe}.lock"))
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.jpg")
+
+    def _fetch(self, url, entry):
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = self.http.get(url, headers=headers, timeout=ART_TIMEOUT)
+        if response.status_code == 304 and entry:
+            return entry, None
+        response.raise_for_status()
+        digest = hashlib.sha256(response.content).hexdigest()
+        return {
+            "sha256": digest,
+            "size": len(response.content),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }, response.content
+
+    def _cached(self, url, now):
+        # (fresh entry or None, stale entry or None), touching what is there
+        with self._locked_index() as index:
+            entry = index.get(url)
+            if not entry or not os.path.isfile(self._blob_path(entry["sha256"])):
+                return None, None
+            entry["used"] = now  # protected from eviction while it is revalidated or encoded
+            if now - entry["validated"] > self.max_age:
+                return None, dict(entry)
+            return entry, None
+
+    def _store(self, content, digest):
+        path = self._blob_path(digest)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def get(self, url):
+        # local path of the image, downloaded or revalidated when needed
+        now = time.time()
+        fresh, stale = self._cached(url, now)
+        if fresh:
+            return self._blob_path(fresh["sha256"])
+        with self._fetch_lock(url):
+            # another worker may have fetched it while we waited
+            fresh, stale = self._cached(url, now)
+            if fresh:
+                return self._blob_path(fresh["sha256"])
+            try:
+                entry, content = self._fetch(url, stale)
+            except requests.RequestException as e:
+                if not stale:
+                    raise
+                print(f"⚠️ Art revalidation failed, using the cached copy: {e}")
+                return self._blob_path(stale["sha256"])
+            if content is not None:
+                self._store(content, entry["sha256"])
+            with self._locked_index() as index:
+                if not os.path.isfile(self._blob_path(entry["sha256"])):
+                    if content is None:
+                        # 304 for a copy evicted meanwhile, fetch it again next time
+                        index.pop(url, None)
+                        raise FileNotFoundError(self._blob_path(entry["sha256"]))
+                    self._store(content, entry["sha256"])
+                entry["validated"] = now
+                entry["used"] = now
+                index[url] = entry
+                self._evict(index, now)
+                return self._blob_path(entry["sha256"])
+
+    def _evict(self, index, now):
+        # sizes per blob, several URLs may share the same image
+        blobs = {}
+        for entry in index.values():
+            blob = blobs.setdefault(entry["sha256"], {"size": entry["size"], "used": 0})
+            blob["used"] = max(blob["used"], entry["used"])
+        total = sum(blob["size"] for blob in blobs.values())
+        for digest, blob in sorted(blobs.items(), key=lambda item: item[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            if now - blob["used"] < ENCODE_WINDOW:
+                break  # sorted by use, the rest is newer still
+            for url in [u for u, e in index.items() if e["sha256"] == digest]:
+                del index[url]
+            if os.path.isfile(self._blob_path(digest)):
+                os.unlink(self._blob_path(digest))
+            total -= blob["size"]
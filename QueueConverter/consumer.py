@@ -0,0 +1,62 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from QueueConverter.converter import convert_task
+
+
+POLL_TIMEOUT = 0.5
+
+
+# Takes recorded tracks from the TaskQueue and converts them on a process
+# pool sized to the available cores. A task is only taken when a worker is
+# free, so the bounded queue fills up and blocks the recorder when encoding
+# falls behind. task_done()/task_failed() is called once the conversion has
+# finished, so task_queue.join() waits for every pending FLAC.
+class Consumer(threading.Thread):
+    def __init__(self, task_queue, workers=None, convert=convert_task, on_result=None):
+        super().__init__(daemon=True)
+        self.task_queue = task_queue
+        self.workers = workers or os.cpu_count() or 1
+        self.convert = convert
+        self.on_result = on_result  # on_result(task, flac_filename or None on failure)
+        self._free_workers = threading.Semaphore(self.workers)
+        self._stop_event = threading.Event()
+        self._executor = None
+
+    def _on_done(self, task, future):
+        try:
+            try:
+                flac_filename, timings = future.result()
+            except Exception as e:
+                print(f"❌ Conversion error {task.get('tmp_file_name')}: {e}")
+                if self.on_result:
+                    self.on_result(task, None)
+                self.task_queue.task_failed(task)
+                return
+            steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items())
+            print(f"✅ Converted {flac_filename} ({steps})")
+            if self.on_result:
+                self.on_result(task, flac_filename)
+            self.task_queue.task_done(task)
+        finally:
+            self._free_workers.release()
+
+    def run(self):
+        print(f"Converter started with {self.workers} workers")
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            self._executor = executor
+            while not self._stop_event.is_set():
+                if not self._free_workers.acquire(timeout=POLL_TIMEOUT):
+                    continue
+                try:
+                    task = self.task_queue.get_task(timeout=POLL_TIMEOUT)
+                except queue.Empty:
+                    self._free_workers.release()
+                    continue
+                future = executor.submit(self.convert, task)
+                future.add_done_callback(lambda f, task=task: self._on_done(task, f))
+        # leaving the with block waits for running conversions
+
+    def stop(self):
+        self._stop_event.set()
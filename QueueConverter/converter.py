@@ -0,0 +1,79 @@
+import os
+import re
+import shutil
+import subprocess
+import time
+import requests
+from QueueConverter.art_cache import ArtCache, DEFAULT_CACHE_DIR
+from QueueConverter.library_index import TRACK_ID_TAG
+
+
+_art_caches = {}  # one per cache directory and process
+
+
+def safe_filename(name):
+    return re.sub(r'[\\/:*?"<>|]', "-", name or "").strip()
+
+
+def get_art(art_url, cache_dir=DEFAULT_CACHE_DIR):
+    # path of the cover in the shared art cache
+    if cache_dir not in _art_caches:
+        _art_caches[cache_dir] = ArtCache(cache_dir)
+    return _art_caches[cache_dir].get(art_url)
+
+
+def keep_art_file(art_filename, original_filename):
+    # --art-file: a copy of the cover next to the FLAC
+    shutil.copyfile(art_filename, f"{original_filename}.jpg")
+
+
+def flac_command(flac_filename, tags, art_filename=None, raw_format=None):
+    # one flac pass: encode, tag and embed the cover
+    # raw_format (rate, channels, sample_width) reads headerless PCM from stdin
+    cmd = ["flac", "--silent", "--best", "-f", "-o", flac_filename]
+    for key, value in tags.items():
+        if value:
+            cmd += ["-T", f"{key}={value}"]
+    if art_filename:
+        cmd.append(f"--picture={art_filename}")
+    if raw_format:
+        rate, channels, sample_width = raw_format
+        cmd += ["--force-raw-format", "--endian=little", "--sign=signed",
+                f"--channels={channels}", f"--bps={sample_width * 8}", f"--sample-rate={rate}", "-"]
+    return cmd
+
+
+def encode_flac(wav_filename, flac_filename, tags, art_filename=None):
+    subprocess.run(flac_command(flac_filename, tags, art_filename) + [wav_filename], check=True)
+
+
+def convert_task(task):
+    # runs in a worker process, returns the per step timings in seconds
+    timings = {}
+    started = time.perf_counter()
+    original_filename = safe_filename(task["original_file_name"])
+    flac_filename = f"{original_filename}.flac"
+
+    art_filename = None
+    if task.get("art_url"):
+        step = time.perf_counter()
+        try:
+            art_filename = get_art(task["art_url"], task.get("art_cache_dir", DEFAULT_CACHE_DIR))
+        except (requests.RequestException, OSError) as e:
+            print(f"❌ Art download error for {original_filename}: {e}")
+        timings["art"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    encode_flac(task["tmp_file_name"], flac_filename, {
+        "ARTIST": task.get("artist_name"),
+        "TITLE": task.get("track_name"),
+        "ALBUM": task.get("default_album"),
+        TRACK_ID_TAG: task.get("track_id"),
+    }, art_filename)
+    timings["encode"] = time.perf_counter() - step
+
+    os.unlink(task["tmp_file_name"])
+    if art_filename and not task.get("clean_art_file"):
+        keep_art_file(art_filename, original_filename)
+    timings["total"] = time.perf_counter() - started
+    return flac_filename, timings
@@ -0,0 +1,103 @@
+import os
+import struct
+from tinydb import TinyDB
+
+
+TRACK_ID_TAG = "TIDAL_TRACK_ID"
+INDEX_FILENAME = "library_index.json"
+VORBIS_COMMENT = 4
+
+
+def read_flac_tags(path):
+    # Vorbis comments of a FLAC file, keys upper case. Only the metadata
+    # blocks are read, audio frames and the cover are skipped.
+    tags = {}
+    with open(path, "rb") as f:
+        if f.read(4) != b"fLaC":
+            raise ValueError(f"{path} is not a FLAC file")
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                return tags
+            is_last = header[0] & 0x80
+            block_type = header[0] & 0x7F
+            size = int.from_bytes(header[1:], "big")
+            if block_type != VORBIS_COMMENT:
+                f.seek(size, os.SEEK_CUR)
+            else:
+                block = f.read(size)
+                vendor_length, = struct.unpack_from("<I", block, 0)
+                offset = 4 + vendor_length
+                count, = struct.unpack_from("<I", block, offset)
+                offset += 4
+                for _ in range(count):
+                    length, = struct.unpack_from("<I", block, offset)
+                    comment = block[offset + 4:offset + 4 + length].decode("utf-8", "replace")
+                    offset += 4 + length
+                    key, _, value = comment.partition("=")
+                    tags[key.upper()] = value
+                return tags
+            if is_last:
+                return tags
+
+
+# Tidal track id -> FLAC file of the ripped library.
+# The id is read from the TIDAL_TRACK_ID tag the recorder writes, so renamed
+# or moved files are still found. Tags are only read again for files whose
+# size or mtime changed since the last run, the rest comes from a TinyDB
+# sidecar in the library directory.
+class LibraryIndex:
+    def __init__(self, library_dir=".", path=None):
+        self.library_dir = library_dir
+        self.path = path or os.path.join(library_dir, INDEX_FILENAME)
+        self.files = {}  # relative path -> [mtime, size, track id or None]
+        self.ids = {}  # track id -> relative path
+        self._load()
+
+    def _load(self):
+        docs = TinyDB(self.path).all()
+        if docs:
+            self.files = docs[0].get("files", {})
+
+    def _save(self):
+        db = TinyDB(self.path)
+        db.truncate()
+        db.insert({"files": self.files})
+
+    def _scan(self):
+        for root, dirs, names in os.walk(self.library_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".") and d != "art-cache"]
+            for name in names:
+                if name.lower().endswith(".flac") and not name.startswith("tmp-rec-"):
+                    yield os.path.relpath(os.path.join(root, name), self.library_dir)
+
+    def refresh(self):
+        # reads the tags of new or changed files, forgets deleted ones
+        files = {}
+        read = 0
+        for relpath in self._scan():
+            stat = os.stat(os.path.join(self.library_dir, relpath))
+            known = self.files.get(relpath)
+            if known and known[0] == stat.st_mtime and known[1] == stat.st_size:
+                files[relpath] = known
+                continue
+            try:
+                track_id = read_flac_tags(os.path.join(self.library_dir, relpath)).get(TRACK_ID_TAG)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"⚠️ Unreadable FLAC {relpath}: {e}")
+                track_id = None
+            files[relpath] = [stat.st_mtime, stat.st_size, track_id]
+            read += 1
+        self.files = files
+        self.ids = {entry[2]: relpath for relpath, entry in files.items() if entry[2]}
+        self._save()
+        print(f"Library index: {len(self.ids)} tracks, {read} files read")
+        return self
+
+    def find(self, track_id):
+        # relative path of the ripped track, None if it is not in the library
+        return self.ids.get(str(track_id)) if track_id else None
+
+    def add(self, track_id, flac_filename):
+        # recorded in this session, tags are read on the next refresh
+        self.ids[str(track_id)] = os.path.relpath(flac_filename, self.library_dir)
@@ -0,0 +1,112 @@
+import json
+import queue
+import time
+import uuid
+import redis
+
+
+DEFAULT_PREFIX = "tidal2flac"
+DEFAULT_VISIBILITY_TIMEOUT = 600  # seconds a worker may hold a task before it is handed out again
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_MAX_PENDING = 8
+SWEEP_INTERVAL = 5
+
+
+# Durable conversion queue in Redis, drop-in for TaskQueue.
+# get_task moves a task from "pending" to "processing" atomically (BLMOVE) and
+# leases it for visibility_timeout seconds. task_done acks it, task_failed or an
+# expired lease puts it back in "pending" until max_attempts, then it goes to
+# the "dead" list. Tasks only hold file paths, so with several hosts the
+# recordings directory must be shared.
+class RedisTaskQueue:
+    def __init__(self, url=None, client=None, prefix=DEFAULT_PREFIX,
+                 visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.redis = client or redis.Redis.from_url(url, decode_responses=True)
+        self.pending = f"{prefix}:pending"
+        self.processing = f"{prefix}:processing"
+        self.leases = f"{prefix}:leases"
+        self.attempts = f"{prefix}:attempts"
+        self.dead = f"{prefix}:dead"
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self._last_sweep = 0
+
+    def add_task(self, task):
+        # backpressure like the local queue, the recorder waits while too many are pending
+        if self.max_pending:
+            waiting = False
+            while self.redis.llen(self.pending) >= self.max_pending:
+                if not waiting:
+                    print(f"⏳ Conversion queue full ({self.max_pending}), waiting for a worker...")
+                    waiting = True
+                time.sleep(1)
+        payload = json.dumps({"id": str(uuid.uuid4()), "task": task})
+        self.redis.lpush(self.pending, payload)
+
+    def get_task(self, timeout=None):
+        self._sweep()
+        payload = self.redis.blmove(self.pending, self.processing, max(1, int(timeout or 0)), "RIGHT", "LEFT")
+        if payload is None:
+            raise queue.Empty
+        self.redis.zadd(self.leases, {payload: time.time() + self.visibility_timeout})
+        message = json.loads(payload)
+        task = message["task"]
+        task["_queue_payload"] = payload
+        return task
+
+    def _release(self, payload):
+        # True only for the caller that still owned the lease
+        self.redis.lrem(self.processing, 1, payload)
+        return self.redis.zrem(self.leases, payload) == 1
+
+    def task_done(self, task=None):
+        payload = task.pop("_queue_payload", None) if task else None
+        if payload and self._release(payload):
+            self.redis.hdel(self.attempts, json.loads(payload)["id"])
+
+    def task_failed(self, task):
+        payload = task.pop("_queue_payload", None)
+        if payload and self._release(payload):
+            self._retry(payload)
+
+    def _retry(self, payload):
+        message = json.loads(payload)
+        task_id = message["id"]
+        attempts = self.redis.hincrby(self.attempts, task_id, 1)
+        if attempts >= self.max_attempts:
+            self.redis.hdel(self.attempts, task_id)
+            self.redis.lpush(self.dead, payload)
+            print(f"💀 Task {task_id} moved to dead letter list after {attempts} attempts")
+        else:
+            # a new payload per delivery, the late ack of an expired lease must not release this one
+            message["attempt"] = attempts
+            self.redis.rpush(self.pending, json.dumps(message))
+
+    def _sweep(self):
+        # hand out again the tasks whose worker died or hung
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for payload in self.redis.lrange(self.processing, 0, -1):
+            # taken by a worker that died before writing its lease
+            if self.redis.zscore(self.leases, payload) is None:
+                self.redis.zadd(self.leases, {payload: now + self.visibility_timeout}, nx=True)
+        for payload in self.redis.zrangebyscore(self.leases, "-inf", now):
+            if self._release(payload):
+                print("⌛ Task lease expired, requeued")
+                self._retry(payload)
+
+    def join(self, interval=1):
+        while self.redis.llen(self.pending) or self.redis.llen(self.processing):
+            self._sweep()
+            time.sleep(interval)
+
+    def stats(self):
+        return {
+            "pending": self.redis.llen(self.pending),
+            "processing": self.redis.llen(self.processing),
+            "dead": self.redis.llen(self.dead),
+        }
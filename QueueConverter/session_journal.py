@@ -0,0 +1,115 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+
+DEFAULT_JOURNAL_PATH = "tidal2flac-session.jsonl"
+# states of a track, in order
+PLAYING = "playing"  # being captured, the tmp file is incomplete
+RECORDED = "recorded"  # capture finished, task not on the queue yet
+QUEUED = "queued"
+ENCODED = "encoded"
+FAILED = "failed"  # conversion failed, the WAV is still on disk
+DONE_STATES = (RECORDED, QUEUED, ENCODED, FAILED)
+
+
+# Append-only journal of a tidal2flac session, one JSON line per state change
+# of a track. Lines are written by a background thread, so the recording loop
+# only puts them on a queue. On open the previous session is replayed and
+# compacted to the last state of every track, recover() hands back the WAVs
+# that were recorded but never converted and drops the incomplete captures.
+# finish() closes a session that drained cleanly: only the tracks still
+# waiting for a conversion are kept, so the next run resumes just those.
+class SessionJournal:
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.tracks = {}  # track key -> last entry
+        self._load()
+        self._lines = queue.Queue()
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of a crash
+                self.tracks[entry["key"]] = entry
+        # compact, one line per track
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.tracks.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        if self.tracks:
+            print(f"Resuming session: {len(self.tracks)} tracks in {self.path}")
+
+    def _write_loop(self):
+        while True:
+            line = self._lines.get()
+            if line is None:
+                break
+            self._file.write(line)
+            if self._lines.empty():
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def record(self, key, state, **fields):
+        # fields: tmp_file, task, ...
+        entry = dict(self.tracks.get(key, {}), key=key, state=state, at=time.time(), **fields)
+        self.tracks[key] = entry
+        self._lines.put(json.dumps(entry) + "\n")
+
+    def is_done(self, key):
+        entry = self.tracks.get(key)
+        return bool(entry and entry["state"] in DONE_STATES)
+
+    def recover(self, durable_queue=False):
+        # tasks to put back on the queue. With a durable (Redis) queue the queued
+        # and failed tasks are still there, only never queued ones come back.
+        states = (RECORDED,) if durable_queue else (RECORDED, QUEUED, FAILED)
+        tasks = []
+        known = set()
+        for key, entry in list(self.tracks.items()):
+            tmp_file = entry.get("tmp_file")
+            known.add(tmp_file)
+            if not tmp_file or not os.path.isfile(tmp_file):
+                continue
+            if entry["state"] == PLAYING:
+                print(f"🗑️ Dropping incomplete recording {tmp_file}")
+                os.unlink(tmp_file)
+                del self.tracks[key]  # recorded again when it plays
+            elif entry["state"] in states and entry.get("task"):
+                tasks.append(entry["task"])
+        for tmp_file in glob.glob("tmp-rec-*.wav"):
+            if tmp_file not in known:
+                print(f"⚠️ {tmp_file} is not in the session journal, left on disk")
+        return tasks
+
+    def close(self):
+        self._lines.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def finish(self):
+        # clean exit after the queue drained: encoded and dropped tracks are
+        # forgotten, the journal is removed when nothing is left to resume
+        self.close()
+        pending = [entry for entry in self.tracks.values() if entry["state"] not in (ENCODED, PLAYING)]
+        if not pending:
+            os.unlink(self.path)
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in pending:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        print(f"📒 {len(pending)} tracks still waiting for conversion, kept in {self.path}")
@@ -0,0 +1,28 @@
+import queue
+
+
+DEFAULT_MAX_PENDING = 8  # recorded WAVs waiting for a worker before the recorder blocks
+
+
+class TaskQueue:
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING):
+        # bounded, add_task blocks when the converters fall behind
+        self.q = queue.Queue(maxsize=max_pending)
+
+    def add_task(self, task):
+        if self.q.full():
+            print(f"⏳ Conversion queue full ({self.q.maxsize}), waiting for a worker...")
+        self.q.put(task)
+
+    def get_task(self, timeout=None):
+        return self.q.get(timeout=timeout)
+
+    def task_done(self, task=None):
+        self.q.task_done()
+
+    def task_failed(self, task):
+        # nothing to retry from memory, the WAV stays on disk
+        self.q.task_done()
+
+    def join(self):
+        self.q.join()
@@ -0,0 +1,57 @@
+import re
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+# Transport adapter serving the GET requests matching a rule from an HttpCache
+# (SyncEngine.http_cache): fresh entries without a request, stale ones
+# revalidated, a 304 answered with the stored body.
+class CachingAdapter(HTTPAdapter):
+    def __init__(self, cache, rules, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.rules = [(re.compile(pattern), ttl) for pattern, ttl in rules]
+
+    def _ttl(self, url):
+        for pattern, ttl in self.rules:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def _cached_response(self, request, entry, body):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response._content = body
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def send(self, request, **kwargs):
+        ttl = self._ttl(request.url) if request.method == "GET" else None
+        if ttl is None:
+            return super().send(request, **kwargs)
+        entry, body = self.cache.get(request.url)
+        if entry is not None:
+            if time.time() - entry["stored"] < entry["ttl"]:
+                self.cache.count("hits")
+                return self._cached_response(request, entry, body)
+            if "ETag" in entry["headers"]:
+                request.headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                request.headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.cache.touch(request.url)
+            self.cache.count("revalidated")
+            return self._cached_response(request, entry, body)
+        self.cache.count("misses")
+        if response.status_code == 200:
+            self.cache.put(request.url, response, ttl)
+        return response
@@ -0,0 +1,131 @@
+import hmac
+import json
+import re
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+JOB_PATH = re.compile(r"^/jobs/(\d+)(/run|/cancel)?$")
+
+
+# Local HTTP control of a JobScheduler, JSON in and out:
+#   GET  /status           jobs by state, plus whatever status() returns (caches, metrics)
+#   GET  /jobs             every job
+#   GET  /jobs/<id>        one job
+#   POST /jobs/<id>/run    run it now, {"priority": n} optional
+#   POST /jobs/<id>/cancel or DELETE /jobs/<id>
+#   POST /shutdown         same as SIGTERM: drain and exit
+# Bound to localhost. Every request needs "Authorization: Bearer <token>"
+# (the given token, or a random one per start) and a localhost Host header,
+# so neither other users' web pages nor DNS rebinding can reach it.
+class ControlServer:
+    def __init__(self, scheduler, host=DEFAULT_HOST, port=DEFAULT_PORT, status=None, on_shutdown=None,
+                 token=None):
+        self.scheduler = scheduler
+        self.token = token or secrets.token_urlsafe(24)
+        self.status = status or dict
+        self.on_shutdown = on_shutdown
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _authorized(self, headers):
+        host = (headers.get("Host") or "").rsplit(":", 1)[0].strip("[]")
+        if host not in ("127.0.0.1", "localhost", "::1", self._server.server_address[0]):
+            return False
+        scheme, _, token = (headers.get("Authorization") or "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), self.token.encode())
+
+    def _summary(self):
+        jobs = self.scheduler.jobs()
+        states = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        return {"jobs": len(jobs), "states": states, **self.status()}
+
+    def _handle(self, method, path, body):
+        # (status code, payload)
+        if method == "GET" and path == "/status":
+            return 200, self._summary()
+        if method == "GET" and path == "/jobs":
+            return 200, [job.to_dict() for job in self.scheduler.jobs()]
+        if method == "POST" and path == "/shutdown" and self.on_shutdown:
+            self.on_shutdown()
+            return 202, {"shutdown": True}
+        match = JOB_PATH.match(path)
+        if not match:
+            return 404, {"error": f"unknown path {path}"}
+        job_id, action = int(match.group(1)), match.group(2)
+        if method == "GET" and not action:
+            job = self.scheduler.get(job_id)
+        elif method == "POST" and action == "/run":
+            job = self.scheduler.trigger(job_id, body.get("priority"))
+        elif (method == "POST" and action == "/cancel") or (method == "DELETE" and not action):
+            job = self.scheduler.cancel(job_id)
+        else:
+            return 405, {"error": f"{method} not allowed on {path}"}
+        if job is None:
+            return 404, {"error": f"no job {job_id}"}
+        return (202 if method != "GET" else 200), job.to_dict()
+
+    def _handler(self):
+        control = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, method):
+                if not control._authorized(self.headers):
+                    self._send(401, {"error": "missing or wrong bearer token"})
+                    return
+                body = {}
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    try:
+                        body = json.loads(self.rfile.read(length))
+                    except ValueError:
+                        self._send(400, {"error": "invalid JSON body"})
+                        return
+                try:
+                    code, payload = control._handle(method, self.path.split("?")[0].rstrip("/") or "/", body)
+                except Exception as e:
+                    code, payload = 500, {"error": str(e)}
+                self._send(code, payload)
+
+            def _send(self, code, payload):
+                data = json.dumps(payload, default=str).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                if code == 401:
+                    self.send_header("WWW-Authenticate", "Bearer")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def do_DELETE(self):
+                self._respond("DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
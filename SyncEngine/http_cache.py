@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_DIR = "http-cache"
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_SEARCH_TTL = 24 * 3600  # search results are served without asking for a day
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+# On-disk cache of GET responses, shared by the Spotify and Tidal sessions.
+# Only URLs matching a client's rules are cached, each rule with its own TTL:
+# within the TTL the stored body is served without a request, after it the
+# request is sent with If-None-Match / If-Modified-Since and a 304 serves the
+# stored body again. TTL 0 (playlists) always revalidates. Bodies are files
+# named by the hash of the URL, the least recently used go first over max_bytes.
+class HttpCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.hits = 0
+        self.revalidated = 0  # 304, body served from the cache
+        self.misses = 0
+        self.evicted = 0
+        self._entries = OrderedDict()  # url -> entry
+        self._size = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Loading HTTP cache error: {e}")
+            return
+        for url, entry in entries:
+            if os.path.isfile(self._body_path(url)):
+                self._entries[url] = entry
+                self._size += entry["size"]
+
+    def save(self):
+        # one save at a time, they share the tmp file; requests only wait for the copy
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = list(self._entries.items())
+                self._dirty = False
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.index_path)
+
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def get(self, url):
+        # (entry, body) or (None, None)
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None, None
+            self._entries.move_to_end(url)
+        try:
+            with open(self._body_path(url), "rb") as f:
+                return entry, f.read()
+        except OSError:
+            return None, None
+
+    def put(self, url, response, ttl):
+        headers = {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers}
+        if ttl <= 0 and "ETag" not in headers and "Last-Modified" not in headers:
+            return  # could never be served
+        body = response.content
+        tmp_path = f"{self._body_path(url)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, self._body_path(url))
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous:
+                self._size -= previous["size"]
+            self._entries[url] = {"stored": time.time(), "ttl": ttl, "size": len(body), "headers": headers}
+            self._size += len(body)
+            self._dirty = True
+            evicted = self._evict()
+        for old_url in evicted:
+            if os.path.isfile(self._body_path(old_url)):
+                os.unlink(self._body_path(old_url))
+
+    def touch(self, url):
+        # revalidated, fresh again for its TTL
+        with self._lock:
+            if url in self._entries:
+                self._entries[url]["stored"] = time.time()
+                self._dirty = True
+
+    def _evict(self):
+        # called with the lock held, returns the evicted urls
+        evicted = []
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            url, entry = self._entries.popitem(last=False)
+            self._size -= entry["size"]
+            evicted.append(url)
+        self.evicted += len(evicted)
+        return evicted
+
+    def count(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def install(self, session, rules):
+        # rules: [(url regex, ttl seconds)], the session keeps its retry settings
+        from SyncEngine.caching_adapter import CachingAdapter  # requests only when a client connects
+
+        current = session.get_adapter("https://")
+        session.mount("https://", CachingAdapter(self, rules, max_retries=current.max_retries))
+
+    def stats(self):
+        return (f"HTTP cache: {self.hits} hits, {self.revalidated} revalidated (304), {self.misses} misses, "
+                f"{len(self._entries)} entries, {self._size / 1024 / 1024:.1f} MB, {self.evicted} evicted")
@@ -0,0 +1,210 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+DEFAULT_INTERVAL = 3600  # seconds between two runs of a job
+DEFAULT_JITTER = 0.1  # share of the interval, spreads jobs added together
+DEFAULT_PRIORITY = 10  # lower runs first when several jobs are due
+DEFAULT_JOB_WORKERS = 2
+SCHEDULED, QUEUED, RUNNING, CANCELLED = "scheduled", "queued", "running", "cancelled"
+
+
+class Job:
+    def __init__(self, job_id, key, name, run, interval, priority, jitter):
+        self.id = job_id
+        self.key = key  # jobs with the same key are one job
+        self.name = name
+        self.run = run  # called with no arguments, returns a summary or raises
+        self.interval = interval
+        self.priority = priority
+        self.jitter = jitter
+        self.state = SCHEDULED
+        self.due = None
+        self.generation = 0  # heap entries of older generations are stale
+        self.rerun = False  # triggered while running, runs again right after
+        self.cancelled = False
+        self.runs = 0
+        self.failures = 0
+        self.last_started = None
+        self.last_finished = None
+        self.last_seconds = None
+        self.last_result = None
+        self.last_error = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "interval": self.interval,
+            "priority": self.priority,
+            "due_in": round(self.due - time.time(), 1) if self.due and self.state == SCHEDULED else None,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_started": self.last_started,
+            "last_finished": self.last_finished,
+            "last_seconds": self.last_seconds,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+
+# Runs jobs every interval (with jitter) on a few worker threads. Due jobs
+# wait in a priority queue, the lowest priority value first. Adding a job
+# with a key already scheduled updates that job, triggering a queued job
+# does nothing and triggering a running one runs it once more after it
+# ends, so bursts of requests coalesce. stop() lets the running jobs finish.
+class JobScheduler:
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, seed=None):
+        self.workers = max(1, workers)
+        self._random = random.Random(seed)
+        self._jobs = {}  # id -> Job
+        self._by_key = {}
+        self._timers = []  # (due, seq, id, generation)
+        self._ready = []  # (priority, due, seq, id, generation)
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+
+    def _push(self, job, due):
+        # called with the lock held
+        job.generation += 1
+        job.due = due
+        job.state = SCHEDULED
+        heapq.heappush(self._timers, (due, next(self._seq), job.id, job.generation))
+        self._cond.notify()
+
+    def _next_due(self, job, now):
+        spread = job.interval * job.jitter
+        return now + max(1.0, job.interval + self._random.uniform(-spread, spread))
+
+    def add(self, key, run, interval=DEFAULT_INTERVAL, priority=DEFAULT_PRIORITY, name=None,
+            jitter=DEFAULT_JITTER, start_now=True):
+        with self._cond:
+            job = self._by_key.get(key)
+            if job:
+                job.run, job.interval, job.priority, job.jitter = run, interval, priority, jitter
+                return job
+            job = Job(next(self._ids), key, name or str(key), run, interval, priority, jitter)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+            # the first runs spread over a jitter window, not all at once
+            now = time.time()
+            self._push(job, now + self._random.uniform(0, interval * jitter) if start_now else self._next_due(job, now))
+            return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def trigger(self, job_id, priority=None):
+        # run as soon as a worker is free
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.cancelled:
+                return None
+            if job.state == RUNNING:
+                job.rerun = True
+            elif job.state == SCHEDULED:
+                if priority is not None:
+                    job.priority = priority
+                self._push(job, time.time())
+            return job
+
+    def cancel(self, job_id):
+        # a running job finishes, it is not scheduled again
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job or job.cancelled:
+                return job
+            job.cancelled = True
+            job.rerun = False
+            job.generation += 1  # drops its scheduled and queued entries
+            if job.state != RUNNING:
+                job.state = CANCELLED
+            self._by_key.pop(job.key, None)
+            return job
+
+    def _take(self):
+        # next due job by priority, waits until one is due; None when stopping
+        with self._cond:
+            while not self._stopping:
+                now = time.time()
+                while self._timers and self._timers[0][0] <= now:
+                    due, seq, job_id, generation = heapq.heappop(self._timers)
+                    job = self._jobs[job_id]
+                    if generation == job.generation and job.state == SCHEDULED:
+                        job.state = QUEUED
+                        heapq.heappush(self._ready, (job.priority, due, seq, job_id, generation))
+                while self._ready:
+                    _, _, _, job_id, generation = heapq.heappop(self._ready)
+                    job = self._jobs[job_id]
+                    if generation == job.generation and job.state == QUEUED:
+                        job.state = RUNNING
+                        job.last_started = time.time()
+                        return job
+                timeout = self._timers[0][0] - now if self._timers else None
+                self._cond.wait(timeout)
+            return None
+
+    def _finish(self, job, result, error, started):
+        with self._cond:
+            job.runs += 1
+            job.last_finished = time.time()
+            job.last_seconds = round(time.perf_counter() - started, 3)
+            job.last_result = result
+            job.last_error = error
+            if error:
+                job.failures += 1
+            if job.cancelled:
+                job.state = CANCELLED
+            elif job.rerun:
+                job.rerun = False
+                self._push(job, time.time())
+            else:
+                self._push(job, self._next_due(job, time.time()))
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            started = time.perf_counter()
+            result = error = None
+            try:
+                result = job.run()
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                print(f"❌ Job {job.name} failed: {error}")
+            self._finish(job, result, error, started)
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def running(self):
+        with self._cond:
+            return [job for job in self._jobs.values() if job.state == RUNNING]
+
+    def stop(self, drain_timeout=None):
+        # no new runs; waits for the running ones, True when all of them finished
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        deadline = time.time() + drain_timeout if drain_timeout is not None else None
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.time()))
+        return not any(thread.is_alive() for thread in self._threads)
@@ -0,0 +1,88 @@
+import json
+import os
+import re
+from collections import namedtuple
+
+
+DIRECTIONS = ("S", "T", "B")
+DEFAULT_CONCURRENCY = 4  # playlist pairs synced at the same time
+
+# interval and priority are read by the sync daemon only
+SyncPair = namedtuple("SyncPair", ["spotify_playlist_id", "tidal_playlist_name", "direction", "full",
+                                   "interval", "priority"], defaults=(None, None))
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def spotify_playlist_uri(value):
+    # playlist id, spotify:playlist: URI or open.spotify.com URL
+    value = str(value).strip()
+    match = re.search(r'playlist[/:]([a-zA-Z0-9]+)', value)
+    if match:
+        return f"spotify:playlist:{match.group(1)}"
+    if re.fullmatch(r'[a-zA-Z0-9]+', value):
+        return f"spotify:playlist:{value}"
+    return None
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ManifestError("YAML manifests need PyYAML (pip install pyyaml), or use a .json manifest")
+        try:
+            return yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            raise ManifestError(f"cannot parse {path}: {e}")
+    return json.loads(content)
+
+
+def _pair(entry, defaults, position):
+    if not isinstance(entry, dict):
+        raise ManifestError(f"pair {position}: expected a mapping, got {entry!r}")
+    entry = {**defaults, **entry}
+    spotify = entry.get("spotify") or entry.get("url")
+    spotify_playlist_id = spotify_playlist_uri(spotify) if spotify else None
+    if not spotify_playlist_id:
+        raise ManifestError(f"pair {position}: missing or invalid spotify playlist {spotify!r}")
+    tidal_playlist_name = entry.get("tidal")
+    if not tidal_playlist_name:
+        raise ManifestError(f"pair {position}: missing tidal playlist name")
+    direction = str(entry.get("dir", "B")).upper()
+    if direction not in DIRECTIONS:
+        raise ManifestError(f"pair {position}: invalid direction {direction}, must be T, S or B")
+    try:
+        interval = int(entry["interval"]) if entry.get("interval") is not None else None
+        priority = int(entry["priority"]) if entry.get("priority") is not None else None
+    except (TypeError, ValueError):
+        raise ManifestError(f"pair {position}: interval and priority must be whole numbers")
+    return SyncPair(spotify_playlist_id, str(tidal_playlist_name), direction, bool(entry.get("full", False)),
+                    interval, priority)
+
+
+def load_manifest(path):
+    # A list of pairs, or {"defaults": {...}, "pairs": [...]}. Every pair has
+    # spotify (id, URI or URL) or url, tidal (playlist name), optional dir and full,
+    # and for the daemon interval (seconds) and priority (lower first).
+    try:
+        data = _read(path)
+    except ManifestError:
+        raise
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"cannot read {path}: {e}")
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = data.get("defaults") or {}
+        data = data.get("pairs")
+    if not isinstance(data, list) or not data:
+        raise ManifestError(f"{path}: no playlist pairs")
+    pairs = [_pair(entry, defaults, i + 1) for i, entry in enumerate(data)]
+    unique = list(dict.fromkeys(pairs))
+    if len(unique) < len(pairs):
+        print(f"⚠️ {len(pairs) - len(unique)} duplicate pairs in {path} ignored")
+    return unique
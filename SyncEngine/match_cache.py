@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_TTL = 30 * 24 * 3600  # 30 days for found tracks
+DEFAULT_NEGATIVE_TTL = 24 * 3600  # 1 day for "not found", catalogs change
+DEFAULT_MAX_ENTRIES = 50000
+
+
+# On-disk cache of cross-service track matches.
+# Entries are stored per service ("tidal", "spotify") under a key built from the
+# source track id or from the normalized (artist, title). A None value records a
+# "not found" and expires sooner. Least recently used entries are evicted first.
+class MatchCache:
+    def __init__(self, path, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def make_key(artist=None, title=None, source_id=None):
+        if source_id:
+            return f"id:{source_id}"
+        return f"{(artist or '').strip().lower()}|{(title or '').strip().lower()}"
+
+    def _load(self):
+        if not self.path or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Loading match cache error: {e}")
+            return
+        now = time.time()
+        for full_key, entry in data.get("entries", []):
+            if entry["expires"] > now:
+                self._entries[full_key] = entry
+
+    def save(self):
+        if not self.path:
+            return
+        # one save at a time, they share the tmp file; lookups only wait for the copy
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {"entries": list(self._entries.items())}
+                self._dirty = False
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def get(self, service, key):
+        # returns (found, value), found is False on a miss or an expired entry
+        full_key = f"{service}:{key}"
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if entry["expires"] <= time.time():
+                del self._entries[full_key]
+                self._dirty = True
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(full_key)
+            self.hits += 1
+            return True, entry["value"]
+
+    def put(self, service, key, value):
+        full_key = f"{service}:{key}"
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            self._entries[full_key] = {"value": value, "expires": time.time() + ttl}
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def stats(self):
+        return f"Match cache: {self.hits} hits, {self.misses} misses, {len(self._entries)} entries"
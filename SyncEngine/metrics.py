@@ -0,0 +1,155 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from SyncEngine.rate_limiter import _http_status
+
+
+# seconds, upper bounds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+DEFAULT_EXPORT_INTERVAL = 60
+PROFILE_TOP = 25
+
+
+def _status(exc):
+    status = _http_status(exc)
+    return str(status) if status is not None else type(exc).__name__
+
+
+# Counters and latency histograms of every outbound API call, labeled by
+# service, endpoint and status ("ok", the HTTP status or the exception name).
+# Shared by all clients and threads, one lock and a few dict updates per call.
+# Exported as a Prometheus textfile (.prom) or JSON, at the end of a run or
+# every interval from a background thread in the long running loops.
+class ApiMetrics:
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._calls = {}  # (service, endpoint, status) -> count
+        self._latency = {}  # (service, endpoint) -> [bucket counts, sum, count]
+        self._exporter = None
+
+    def observe(self, service, endpoint, status, seconds):
+        with self._lock:
+            key = (service, endpoint, status)
+            self._calls[key] = self._calls.get(key, 0) + 1
+            histogram = self._latency.get((service, endpoint))
+            if histogram is None:
+                histogram = self._latency[(service, endpoint)] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def wrap(self, service, fn, endpoint=None):
+        # fn timed on every call, rate limiter retries are observed one by one
+        endpoint = endpoint or getattr(fn, "__name__", "call").lstrip("_")
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.observe(service, endpoint, _status(e), time.perf_counter() - started)
+                raise
+            self.observe(service, endpoint, "ok", time.perf_counter() - started)
+            return result
+
+        return timed
+
+    def snapshot(self):
+        with self._lock:
+            calls = dict(self._calls)
+            latency = {key: (list(buckets), total, count) for key, (buckets, total, count) in self._latency.items()}
+        return calls, latency
+
+    def to_dict(self):
+        calls, latency = self.snapshot()
+        endpoints = {}
+        for (service, endpoint, status), count in calls.items():
+            entry = endpoints.setdefault(f"{service}.{endpoint}", {"calls": {}})
+            entry["calls"][status] = count
+        for (service, endpoint), (buckets, total, count) in latency.items():
+            entry = endpoints.setdefault(f"{service}.{endpoint}", {"calls": {}})
+            entry["seconds_total"] = round(total, 6)
+            entry["seconds_mean"] = round(total / count, 6) if count else 0
+            entry["buckets"] = {("+Inf" if b == float("inf") else str(b)): n for b, n in zip(BUCKETS, buckets)}
+        return {"started": self.started, "exported": time.time(), "endpoints": endpoints}
+
+    def to_prometheus(self):
+        calls, latency = self.snapshot()
+        lines = ["# HELP api_calls_total Outbound API calls by endpoint and status",
+                 "# TYPE api_calls_total counter"]
+        for (service, endpoint, status), count in sorted(calls.items()):
+            lines.append(f'api_calls_total{{service="{service}",endpoint="{endpoint}",status="{status}"}} {count}')
+        lines += ["# HELP api_call_seconds Outbound API call latency",
+                  "# TYPE api_call_seconds histogram"]
+        for (service, endpoint), (buckets, total, count) in sorted(latency.items()):
+            labels = f'service="{service}",endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else bound
+                lines.append(f'api_call_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"api_call_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"api_call_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        # .prom for the node_exporter textfile collector, JSON otherwise
+        if path.endswith(".prom"):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def start_export(self, path, interval=DEFAULT_EXPORT_INTERVAL):
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.export(path)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        self._exporter = (stop, thread, path)
+
+    def stop_export(self):
+        # last export with the final numbers
+        if self._exporter:
+            stop, thread, path = self._exporter
+            stop.set()
+            thread.join()
+            self._exporter = None
+            self.export(path)
+
+    def summary(self):
+        calls, latency = self.snapshot()
+        lines = []
+        for (service, endpoint), (buckets, total, count) in sorted(latency.items()):
+            failed = sum(n for (s, e, status), n in calls.items() if (s, e) == (service, endpoint) and status != "ok")
+            lines.append(f"{service}.{endpoint}: {count} calls, {failed} failed, {1000 * total / count:.1f} ms mean")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiled(path=None, top=PROFILE_TOP):
+    # cProfile around a block, prints the top functions and saves the stats for snakeviz/pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+            print(f"Profile written to {path}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_PAGE_SIZE = 100
+
+
+def iter_pages(fetch_page, page_size=DEFAULT_PAGE_SIZE):
+    # fetch_page(offset, limit) -> list of items, a short page ends the iteration.
+    # The next page is requested in background while the caller consumes the current one.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        offset = 0
+        future = executor.submit(fetch_page, offset, page_size)
+        while future is not None:
+            page = future.result()
+            offset += page_size
+            if len(page) >= page_size:
+                future = executor.submit(fetch_page, offset, page_size)
+            else:
+                future = None
+            yield page
+
+
+def iter_items(fetch_page, page_size=DEFAULT_PAGE_SIZE):
+    for page in iter_pages(fetch_page, page_size):
+        yield from page
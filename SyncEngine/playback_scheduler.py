@@ -0,0 +1,29 @@
+DEFAULT_MIN_WAIT = 5  # seconds
+DEFAULT_MAX_WAIT = 300
+END_MARGIN = 2  # wake up just after the expected track end
+
+
+# Decides how long daily-mix-sync sleeps between polls.
+# While playing it wakes just after the current track should end, while
+# nothing plays the wait doubles from idle_wait up to max_wait.
+class PlaybackScheduler:
+    def __init__(self, idle_wait=30, min_wait=DEFAULT_MIN_WAIT, max_wait=DEFAULT_MAX_WAIT,
+                 end_margin=END_MARGIN):
+        self.idle_wait = idle_wait
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.end_margin = end_margin
+        self._idle_polls = 0
+
+    def _clamp(self, seconds):
+        return max(self.min_wait, min(self.max_wait, seconds))
+
+    def next_wait(self, state):
+        if state and state.is_playing and state.track and state.track.duration_ms:
+            self._idle_polls = 0
+            remaining_ms = state.track.duration_ms - state.progress_ms
+            return self._clamp(remaining_ms / 1000 + self.end_margin)
+        wait = self.idle_wait * (2 ** self._idle_polls)
+        if wait < self.max_wait:
+            self._idle_polls += 1
+        return self._clamp(wait)
@@ -0,0 +1,90 @@
+import threading
+import time
+from fractions import Fraction
+from ratelimit import limits, sleep_and_retry
+
+
+MAX_RETRIES = 5
+DEFAULT_BACKOFF = 1.0  # seconds, doubled on every 429 without Retry-After
+MAX_BACKOFF = 60.0
+
+
+def _http_status(exc):
+    status = getattr(exc, "http_status", None)  # spotipy.SpotifyException
+    if status is None and getattr(exc, "response", None) is not None:  # requests.HTTPError
+        status = exc.response.status_code
+    return status
+
+
+def _retry_after(exc):
+    headers = getattr(exc, "headers", None)
+    if headers is None and getattr(exc, "response", None) is not None:
+        headers = exc.response.headers
+    if not headers:
+        return None
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Per-service limiter shared by every thread talking to that service.
+# The steady rate is enforced with ratelimit, a 429 pauses all callers until
+# Retry-After (or an exponential backoff when the header is missing).
+class RateLimiter:
+    def __init__(self, name, calls_per_second, max_retries=MAX_RETRIES):
+        self.name = name
+        self.max_retries = max_retries
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self._backoff = DEFAULT_BACKOFF
+
+        # as calls over a period, 0.5/s is 1 call every 2 s and 2.5/s 5 calls every 2 s
+        rate = Fraction(calls_per_second).limit_denominator(100)
+        if rate <= 0:
+            raise ValueError(f"{name} rate must be positive, got {calls_per_second}")
+
+        @sleep_and_retry
+        @limits(calls=rate.numerator, period=rate.denominator)
+        def _acquire():
+            pass
+
+        self._acquire = _acquire
+
+    def _wait_if_blocked(self):
+        with self._lock:
+            delay = self._blocked_until - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _block(self, retry_after):
+        with self._lock:
+            if retry_after is None:
+                retry_after = self._backoff
+                self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+            self._blocked_until = max(self._blocked_until, time.time() + retry_after)
+            self.throttled += 1
+        print(f"⏳ {self.name} rate limited, backing off {retry_after:.1f}s")
+
+    def _reset_backoff(self):
+        with self._lock:
+            self._backoff = DEFAULT_BACKOFF
+
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            self._wait_if_blocked()
+            self._acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if _http_status(e) != 429 or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._block(_retry_after(e))
+                continue
+            if attempt:
+                self._reset_backoff()
+            return result
@@ -0,0 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_WORKERS = 8
+
+
+# Runs searches on a bounded thread pool, results come back in input order.
+# Throughput is capped by the clients' rate limiters, not by the pool size.
+class SearchPipeline:
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = max(1, workers)
+
+    def map(self, search, items):
+        items = list(items)
+        if self.workers == 1 or len(items) <= 1:
+            return [search(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(search, items))
@@ -0,0 +1,42 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+# import it before anything else, the first phase measures the other imports
+IMPORTED_AT = time.perf_counter()
+
+
+# Where a short run spends its time before the first sync call: imports,
+# config, argument parsing and the lazy client logins, printed with --timing.
+# mark() closes a phase of the main thread, phase() times a block (a client
+# built on first use, possibly from a worker thread).
+class StartupTimer:
+    def __init__(self, started=IMPORTED_AT):
+        self.started = started
+        self.phases = []  # (name, seconds)
+        self._checkpoint = started
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((name, now - self._checkpoint))
+            self._checkpoint = now
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            with self._lock:
+                self.phases.append((name, now - started))
+                self._checkpoint = max(self._checkpoint, now)
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        lines = [f"⏱️ Startup and run timing ({total:.3f}s since the imports):"]
+        lines += [f"   {name:<24} {seconds * 1000:8.1f} ms" for name, seconds in self.phases]
+        return "\n".join(lines)
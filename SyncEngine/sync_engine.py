@@ -0,0 +1,266 @@
+import time
+from SyncEngine.search_pipeline import SearchPipeline
+from SyncEngine import sync_state
+
+
+BATCH_SIZE = 100  # max ids per add call on both services
+MATCH_MODES = ("isrc", "text")
+
+
+def track_key(artist, title):
+    return f"{(artist or '').strip().lower()}|{(title or '').strip().lower()}"
+
+
+# Loads each playlist once, diffs both sides by id and by normalized
+# (artist, title), searches only what is missing on the other side and
+# applies the additions in batches.
+# With a SyncStateStore a side whose version did not change since the last
+# sync is not read again, and only the tracks added on one side (or removed
+# from the other) since then are searched.
+class SyncEngine:
+    def __init__(self, spotify_client, tidal_client, batch_size=BATCH_SIZE, pipeline=None,
+                 match_mode="isrc", state=None):
+        self.spotify = spotify_client
+        self.tidal = tidal_client
+        self.batch_size = batch_size
+        self.pipeline = pipeline or SearchPipeline()
+        self.match_mode = match_mode
+        self.state = state
+
+    def load_spotify(self, spotify_playlist_id):
+        return list(self.spotify.iter_playlist_tracks(spotify_playlist_id))
+
+    def load_tidal(self, tidal_playlist):
+        if not tidal_playlist:
+            return []
+        return list(self.tidal.iter_playlist_tracks(tidal_playlist))
+
+    def plan(self, spotify_tracks, tidal_tracks, direction):
+        spotify_keys = {track_key(t.artist, t.title) for t in spotify_tracks}
+        tidal_keys = {track_key(t.artist.name, t.name) for t in tidal_tracks}
+        plan = {"to_tidal": [], "to_spotify": []}
+        if direction in ("S", "B"):
+            plan["to_tidal"] = [t for t in spotify_tracks
+                                if track_key(t.artist, t.title) not in tidal_keys]
+        if direction in ("T", "B"):
+            plan["to_spotify"] = [t for t in tidal_tracks
+                                  if track_key(t.artist.name, t.name) not in spotify_keys]
+        return plan
+
+    def _delta(self, plan, previous):
+        # only tracks new on the source side, or gone from the target side, since the last sync,
+        # and the ones not found last time: the match cache decides when they are searched again
+        previous_spotify_keys = {track_key(artist, title) for artist, title, _ in previous["spotify"].values()}
+        previous_tidal_keys = {track_key(artist, title) for artist, title, _ in previous["tidal"].values()}
+        not_found = previous.get("not_found") or {}
+        retry_tidal = set(not_found.get("to_tidal", ()))
+        retry_spotify = set(not_found.get("to_spotify", ()))
+        delta = {
+            "to_tidal": [t for t in plan["to_tidal"]
+                         if t.id not in previous["spotify"] or t.id in retry_tidal
+                         or track_key(t.artist, t.title) in previous_tidal_keys],
+            "to_spotify": [t for t in plan["to_spotify"]
+                           if str(t.id) not in previous["tidal"] or str(t.id) in retry_spotify
+                           or track_key(t.artist.name, t.name) in previous_spotify_keys],
+        }
+        skipped = sum(len(plan[side]) - len(delta[side]) for side in plan)
+        if skipped:
+            print(f"⏭️ {skipped} tracks unchanged since the last sync, not searched again")
+        return delta
+
+    def _search_tidal(self, spotify_track):
+        try:
+            tidal_track = self.tidal.find_best_quality_track(spotify_track.artist, spotify_track.title,
+                                                             source_id=spotify_track.id,
+                                                             duration_ms=spotify_track.duration_ms)
+        except Exception as e:
+            print(f"❌ TIDAL search error {spotify_track.artist} – {spotify_track.title}: {e}")
+            return None
+        return tidal_track.id if tidal_track else None
+
+    def _search_spotify(self, tidal_track):
+        try:
+            # full_name carries the version ("Remastered 2011"), the ranking scores it
+            duration = getattr(tidal_track, "duration", None)
+            spotify_track = self.spotify.search_track(tidal_track.artist.name,
+                                                      getattr(tidal_track, "full_name", tidal_track.name),
+                                                      source_id=tidal_track.id,
+                                                      duration_ms=duration * 1000 if duration else None)
+        except Exception as e:
+            print(f"❌ SPOTIFY search error {tidal_track.artist.name} – {tidal_track.name}: {e}")
+            return None
+        return spotify_track["id"] if spotify_track else None
+
+    def _spotify_ids_by_isrc(self, isrcs):
+        isrcs = list(dict.fromkeys(isrcs))
+        return dict(zip(isrcs, self.pipeline.map(self._search_spotify_isrc, isrcs)))
+
+    def _search_spotify_isrc(self, isrc):
+        try:
+            return self.spotify.search_isrc(isrc)
+        except Exception as e:
+            print(f"❌ SPOTIFY ISRC search error {isrc}: {e}")
+            return None
+
+    def _match(self, missing, search, ids_by_isrc):
+        # ISRC first, resolved in bulk, text search for the rest
+        found_ids = [None] * len(missing)
+        stats = {"isrc_tried": 0, "isrc_hits": 0, "text_tried": 0, "text_hits": 0}
+        text_indexes = list(range(len(missing)))
+        if self.match_mode == "isrc":
+            isrcs = {i: getattr(t, "isrc", None) for i, t in enumerate(missing)}
+            isrcs = {i: isrc for i, isrc in isrcs.items() if isrc}
+            resolved = ids_by_isrc(isrcs.values()) if isrcs else {}
+            stats["isrc_tried"] = len(isrcs)
+            for i, isrc in isrcs.items():
+                found_ids[i] = resolved.get(isrc)
+            stats["isrc_hits"] = sum(1 for i in isrcs if found_ids[i])
+            text_indexes = [i for i in text_indexes if not found_ids[i]]
+
+        # searches run concurrently, results keep the playlist order
+        text_ids = self.pipeline.map(search, [missing[i] for i in text_indexes])
+        for i, track_id in zip(text_indexes, text_ids):
+            found_ids[i] = track_id
+        stats["text_tried"] = len(text_indexes)
+        stats["text_hits"] = sum(1 for track_id in text_ids if track_id)
+        return found_ids, stats
+
+    def _resolve(self, missing, found_ids, existing_ids, describe, sources=None):
+        # sources: filled with track id -> source track of every id to add
+        to_add = []
+        not_found = []
+        already_present = 0
+        for track, track_id in zip(missing, found_ids):
+            if not track_id:
+                print(f"❌ Not found: {describe(track)}")
+                not_found.append(track)
+            elif track_id in existing_ids:
+                # same track under a different name on the other side
+                already_present += 1
+            else:
+                existing_ids.add(track_id)
+                to_add.append(track_id)
+                if sources is not None:
+                    sources[track_id] = track
+        return to_add, not_found, already_present
+
+    def _apply(self, add_batch, track_ids):
+        added = 0
+        calls = 0
+        for i in range(0, len(track_ids), self.batch_size):
+            batch = track_ids[i:i + self.batch_size]
+            calls += 1
+            if add_batch(batch):
+                added += len(batch)
+        return added, calls
+
+    def _report(self, label, missing, to_add, not_found, already_present, added, calls, stats):
+        print(f"📋 Plan {label}: {len(missing)} missing, {len(to_add)} to add, "
+              f"{already_present} already present by id, {len(not_found)} not found")
+        for path in ("isrc", "text"):
+            tried = stats[f"{path}_tried"]
+            if tried:
+                hits = stats[f"{path}_hits"]
+                print(f"🔎 {label} {path} match: {hits}/{tried} ({100 * hits / tried:.1f}%)")
+        print(f"✅ Applied {label}: {added}/{len(to_add)} added in {calls} add calls")
+        return {
+            **stats,
+            "missing": len(missing),
+            "planned": len(to_add),
+            "already_present": already_present,
+            "not_found": len(not_found),
+            "added": added,
+            "add_calls": calls,
+        }
+
+    def sync(self, tidal_playlist_name, spotify_playlist_id, direction="B", full=False):
+        # full: ignore the sync state and compare everything
+        if direction == "T":
+            tidal_playlist = self.tidal.get_playlist(tidal_playlist_name)
+            if not tidal_playlist:
+                print(f"❌ Tidal playlist {tidal_playlist_name} not found")
+                return None
+        else:
+            current_time = time.strftime("%Y-%m-%d %H:%M:%S")
+            tidal_playlist = self.tidal._get_or_create_playlist(
+                tidal_playlist_name, description=f"Created from Spotify {current_time}")
+
+        key = sync_state.pair_key(spotify_playlist_id, tidal_playlist_name, direction)
+        previous = None
+        spotify_snapshot = tidal_version = None
+        if self.state:
+            # one metadata call per side decides what has to be read
+            previous = None if full else self.state.get(key)
+            spotify_snapshot = self.spotify.get_playlist_snapshot(spotify_playlist_id)
+            tidal_version = self.tidal.get_playlist_version(tidal_playlist)
+        spotify_unchanged = bool(previous and previous["spotify_snapshot"] == spotify_snapshot)
+        tidal_unchanged = bool(previous and tidal_version and previous["tidal_version"] == tidal_version)
+        # tracks not found last time are looked up again, through the match cache
+        retry_not_found = bool(previous and any((previous.get("not_found") or {}).values()))
+        if spotify_unchanged and tidal_unchanged and not retry_not_found:
+            print(f"✅ {tidal_playlist_name} and {spotify_playlist_id} unchanged since the last sync")
+            return {}
+
+        # load each side once, an unchanged side comes from the sync state
+        if spotify_unchanged:
+            spotify_tracks = sync_state.spotify_tracks(previous["spotify"])
+        else:
+            spotify_tracks = self.load_spotify(spotify_playlist_id)
+        if tidal_unchanged:
+            tidal_tracks = sync_state.tidal_tracks(previous["tidal"])
+        else:
+            tidal_tracks = self.load_tidal(tidal_playlist)
+        print(f"🎶 Spotify playlist has {len(spotify_tracks)} tracks, "
+              f"Tidal playlist {tidal_playlist_name} has {len(tidal_tracks)} tracks")
+        spotify_ids = {t.id for t in spotify_tracks}
+        tidal_ids = {t.id for t in tidal_tracks}
+
+        plan = self.plan(spotify_tracks, tidal_tracks, direction)
+        if previous:
+            plan = self._delta(plan, previous)
+        summary = {}
+        added_to_tidal = {}  # tidal id -> spotify track it was found for
+        added_to_spotify = {}
+        complete = True
+        not_found_ids = {}
+        if direction in ("S", "B"):
+            missing = plan["to_tidal"]
+            found_ids, stats = self._match(missing, self._search_tidal, self.tidal.find_track_ids_by_isrc)
+            to_add, not_found, already_present = self._resolve(
+                missing, found_ids, tidal_ids, lambda t: f"{t.artist} – {t.title} on TIDAL", added_to_tidal)
+            added, calls = self._apply(
+                lambda batch: self.tidal.add_track_ids_to_playlist(tidal_playlist, batch), to_add)
+            complete = complete and added == len(to_add)
+            not_found_ids["to_tidal"] = [t.id for t in not_found]
+            summary["to_tidal"] = self._report("Spotify -> Tidal", missing, to_add, not_found,
+                                               already_present, added, calls, stats)
+        if direction in ("T", "B"):
+            missing = plan["to_spotify"]
+            found_ids, stats = self._match(missing, self._search_spotify, self._spotify_ids_by_isrc)
+            to_add, not_found, already_present = self._resolve(
+                missing, found_ids, spotify_ids, lambda t: f"{t.artist.name} – {t.name} on SPOTIFY",
+                added_to_spotify)
+            added, calls = self._apply(
+                lambda batch: self.spotify.add_track_ids_to_playlist(spotify_playlist_id, batch), to_add)
+            complete = complete and added == len(to_add)
+            not_found_ids["to_spotify"] = [str(t.id) for t in not_found]
+            summary["to_spotify"] = self._report("Tidal -> Spotify", missing, to_add, not_found,
+                                                 already_present, added, calls, stats)
+
+        if self.state:
+            spotify_records = sync_state.spotify_records(spotify_tracks)
+            tidal_records = sync_state.tidal_records(tidal_tracks)
+            # what we added is stored under the source names, so it matches on the next run
+            for track_id, source in added_to_spotify.items():
+                spotify_records[track_id] = [source.artist.name, source.name, getattr(source, "isrc", None)]
+            for track_id, source in added_to_tidal.items():
+                tidal_records[str(track_id)] = [source.artist, source.title, source.isrc]
+            if added_to_spotify:
+                spotify_snapshot = self.spotify.get_playlist_snapshot(spotify_playlist_id)
+            if added_to_tidal:
+                tidal_version = self.tidal.get_playlist_version(tidal_playlist)  # re-read by every add
+            if not complete:
+                # a failed add, read both sides again next time
+                spotify_snapshot = tidal_version = None
+            self.state.put(key, spotify_snapshot, tidal_version, spotify_records, tidal_records, not_found_ids)
+        return summary
@@ -0,0 +1,57 @@
+import threading
+from types import SimpleNamespace
+from tinydb import TinyDB, Query
+from ClientSpotify.spotify_client import SpotifyTrack
+
+
+def pair_key(spotify_playlist_id, tidal_playlist_name, direction):
+    return f"{spotify_playlist_id}|{tidal_playlist_name}|{direction}"
+
+
+def spotify_records(tracks):
+    return {t.id: [t.artist, t.title, t.isrc] for t in tracks}
+
+
+def tidal_records(tracks):
+    return {str(t.id): [t.artist.name, t.name, getattr(t, "isrc", None)] for t in tracks}
+
+
+def spotify_tracks(records):
+    return [SpotifyTrack(id=track_id, uri=f"spotify:track:{track_id}", artist=artist, title=title,
+                         isrc=isrc, duration_ms=None)
+            for track_id, (artist, title, isrc) in records.items()]
+
+
+def tidal_tracks(records):
+    # same attributes the engine reads from tidalapi tracks
+    return [SimpleNamespace(id=int(track_id), name=title, isrc=isrc, artist=SimpleNamespace(name=artist))
+            for track_id, (artist, title, isrc) in records.items()]
+
+
+# Last seen state of every synced playlist pair, persisted in a TinyDB file:
+# the Spotify snapshot_id, the Tidal version (last updated + track count) and
+# the tracks of both sides as {id: [artist, title, isrc]} and the source ids
+# a search found nothing for, per direction. A side whose version did not
+# change is not read again. TinyDB is not thread safe, the
+# store is shared by concurrent syncs behind one lock.
+class SyncStateStore:
+    def __init__(self, path):
+        self.db = TinyDB(path)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            docs = self.db.search(Query().pair == key)
+        return docs[0] if docs else None
+
+    def put(self, key, spotify_snapshot, tidal_version, spotify, tidal, not_found=None):
+        # not_found: {"to_tidal": [spotify ids], "to_spotify": [tidal ids]}
+        with self._lock:
+            self.db.upsert({
+                "pair": key,
+                "spotify_snapshot": spotify_snapshot,
+                "tidal_version": tidal_version,
+                "spotify": spotify,
+                "tidal": tidal,
+                "not_found": not_found or {},
+            }, Query().pair == key)
@@ -0,0 +1,139 @@
+import re
+import unicodedata
+from collections import namedtuple
+from difflib import SequenceMatcher
+
+
+SEARCH_LIMIT = 10  # Spotify candidates fetched by one search, ranked locally (Tidal has its own)
+MIN_SCORE = 0.6  # below it no candidate is the track we look for
+MIN_ARTIST = 0.5  # same title by somebody else is a cover, not a match
+MIN_TITLE = 0.6  # another song of the same artist
+TITLE_WEIGHT = 0.5
+ARTIST_WEIGHT = 0.35
+DURATION_WEIGHT = 0.15
+DURATION_TOLERANCE = 3  # seconds, tagging and encoder differences
+DURATION_MAX_DELTA = 30  # seconds, from there on the duration does not count at all
+MARKER_PENALTY = 0.15  # per version marker on one side only
+
+# looked up in the version part only ("(Live at ...)", "- Remastered 2011",
+# Tidal's version field), so "Live Forever" is not a live version
+VERSION_MARKERS = {
+    "remaster": re.compile(r"\bremaster"),
+    "live": re.compile(r"\b(live|unplugged|in concert)\b"),
+    "remix": re.compile(r"\b(remix|rmx|mix|dub)\b"),
+    "acoustic": re.compile(r"\bacoustic\b"),
+    "instrumental": re.compile(r"\binstrumental\b"),
+    "edit": re.compile(r"\bedit\b"),
+    "extended": re.compile(r"\bextended\b"),
+    "demo": re.compile(r"\bdemo\b"),
+    "karaoke": re.compile(r"\b(karaoke|originally performed)\b"),
+    "cover": re.compile(r"\b(cover|tribute)\b"),
+}
+FEAT = re.compile(r"\s*[\(\[]?\s*\b(feat|ft|featuring)\b\.?[^\)\]]*[\)\]]?", re.IGNORECASE)
+BRACKETED = re.compile(r"\s*[\(\[][^\)\]]*[\)\]]")
+DASH_SUFFIX = re.compile(r"\s+-\s+(.*)$")
+
+TrackKey = namedtuple("TrackKey", ["artists", "title", "markers", "duration"])
+
+
+def normalize(text):
+    # casefolded words in any script: accents, punctuation and "&" / "and" differences removed
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = text.replace("&", " and ").replace("'", "").replace("’", "")
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+
+def _split_title(title):
+    # (base title, version part)
+    title = FEAT.sub("", title or "")
+    version = " ".join(BRACKETED.findall(title))
+    title = BRACKETED.sub("", title)
+    suffix = DASH_SUFFIX.search(title)
+    if suffix:
+        version += " " + suffix.group(1)
+        title = title[:suffix.start()]
+    return title, version
+
+
+def search_title(title):
+    # the title sent to the search, without featured artists and version, those are ranked locally
+    return _split_title(title)[0].strip() or title
+
+
+def version_markers(version):
+    version = normalize(version)
+    return frozenset(marker for marker, pattern in VERSION_MARKERS.items() if pattern.search(version))
+
+
+def track_key(artists, title, duration=None, version=None):
+    # artists: a name or a list of names, duration in seconds.
+    # Computed once per track, candidates are scored against it.
+    if isinstance(artists, str):
+        artists = [artists]
+    base, version_part = _split_title(title)
+    normalized_title = normalize(base) or normalize(title)
+    markers = version_markers(f"{version_part} {version or ''}")
+    # an artist or title that normalizes to nothing stays empty and matches nothing
+    normalized_artists = tuple(a for a in (normalize(a) for a in artists) if a)
+    return TrackKey(normalized_artists, normalized_title, markers, duration)
+
+
+def _similarity(a, b):
+    # characters and whole words, "lost song" is not "another song"
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    a_words, b_words = a.split(), b.split()
+    common = len(set(a_words) & set(b_words))
+    words = 2 * common / (len(a_words) + len(b_words))
+    return (SequenceMatcher(None, a, b).ratio() + words) / 2
+
+
+def _artist_similarity(query_artists, candidate_artists):
+    # best pair, "simon and garfunkel" also matches a candidate listing both
+    best = 0.0
+    for a in query_artists:
+        for b in candidate_artists:
+            best = max(best, 1.0 if a == b or f" {b} " in f" {a} " else _similarity(a, b))
+    return best
+
+
+def _duration_score(query, candidate):
+    if not query or not candidate:
+        return 0.5  # unknown, neither helps nor hurts
+    delta = abs(query - candidate)
+    if delta <= DURATION_TOLERANCE:
+        return 1.0
+    return max(0.0, 1 - (delta - DURATION_TOLERANCE) / (DURATION_MAX_DELTA - DURATION_TOLERANCE))
+
+
+def score(query, candidate):
+    # 0..1, None when the artist or the title is a different one or unknown
+    if not query.title or not candidate.title:
+        return None
+    artist = _artist_similarity(query.artists, candidate.artists)
+    if artist < MIN_ARTIST:
+        return None
+    title = _similarity(query.title, candidate.title)
+    if title < MIN_TITLE:
+        return None
+    total = (TITLE_WEIGHT * title + ARTIST_WEIGHT * artist
+             + DURATION_WEIGHT * _duration_score(query.duration, candidate.duration))
+    total -= MARKER_PENALTY * len(query.markers ^ candidate.markers)
+    return total if total >= MIN_SCORE else None
+
+
+def best_match(query, candidates, key, quality=None):
+    # highest score, quality(candidate) only breaks ties; (candidate, score) or (None, None)
+    best = None
+    best_rank = None
+    for candidate in candidates:
+        candidate_score = score(query, key(candidate))
+        if candidate_score is None:
+            continue
+        rank = (round(candidate_score, 2), quality(candidate) if quality else 0)
+        if best_rank is None or rank > best_rank:
+            best, best_rank = candidate, rank
+    return (best, best_rank[0]) if best is not None else (None, None)
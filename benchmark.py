@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from Benchmark.scenarios import SCENARIOS, run
+from Benchmark.matching import load_fixtures
+from SyncEngine.search_pipeline import DEFAULT_WORKERS
+
+
+REPORT_COLUMNS = ("scenario", "tracks", "wall_s", "calls", "calls_per_track", "throttled", "peak_rss_mb")
+COMPARED = ("wall_s", "calls_per_track", "peak_rss_mb", "wrong_matches")  # lower is better
+MIN_WALL_DELTA = 0.1  # seconds, shorter differences are noise
+
+
+def print_report(results):
+    print(" ".join(f"{c:>15}" for c in REPORT_COLUMNS))
+    for result in results:
+        print(" ".join(f"{str(result.get(c, '-')):>15}" for c in REPORT_COLUMNS))
+        extra = {k: v for k, v in result.items() if k not in REPORT_COLUMNS and k != "endpoints"}
+        print(f"{'':>15} {extra}")
+
+
+def compare(results, baseline, tolerance):
+    # regressions against a previous --json report
+    previous = {(r["scenario"], r["tracks"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["scenario"], result["tracks"]))
+        if not before:
+            continue
+        for metric in COMPARED:
+            if metric not in before or result.get(metric, 0) <= before[metric] * (1 + tolerance):
+                continue
+            if metric == "wall_s" and result[metric] - before[metric] < MIN_WALL_DELTA:
+                continue
+            regressions.append(f"{result['scenario']} {result['tracks']} tracks: "
+                               f"{metric} {before[metric]} -> {result[metric]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against fake Spotify, Tidal and tidal-hifi backends")
+    parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS),
+                        help=f"Comma separated, from {', '.join(SCENARIOS)} (default all)")
+    parser.add_argument("--sizes", type=str, default="100,1000,10000",
+                        help="Playlist sizes for sync and daily (default 100,1000,10000, up to 50000)")
+    parser.add_argument("--recorder-tracks", type=int, default=12, help="Tracks played to the recorder (default 12)")
+    parser.add_argument("--track-seconds", type=float, default=1.0,
+                        help="Length of every track played to the recorder (default 1)")
+    parser.add_argument("--poll", type=float, default=0.05, help="Recorder /current poll interval (default 0.05)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every fake API call (default 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 429 (default 0)")
+    parser.add_argument("--retry-after", type=float, default=0.0, help="Retry-After of the injected 429s (default 0)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Concurrent searches (default {DEFAULT_WORKERS})")
+    parser.add_argument("--rate", type=float, default=100000,
+                        help="Rate limiter calls per second, the real scripts use 5-10 (default 100000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=str, help="Write the report to this file")
+    parser.add_argument("--baseline", type=str, help="Previous --json report, exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed growth over the baseline before it counts as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    options = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "retry_after": args.retry_after,
+        "workers": args.workers,
+        "rate": args.rate,
+        "seed": args.seed,
+        "track_seconds": args.track_seconds,
+        "poll": args.poll,
+    }
+    runs = []
+    for scenario in args.scenarios.split(","):
+        if scenario not in SCENARIOS:
+            print(f"Unknown scenario {scenario}, must be one of {', '.join(SCENARIOS)}")
+            exit(1)
+        if scenario == "recorder":
+            sizes = [args.recorder_tracks]
+        elif scenario == "matching":
+            sizes = [len(load_fixtures())]  # the whole labelled set
+        else:
+            sizes = [int(s) for s in args.sizes.split(",")]
+        runs += [(scenario, size) for size in sizes]
+
+    results = []
+    # one fresh process per run, peak memory does not carry over
+    context = multiprocessing.get_context("spawn")
+    for scenario, size in runs:
+        print(f"Running {scenario} with {size} tracks...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(run, scenario, size, options).result())
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Report written to {args.json}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regression {regression}")
+        if regressions:
+            exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import argparse
+import time
+from QueueConverter.redis_queue import RedisTaskQueue
+from QueueConverter.consumer import Consumer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FLAC conversion worker draining the tidal2flac Redis queue")
+    parser.add_argument("--redis", type=str, default="redis://127.0.0.1:6379/0", help="Redis url")
+    parser.add_argument("--workers", type=int, help="Conversion processes (default: number of cores)")
+    parser.add_argument("--visibility-timeout", type=int, default=600,
+                        help="Seconds before a task held by a dead worker is handed out again")
+    args = parser.parse_args()
+
+    task_queue = RedisTaskQueue(args.redis, visibility_timeout=args.visibility_timeout)
+    consumer = Consumer(task_queue, workers=args.workers)
+    consumer.start()
+    print(f"Worker draining {args.redis}, Ctrl+C to stop")
+    try:
+        while consumer.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("User interruption. Finishing running conversions...")
+    consumer.stop()
+    consumer.join()
+    print(task_queue.stats())
+
+
+if __name__ == "__main__":
+    main()
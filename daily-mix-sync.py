@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
+from SyncEngine.startup_timing import StartupTimer  # first, --timing measures the other imports
 import configparser
 import argparse
 from ClientSpotify.spotify_client import SpotifyClient
-from ClientTidal.tidal_client import TidalClient
+from ClientTidal.tidal_client import TidalClient, CLEAR_STRATEGIES
+from SyncEngine.match_cache import MatchCache
+from SyncEngine.playback_scheduler import PlaybackScheduler, DEFAULT_MAX_WAIT
+from SyncEngine.metrics import ApiMetrics, DEFAULT_EXPORT_INTERVAL
+from SyncEngine.http_cache import HttpCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
 import time
 
 
@@ -10,6 +15,10 @@ SPOTIFY_CLIENT_ID = None
 SPOTIFY_CLIENT_SECRET = None
 SPOTIFY_REDIRECT_URI = None
 TIDAL_DB_SESSION_PATH = None
+TIDAL_PLAYLIST_INDEX_PATH = None
+MATCH_CACHE_PATH = None
+HTTP_CACHE_DIR = None
+HTTP_CACHE_MAX_BYTES = None
 
 try:
     config = configparser.ConfigParser()
@@ -18,12 +27,60 @@ try:
     SPOTIFY_CLIENT_SECRET = config.get("spotify", "client_secret")
     SPOTIFY_REDIRECT_URI = config.get("spotify", "redirect_uri")
     TIDAL_DB_SESSION_PATH = config.get("tidal", "db_session_path")
+    TIDAL_PLAYLIST_INDEX_PATH = config.get("tidal", "playlist_index_path", fallback="tidal_playlists.json")
+    MATCH_CACHE_PATH = config.get("cache", "match_cache_path", fallback="match_cache.json")
+    HTTP_CACHE_DIR = config.get("cache", "http_cache_dir", fallback=DEFAULT_CACHE_DIR)
+    HTTP_CACHE_MAX_BYTES = config.getint("cache", "http_cache_max_mb", fallback=DEFAULT_MAX_BYTES // 1024 // 1024) * 1024 * 1024
 except Exception as e:
     print(f"Error on load config file: {e}")
     exit(1)
 
 
+def sync_track(tidal, tidal_playlist, tidal_playlist_ids, spotify_track):
+    artist, title = spotify_track.artist, spotify_track.title
+    print(f"Searching for TIDAL best quality: {artist} – {title}")
+    tidal_track = tidal.find_best_quality_track(artist, title, source_id=spotify_track.id,
+                                                duration_ms=spotify_track.duration_ms)
+    if tidal_track:
+        print(
+            f"✅ Found on TIDAL: {tidal_track.artist.name} – {tidal_track.name}  - Quality: {tidal_track.audio_quality}"
+        )
+        # add to playlist
+        tidal.add_track_to_playlist_by_id(tidal_playlist, tidal_track.id, tidal_playlist_ids)
+    else:
+        print(
+            f"❌ No found on TIDAL: {artist} – {title}"
+        )
+
+
+def poll_once(spotify, tidal, tidal_playlist, tidal_playlist_ids, processed_ids, after_ms):
+    # one pass of the loop, returns the playback state for the scheduler
+    # backfill tracks that started and finished between two polls
+    for spotify_track in spotify.get_recently_played(after_ms=after_ms):
+        if spotify_track.id not in processed_ids:
+            print(f"⏪ Played on Spotify: {spotify_track.artist} – {spotify_track.title}")
+            sync_track(tidal, tidal_playlist, tidal_playlist_ids, spotify_track)
+            processed_ids.add(spotify_track.id)
+
+    # Get the current song from Spotify
+    state = spotify.get_playback_state()
+    if state and state.is_playing and state.track:
+        spotify_track = state.track
+        print(f"🎶 Playing on Spotify: {spotify_track.artist} – {spotify_track.title}")
+        # search for the track in Tidal
+        if spotify_track.id in processed_ids:
+            print("Track already processed, waiting...")
+        else:
+            sync_track(tidal, tidal_playlist, tidal_playlist_ids, spotify_track)
+            processed_ids.add(spotify_track.id)
+    else:
+        print("❌ No track Spotify playing")
+    return state
+
+
 def main():
+    timer = StartupTimer()
+    timer.mark("imports and config")
     # receive arguments opcionally nombre del playlist
     delete_playlist_content = True
     refresh_time = 30
@@ -33,9 +90,21 @@ def main():
     parser.add_argument(
         "--no-clear", action="store_true", help="Clean Tidal playlist before adding new tracks"
     )
-    parser.add_argument("--refresh", type=int, help="Refresh time")
+    parser.add_argument("--clear-mode", type=str, choices=CLEAR_STRATEGIES, default="auto",
+                        help="indices: remove by index ranges, recreate: delete and create the playlist "
+                             "again (new id), auto: cheapest of both (default)")
+    parser.add_argument("--refresh", type=int, help="Refresh time while nothing is playing, doubles up to --max-wait")
+    parser.add_argument("--max-wait", type=int, default=DEFAULT_MAX_WAIT,
+                        help=f"Max seconds between polls (default {DEFAULT_MAX_WAIT})")
+    parser.add_argument("--timing", action="store_true",
+                        help="Print how long the imports, the config, the client logins and the run took")
+    parser.add_argument("--metrics", type=str,
+                        help="Write API call counts and latencies to this file, .prom (Prometheus textfile) or .json")
+    parser.add_argument("--metrics-interval", type=int, default=DEFAULT_EXPORT_INTERVAL,
+                        help=f"Seconds between metrics exports (default {DEFAULT_EXPORT_INTERVAL})")
 
     args = parser.parse_args()
+    timer.mark("arguments")
 
     # Check if the playlist name is provided
     if args.playlist:
@@ -49,14 +118,27 @@ def main():
         refresh_time = args.refresh
         print(f"Param: Refresh on {refresh_time} seconds")
 
-    # initialize clients
+    match_cache = MatchCache(MATCH_CACHE_PATH)
+    metrics = None
+    if args.metrics:
+        metrics = ApiMetrics()
+        metrics.start_export(args.metrics, args.metrics_interval)
+    http_cache = HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES)
+    # initialize clients, they log in on first use
     spotify = SpotifyClient(
         client_id=SPOTIFY_CLIENT_ID,
         client_secret=SPOTIFY_CLIENT_SECRET,
         redirect_uri=SPOTIFY_REDIRECT_URI,
+        match_cache=match_cache,
+        metrics=metrics,
+        http_cache=http_cache,
+        timer=timer,
     )
     #
-    tidal = TidalClient(session_path=TIDAL_DB_SESSION_PATH)
+    tidal = TidalClient(session_path=TIDAL_DB_SESSION_PATH, match_cache=match_cache,
+                        playlist_index_path=TIDAL_PLAYLIST_INDEX_PATH, metrics=metrics,
+                        http_cache=http_cache, timer=timer)
+    timer.mark("caches and clients")
     description = "From Spotify Daily Mix"
     print(f"Trying creating list on TIDAL: {tidal_playlist_name}")
     tidal_playlist = tidal._get_or_create_playlist(tidal_playlist_name, description)
@@ -65,39 +147,38 @@ def main():
         exit(1)
     if tidal_playlist and delete_playlist_content:
         print(f"Cleaning TIDAL playlist: {tidal_playlist.name}")
-        tidal.remove_all_tracks_from_playlist(tidal_playlist)
-    local_current_song = ""
-    local_previous_song = ""
-    while True:
-        # Get the current song from Spotify
-        spotify_current_song = spotify.get_current_playing_track()
-
-        if spotify_current_song:
-            artist, title = spotify_current_song
-            local_current_song = f"{artist}-{title}".encode("utf-8")
-            print(f"🎶 Playing on Spotify: {artist} – {title}")
-            # search for the track in Tidal
-            if local_current_song == local_previous_song:
-                print("Track already processed, waiting...")
-            else:
-                print(f"Searching for TIDAL best quality: {artist} – {title}")
-                tidal_track = tidal.find_best_quality_track(artist, title)
-                if tidal_track:
-                    print(
-                        f"✅ Found on TIDAL: {tidal_track.artist.name} – {tidal_track.name}  - Quality: {tidal_track.audio_quality}"
-                    )
-                    # add to playlist
-                    tidal.add_track_to_playlist_by_id(tidal_playlist, tidal_track.id)
-                else:
-                    print(
-                        f"❌ No found on TIDAL: {artist} – {title}"
-                    )
-                # update previous song
-                local_previous_song = local_current_song
-        else:
-            print("❌ No track Spotify playing")
-        # Wait for a while before checking again
-        time.sleep(refresh_time)  # Check every minute
+        tidal_playlist = tidal.clear_playlist(tidal_playlist, strategy=args.clear_mode)
+    # read the playlist once, then keep the id set up to date locally
+    tidal_playlist_ids = set()
+    if not delete_playlist_content:
+        tidal_playlist_ids = {t.id for t in tidal.iter_playlist_tracks(tidal_playlist)}
+    timer.mark("tidal playlist")
+    scheduler = PlaybackScheduler(idle_wait=refresh_time, max_wait=args.max_wait)
+    processed_ids = set()
+    last_poll_ms = int(time.time() * 1000)
+    try:
+        while True:
+            poll_ms = int(time.time() * 1000)
+            state = poll_once(spotify, tidal, tidal_playlist, tidal_playlist_ids, processed_ids, last_poll_ms)
+            last_poll_ms = poll_ms
+            match_cache.save()
+            http_cache.save()
+            if args.timing and timer:
+                timer.mark("first poll")
+                print(timer.report())
+                timer = None
+            # Wait until the current track should end, or back off while idle
+            wait = scheduler.next_wait(state)
+            print(f"Next check in {wait:.0f} seconds")
+            time.sleep(wait)
+    except KeyboardInterrupt:
+        print("User interruption. Exiting...")
+    match_cache.save()
+    http_cache.save()
+    print(http_cache.stats())
+    if metrics:
+        metrics.stop_export()
+        print(metrics.summary())
 
 
 if __name__ == "__main__":
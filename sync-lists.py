@@ -1,8 +1,23 @@
 # -*- coding: utf-8 -*-
+from SyncEngine.startup_timing import StartupTimer  # first, --timing measures the other imports
 import configparser
 import argparse
 from ClientSpotify.spotify_client import SpotifyClient
 from ClientTidal.tidal_client import TidalClient
+from SyncEngine.match_cache import MatchCache
+from SyncEngine.sync_state import SyncStateStore
+from SyncEngine.sync_engine import SyncEngine, MATCH_MODES
+from SyncEngine.rate_limiter import RateLimiter
+from SyncEngine.search_pipeline import SearchPipeline, DEFAULT_WORKERS
+from SyncEngine.metrics import ApiMetrics, profiled
+from SyncEngine.http_cache import HttpCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from SyncEngine.manifest import load_manifest, ManifestError, DEFAULT_CONCURRENCY
+from SyncEngine.job_scheduler import JobScheduler, DEFAULT_INTERVAL, DEFAULT_JITTER, DEFAULT_PRIORITY
+from SyncEngine.control_api import ControlServer, DEFAULT_PORT
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext, ExitStack
+import signal
+import threading
 import time
 import re
 
@@ -11,6 +26,12 @@ SPOTIFY_CLIENT_ID = None
 SPOTIFY_CLIENT_SECRET = None
 SPOTIFY_REDIRECT_URI = None
 TIDAL_DB_SESSION_PATH = None
+TIDAL_PLAYLIST_INDEX_PATH = None
+MATCH_CACHE_PATH = None
+SYNC_STATE_PATH = None
+HTTP_CACHE_DIR = None
+HTTP_CACHE_MAX_BYTES = None
+DAEMON_API_TOKEN = None
 
 try:
     config = configparser.ConfigParser()
@@ -19,6 +40,12 @@ try:
     SPOTIFY_CLIENT_SECRET = config.get("spotify", "client_secret")
     SPOTIFY_REDIRECT_URI = config.get("spotify", "redirect_uri")
     TIDAL_DB_SESSION_PATH = config.get("tidal", "db_session_path")
+    TIDAL_PLAYLIST_INDEX_PATH = config.get("tidal", "playlist_index_path", fallback="tidal_playlists.json")
+    MATCH_CACHE_PATH = config.get("cache", "match_cache_path", fallback="match_cache.json")
+    SYNC_STATE_PATH = config.get("cache", "sync_state_path", fallback="sync_state.json")
+    HTTP_CACHE_DIR = config.get("cache", "http_cache_dir", fallback=DEFAULT_CACHE_DIR)
+    HTTP_CACHE_MAX_BYTES = config.getint("cache", "http_cache_max_mb", fallback=DEFAULT_MAX_BYTES // 1024 // 1024) * 1024 * 1024
+    DAEMON_API_TOKEN = config.get("daemon", "api_token", fallback=None)
 except Exception as e:
     print(f"Error on load config file: {e}")
     exit(1)
@@ -27,151 +54,281 @@ except Exception as e:
 
 
 class SyncLists:
-    def __init__(self, spotify_client, tidal_client):
+    def __init__(self, spotify_client, tidal_client, workers=DEFAULT_WORKERS, match_mode="isrc", state=None):
         self.spotify = spotify_client
         self.tidal = tidal_client
+        self.engine = SyncEngine(spotify_client, tidal_client, pipeline=SearchPipeline(workers),
+                                 match_mode=match_mode, state=state)
+        self._playlist_locks = {}
+        self._locks_lock = threading.Lock()
+
+    def sync(self, tidal_playlist_name, spotify_playlist_id, direction="B", full=False):
+        # each playlist is read once, only the diff is searched and added in batches
+        summary = self.engine.sync(tidal_playlist_name, spotify_playlist_id, direction, full)
+        if summary is None:
+            exit(1)
+        return summary
+
+    def _locks(self, pair):
+        # pairs sharing a playlist run one after the other, always locked in the same order
+        names = sorted({f"spotify|{pair.spotify_playlist_id}", f"tidal|{pair.tidal_playlist_name}"})
+        with self._locks_lock:
+            return [self._playlist_locks.setdefault(name, threading.Lock()) for name in names]
+
+    def sync_pair(self, pair):
+        # the tidal playlist is fetched again, long running processes would see it as first fetched
+        self.tidal.playlist_index.forget(pair.tidal_playlist_name)
+        with ExitStack() as stack:
+            for lock in self._locks(pair):
+                stack.enter_context(lock)
+            print(f"🔄 {pair.spotify_playlist_id} <-> {pair.tidal_playlist_name} ({pair.direction})")
+            return self.engine.sync(pair.tidal_playlist_name, pair.spotify_playlist_id, pair.direction, pair.full)
+
+    def sync_many(self, pairs, concurrency=DEFAULT_CONCURRENCY, full=False):
+        # pairs from a manifest over the same clients and rate limiters, a failing pair
+        # is reported and does not stop the others. Returns [(pair, summary, error)]
+        if full:
+            pairs = [pair._replace(full=True) for pair in pairs]
+
+        def run(pair):
+            try:
+                summary = self.sync_pair(pair)
+            except Exception as e:
+                print(f"❌ Sync {pair.spotify_playlist_id} <-> {pair.tidal_playlist_name} failed: {e}")
+                return pair, None, str(e) or type(e).__name__
+            if summary is None:
+                return pair, None, "playlist not found"
+            return pair, summary, None
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            return list(executor.map(run, pairs))
 
     def sync_spotify_to_tidal(self, tidal_playlist_name, spotify_playlist_id):
-        # get all tracks from the playlist
-        spotify_tracks = self.spotify.get_playlist_tracks(spotify_playlist_id)
-        total_listed = len(spotify_tracks)
-        print(f"🎶 Spotify playlist has {total_listed} tracks")
-        print(f"trying to create Tidal playlist: {tidal_playlist_name}")
-        # get current date and time for description
-        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-        tidal_playlist = self.tidal._get_or_create_playlist(tidal_playlist_name,
-                                                       description="Created from Spotify {current_time}")
-        total_synced = 0
-        for artist, title in spotify_tracks:
-            print(f"🎵 {artist} – {title}")
-            # search for the track in Tidal
-            tidal_track = self.tidal.find_best_quality_track(artist, title)
-            if tidal_track:
-                print(
-                    f"✅ Found on TIDAL: {tidal_track.artist.name} – {tidal_track.name}  - Quality: {tidal_track.audio_quality}"
-                )
-                # add to playlist
-                # tidal.add_track_to_playlist_by_id(tidal_playlist, tidal_track.id)
-                self.tidal.add_track_to_playlist_by_id(tidal_playlist, tidal_track.id)
-                print(f"✅ Added to TIDAL playlist: {tidal_playlist_name} By id : {tidal_track.id}")
-                total_synced += 1
-            else:
-                print(
-                    f"❌ Not Found on TIDAL: {title} – {artist}"
-                )
-        print(f"Total listed on spotify {total_listed} Total synced: {total_synced}")
+        return self.sync(tidal_playlist_name, spotify_playlist_id, "S")
 
     def sync_tidal_to_spotify(self, tidal_playlist_name, spotify_playlist_id):
-        # get all tracks from the playlist
-        tidal_playlist = self.tidal.get_playlist(tidal_playlist_name)
-        # print(f"🎶 {len(tidal_playlist)} tracks found on TIDAL")
-        tidal_num_tracks = 0
-        spotify_num_tracks = 0
-        if tidal_playlist:
-            tidal_num_tracks = tidal_playlist.num_tracks
-            print(f"🎶 Tidal playlist {tidal_playlist_name} has {tidal_num_tracks} tracks")
-        else:
-            print(f"❌ Tidal playlist {tidal_playlist_name} not found")
-            exit(1)
-        if tidal_num_tracks > 0:
-            for tidal_track in tidal_playlist.items():
-                print(f"🎵 {tidal_track.name} – {tidal_track.artist.name}")
-                # search for the track in Spotify
-                spotify_track = self.spotify.search_track(tidal_track.artist.name, tidal_track.name)
-
-                if not spotify_track:
-                    print(
-                        f"❌ Not found on SPOTIFY: {tidal_track.name} – {tidal_track.artist.name}"
-                    )
-                else:
-                    print(
-                        f"✅ Found on SPOTIFY: {spotify_track['name']} – {spotify_track['artist']}, {spotify_track['id']}"
-                    )
-                    if self.spotify.add_track_to_playlist(spotify_playlist_id, spotify_track['id']):
-                        print(f"✅ Added to Spotify playlist: {spotify_playlist_id} By id : {spotify_track['id']}")
-                        spotify_num_tracks += 1
-
-            print(f"Total listed on Tidal {tidal_num_tracks} Total synced: {spotify_num_tracks}")
-        else:
-            print(f"❌ Tidal playlist {tidal_playlist_name} is empty")
-            exit(1)
+        return self.sync(tidal_playlist_name, spotify_playlist_id, "T")
+
+
+
+DRAIN_TIMEOUT = 300  # seconds the running syncs get to finish on shutdown
+SAVE_INTERVAL = 60  # seconds between two cache saves of the daemon
+
+
+def pair_job(sync_lists, pair):
+    def run():
+        summary = sync_lists.sync_pair(pair)
+        if summary is None:
+            raise RuntimeError("playlist not found")
+        return {side: {"added": s["added"], "not_found": s["not_found"]} for side, s in summary.items()}
+    return run
+
+
+def run_daemon(sync_lists, pairs, args, match_cache, http_cache, metrics):
+    # every pair synced on its interval by --concurrency workers, controlled over
+    # a local HTTP API, until SIGTERM / SIGINT / POST /shutdown
+    caches = [c for c in (match_cache, http_cache) if c]
+    if args.full:
+        pairs = [pair._replace(full=True) for pair in pairs]
+    scheduler = JobScheduler(workers=args.concurrency)
+    for pair in pairs:
+        scheduler.add(pair, pair_job(sync_lists, pair),
+                      interval=pair.interval or args.interval,
+                      priority=pair.priority if pair.priority is not None else DEFAULT_PRIORITY,
+                      name=f"{pair.spotify_playlist_id} <-> {pair.tidal_playlist_name} ({pair.direction})",
+                      jitter=args.jitter)
+    stop = threading.Event()
+    started = time.time()
 
+    def status():
+        return {
+            "uptime": round(time.time() - started),
+            "match_cache": match_cache.stats(),
+            "http_cache": http_cache.stats() if http_cache else None,
+            "metrics": metrics.to_dict()["endpoints"] if metrics else None,
+        }
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    server = ControlServer(scheduler, port=args.port, status=status, on_shutdown=stop.set,
+                           token=DAEMON_API_TOKEN).start()
+    scheduler.start()
+    print(f"🛰️ Sync daemon: {len(pairs)} playlist pairs, control API on {server.url}")
+    if not DAEMON_API_TOKEN:
+        print(f"🔑 Control API token for this run: {server.token} (set [daemon] api_token in config.cfg for a fixed one)")
+    # the caches are saved from here, not from the jobs, so a failed write never fails a sync
+    last_save = time.time()
+    while not stop.wait(1):
+        if time.time() - last_save >= SAVE_INTERVAL:
+            last_save = time.time()
+            for cache in caches:
+                try:
+                    cache.save()
+                except OSError as e:
+                    print(f"⚠️ Saving cache error: {e}")
+    # no new syncs, the API keeps answering while the running ones finish
+    print(f"Stopping, waiting up to {args.drain_timeout}s for running syncs...")
+    drained = scheduler.stop(args.drain_timeout)
+    server.stop()
+    if not drained:
+        print(f"⚠️ {', '.join(job.name for job in scheduler.running())} still running, exiting anyway")
 
 
 def main():
+    timer = StartupTimer()
+    timer.mark("imports and config")
 
     parser = argparse.ArgumentParser(description="Sync Spotify Daily Mix to Tidal")
     parser.add_argument("--spotify", type=str, help="Spotify playlist ID")
     parser.add_argument("--url", type=str, help="Spotify playlist URL (optional, will extract ID)")
     parser.add_argument("--tidal", type=str, help="Tidal playlist name")
+    parser.add_argument("--manifest", type=str,
+                        help="YAML or JSON list of playlist pairs (spotify, tidal, dir, full) synced in one run")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Manifest pairs synced at the same time (default {DEFAULT_CONCURRENCY})")
     parser.add_argument("--dir", type=str, help=" \n" \
     "T: Tidal -> Spotify \n" \
     "S: Spotify -> Tidal \n" \
     "B: Both (default)\n")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Concurrent searches (default {DEFAULT_WORKERS})")
+    parser.add_argument("--spotify-rate", type=float, default=10,
+                        help="Max Spotify API calls per second (default 10)")
+    parser.add_argument("--tidal-rate", type=float, default=5,
+                        help="Max Tidal API calls per second (default 5)")
+    parser.add_argument("--match", type=str, choices=MATCH_MODES, default="isrc",
+                        help="isrc: match by ISRC first, text search as fallback (default). text: text search only")
+    parser.add_argument("--full", action="store_true",
+                        help="Compare both playlists completely, even if they did not change since the last sync")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and sync the --manifest pairs every --interval seconds")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL,
+                        help=f"Daemon: seconds between syncs of a pair without its own interval (default {DEFAULT_INTERVAL})")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER,
+                        help=f"Daemon: random share of the interval added or removed (default {DEFAULT_JITTER})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"Daemon: local control API port (default {DEFAULT_PORT})")
+    parser.add_argument("--drain-timeout", type=int, default=DRAIN_TIMEOUT,
+                        help=f"Daemon: seconds the running syncs get to finish on shutdown (default {DRAIN_TIMEOUT})")
+    parser.add_argument("--timing", action="store_true",
+                        help="Print how long the imports, the config, the client logins and the run took")
+    parser.add_argument("--metrics", type=str,
+                        help="Write API call counts and latencies to this file, .prom (Prometheus textfile) or .json")
+    parser.add_argument("--profile", type=str, help="Run the sync under cProfile and save the stats to this file")
+    parser.add_argument("--no-http-cache", action="store_true",
+                        help="Do not keep playlist pages and search results in the local HTTP cache")
 
     args = parser.parse_args()
+    timer.mark("arguments")
     SYNC_BOTH = False
     DIRECTION_PRIORITY = 'B'
 
-    if args.spotify:
-        spotify_playlist_id = f'spotify:playlist:{args.spotify}'
-        print(f"Syncing Spotify playlist: {spotify_playlist_id}")
-    elif args.url:
-        # Extract playlist ID from URL if provided
-        match = re.search(r'playlist/([a-zA-Z0-9]+)', args.url)
-        if match:
-            spotify_playlist_id = f'spotify:playlist:{match.group(1)}'
-            print(f"Extracted Spotify playlist ID: {spotify_playlist_id}")
-        else:
-            print("Invalid Spotify playlist URL format")
+    pairs = None
+    if args.daemon and not args.manifest:
+        print("--daemon needs a --manifest")
+        exit(1)
+    if args.manifest:
+        try:
+            pairs = load_manifest(args.manifest)
+        except ManifestError as e:
+            print(f"Invalid manifest: {e}")
             exit(1)
-
-    if args.tidal:
-        tidal_playlist_name = args.tidal
-        print(f"Syncing Tidal playlist: {tidal_playlist_name}")
+        print(f"Syncing {len(pairs)} playlist pairs from {args.manifest}, {args.concurrency} at a time")
     else:
-        print("Must provide a Tidal playlist name")
-        exit(1)
-
+        if args.spotify:
+            spotify_playlist_id = f'spotify:playlist:{args.spotify}'
+            print(f"Syncing Spotify playlist: {spotify_playlist_id}")
+        elif args.url:
+            # Extract playlist ID from URL if provided
+            match = re.search(r'playlist/([a-zA-Z0-9]+)', args.url)
+            if match:
+                spotify_playlist_id = f'spotify:playlist:{match.group(1)}'
+                print(f"Extracted Spotify playlist ID: {spotify_playlist_id}")
+            else:
+                print("Invalid Spotify playlist URL format")
+                exit(1)
 
-    if args.dir:
-        if args.dir == "T":
-            DIRECTION_PRIORITY = 'T'
-            print("Sync Tidal to Spotify")
-        elif args.dir == "S":
-            DIRECTION_PRIORITY = 'S'
-            print("Sync Spotify to Tidal")
-        elif args.dir == "B":
-            DIRECTION_PRIORITY = 'B'
-            print("Sync Both")
+        if args.tidal:
+            tidal_playlist_name = args.tidal
+            print(f"Syncing Tidal playlist: {tidal_playlist_name}")
         else:
-            print("Invalid direction, must be T, S or B")
+            print("Must provide a Tidal playlist name")
             exit(1)
-    else:
-        print("Sync Both")
-        DIRECTION_PRIORITY = 'B'
-    # initialize clients
+
+
+        if args.dir:
+            if args.dir == "T":
+                DIRECTION_PRIORITY = 'T'
+                print("Sync Tidal to Spotify")
+            elif args.dir == "S":
+                DIRECTION_PRIORITY = 'S'
+                print("Sync Spotify to Tidal")
+            elif args.dir == "B":
+                DIRECTION_PRIORITY = 'B'
+                print("Sync Both")
+            else:
+                print("Invalid direction, must be T, S or B")
+                exit(1)
+        else:
+            print("Sync Both")
+            DIRECTION_PRIORITY = 'B'
+    match_cache = MatchCache(MATCH_CACHE_PATH)
+    metrics = ApiMetrics() if args.metrics else None
+    http_cache = None if args.no_http_cache else HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES)
+    # clients log in on first use, only the services a run talks to
     print("Initializing spotify client...")
     spotify = SpotifyClient(
         client_id=SPOTIFY_CLIENT_ID,
         client_secret=SPOTIFY_CLIENT_SECRET,
         redirect_uri=SPOTIFY_REDIRECT_URI,
+        match_cache=match_cache,
+        rate_limiter=RateLimiter("Spotify", args.spotify_rate),
+        metrics=metrics,
+        http_cache=http_cache,
+        timer=timer,
     )
     print("Initializing Tidal client...")
-    tidal = TidalClient(session_path=TIDAL_DB_SESSION_PATH)
+    tidal = TidalClient(session_path=TIDAL_DB_SESSION_PATH, match_cache=match_cache,
+                        playlist_index_path=TIDAL_PLAYLIST_INDEX_PATH,
+                        rate_limiter=RateLimiter("Tidal", args.tidal_rate), metrics=metrics,
+                        http_cache=http_cache, timer=timer)
 
-    sync_lists = SyncLists(spotify, tidal)
+    sync_lists = SyncLists(spotify, tidal, workers=args.workers, match_mode=args.match,
+                           state=SyncStateStore(SYNC_STATE_PATH))
     print("Clients initialized successfully.")
-    if DIRECTION_PRIORITY == 'B':
-        print("Syncing both directions...")
-        print("Syncing Spotify to Tidal...")
-        sync_lists.sync_spotify_to_tidal(tidal_playlist_name, spotify_playlist_id)
-        print("Syncing Tidal to Spotify...")
-        sync_lists.sync_tidal_to_spotify(tidal_playlist_name, spotify_playlist_id)
-    elif DIRECTION_PRIORITY == 'S':
-        sync_lists.sync_spotify_to_tidal(tidal_playlist_name, spotify_playlist_id)
-    elif DIRECTION_PRIORITY == 'T':
-        sync_lists.sync_tidal_to_spotify(tidal_playlist_name, spotify_playlist_id)
+    timer.mark("caches and clients")
+    results = []
+    with profiled(args.profile) if args.profile else nullcontext():
+        if args.daemon:
+            if metrics:
+                metrics.start_export(args.metrics)
+            run_daemon(sync_lists, pairs, args, match_cache, http_cache, metrics)
+            if metrics:
+                metrics.stop_export()
+        elif pairs:
+            results = sync_lists.sync_many(pairs, args.concurrency, args.full)
+        else:
+            if DIRECTION_PRIORITY == 'B':
+                print("Syncing both directions...")
+            sync_lists.sync(tidal_playlist_name, spotify_playlist_id, DIRECTION_PRIORITY, args.full)
+    timer.mark("sync")
+    match_cache.save()
+    print(match_cache.stats())
+    if http_cache:
+        http_cache.save()
+        print(http_cache.stats())
+    if metrics:
+        metrics.export(args.metrics)
+        print(metrics.summary())
+    if args.timing:
+        print(timer.report())
+    failed = [(pair, error) for pair, _, error in results if error]
+    if results:
+        print(f"📋 {len(results) - len(failed)}/{len(results)} playlist pairs synced")
+        for pair, error in failed:
+            print(f"❌ {pair.spotify_playlist_id} <-> {pair.tidal_playlist_name}: {error}")
+    if failed:
+        exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+import time
+from types import SimpleNamespace
+import pytest
+import requests
+import tidalapi
+from ClientTidal.tidal_client import TidalClient
+from SyncEngine.rate_limiter import RateLimiter
+
+
+def tidal_client(rate_limiter, retry_after="0.2"):
+    # the real TidalClient._call, the session only holds the last error response like tidalapi's
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = retry_after
+    client = TidalClient.__new__(TidalClient)
+    client.session = SimpleNamespace(request=SimpleNamespace(latest_err_response=response))
+    client.rate_limiter = rate_limiter
+    client.metrics = None
+    return client
+
+
+def throttled_once():
+    calls = []
+
+    def fn():
+        calls.append(time.perf_counter())
+        if len(calls) == 1:
+            raise tidalapi.exceptions.TooManyRequests
+        return "ok"
+
+    return fn, calls
+
+
+def test_tidal_429_backs_off_for_retry_after():
+    limiter = RateLimiter("Tidal", 100)
+    fn, calls = throttled_once()
+    assert tidal_client(limiter)._call(fn) == "ok"
+    assert limiter.throttled == 1
+    assert calls[1] - calls[0] >= 0.2
+
+
+def test_tidal_429_without_retry_after_uses_the_backoff(monkeypatch):
+    monkeypatch.setattr("SyncEngine.rate_limiter.DEFAULT_BACKOFF", 0.1)
+    limiter = RateLimiter("Tidal", 100)
+    client = tidal_client(limiter)
+    del client.session.request.latest_err_response.headers["Retry-After"]
+    fn, calls = throttled_once()
+    assert client._call(fn) == "ok"
+    assert limiter.throttled == 1
+
+
+def test_tidal_429_gives_up_after_max_retries():
+    limiter = RateLimiter("Tidal", 100, max_retries=2)
+    client = tidal_client(limiter, retry_after="0")
+
+    def fn():
+        raise tidalapi.exceptions.TooManyRequests
+
+    with pytest.raises(requests.HTTPError) as error:
+        client._call(fn)
+    assert error.value.response.status_code == 429
+    assert limiter.throttled == 2
+
+
+def test_other_errors_are_not_retried():
+    limiter = RateLimiter("Tidal", 100)
+
+    def fn():
+        raise tidalapi.exceptions.ObjectNotFound
+
+    with pytest.raises(tidalapi.exceptions.ObjectNotFound):
+        tidal_client(limiter)._call(fn)
+    assert limiter.throttled == 0
+
+
+def test_fractional_rate_is_not_rounded_up():
+    limiter = RateLimiter("Tidal", 2.5)  # 5 calls every 2 s
+    started = time.perf_counter()
+    for _ in range(6):
+        limiter.call(lambda: None)
+    assert time.perf_counter() - started >= 1.5
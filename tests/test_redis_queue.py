@@ -0,0 +1,93 @@
+import os
+import queue
+import time
+import uuid
+import pytest
+from Benchmark.fake_redis import FakeRedis
+from QueueConverter.redis_queue import RedisTaskQueue
+
+
+# REDIS_URL=redis://127.0.0.1:6379/15 runs the same tests against a local redis-server
+@pytest.fixture(params=["fake", "redis"])
+def client(request):
+    if request.param == "fake":
+        return FakeRedis()
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        pytest.skip("REDIS_URL not set")
+    import redis
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+def make_queue(client, **kwargs):
+    # a prefix per test, a real server is shared between them
+    return RedisTaskQueue(client=client, prefix=f"test-{uuid.uuid4()}", **kwargs)
+
+
+def expire_leases(task_queue):
+    # the sweep runs at most every SWEEP_INTERVAL, tests do not wait for it
+    task_queue._last_sweep = 0
+    time.sleep(0.01)
+
+
+def test_task_done_acks(client):
+    task_queue = make_queue(client)
+    task_queue.add_task({"tmp_file_name": "a.wav"})
+    task = task_queue.get_task(timeout=1)
+    assert task["tmp_file_name"] == "a.wav"
+    assert task_queue.stats() == {"pending": 0, "processing": 1, "dead": 0}
+    task_queue.task_done(task)
+    assert task_queue.stats() == {"pending": 0, "processing": 0, "dead": 0}
+
+
+def test_empty_queue_raises_empty(client):
+    with pytest.raises(queue.Empty):
+        make_queue(client).get_task(timeout=1)
+
+
+def test_expired_lease_is_requeued(client):
+    task_queue = make_queue(client, visibility_timeout=0)
+    task_queue.add_task({"tmp_file_name": "a.wav"})
+    stale = task_queue.get_task(timeout=1)  # its worker hangs
+    expire_leases(task_queue)
+    task = task_queue.get_task(timeout=1)  # the sweep hands it out again
+    assert task["tmp_file_name"] == "a.wav"
+    # the late ack of the old worker no longer owns the lease
+    task_queue.task_done(stale)
+    assert task_queue.stats()["processing"] == 1
+    task_queue.task_done(task)
+    assert task_queue.stats() == {"pending": 0, "processing": 0, "dead": 0}
+
+
+def test_taken_without_lease_gets_one_on_sweep(client):
+    task_queue = make_queue(client)
+    task_queue.add_task({"tmp_file_name": "a.wav"})
+    # a worker died between BLMOVE and ZADD
+    payload = client.blmove(task_queue.pending, task_queue.processing, 1, "RIGHT", "LEFT")
+    expire_leases(task_queue)
+    task_queue._sweep()
+    assert client.zscore(task_queue.leases, payload) is not None
+    assert task_queue.stats() == {"pending": 0, "processing": 1, "dead": 0}
+
+
+def test_failed_task_goes_dead_after_max_attempts(client):
+    task_queue = make_queue(client, max_attempts=3)
+    task_queue.add_task({"tmp_file_name": "a.wav"})
+    for attempt in range(3):
+        task = task_queue.get_task(timeout=1)
+        assert task["tmp_file_name"] == "a.wav"
+        task_queue.task_failed(task)
+    assert task_queue.stats() == {"pending": 0, "processing": 0, "dead": 1}
+    with pytest.raises(queue.Empty):
+        task_queue.get_task(timeout=1)
+
+
+def test_expired_leases_count_as_attempts(client):
+    task_queue = make_queue(client, visibility_timeout=0, max_attempts=2)
+    task_queue.add_task({"tmp_file_name": "a.wav"})
+    task_queue.get_task(timeout=1)
+    expire_leases(task_queue)
+    task_queue.get_task(timeout=1)
+    expire_leases(task_queue)
+    task_queue._sweep()
+    assert task_queue.stats() == {"pending": 0, "processing": 0, "dead": 1}
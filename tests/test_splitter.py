@@ -0,0 +1,127 @@
+import time
+import wave
+import pytest
+from AudioCapture import splitter
+from AudioCapture.capture import CaptureStream
+from AudioCapture.splitter import TrackSplitter
+
+
+RATE = 1000  # frames per second, small numbers keep the files tiny
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+FRAME_BYTES = CHANNELS * SAMPLE_WIDTH
+
+
+def frame(n):
+    # a frame that says its own position: both samples hold n % 65536
+    return (n % 65536).to_bytes(2, "little") * CHANNELS
+
+
+def frame_numbers(data):
+    return [int.from_bytes(data[i:i + 2], "little") for i in range(0, len(data), FRAME_BYTES)]
+
+
+def pcm_file(tmp_path, frames):
+    path = tmp_path / "capture.raw"
+    path.write_bytes(b"".join(frame(n) for n in range(frames)))
+    return str(path)
+
+
+def read_wav(path):
+    with wave.open(str(path), "rb") as f:
+        assert (f.getframerate(), f.getnchannels(), f.getsampwidth()) == (RATE, CHANNELS, SAMPLE_WIDTH)
+        return frame_numbers(f.readframes(f.getnframes()))
+
+
+@pytest.fixture(autouse=True)
+def fast_drain(monkeypatch):
+    monkeypatch.setattr(splitter, "DRAIN_INTERVAL", 0.01)
+
+
+def capture_from(tmp_path, frames, buffer_seconds=60):
+    # the whole file is in the ring before the splitter looks at it
+    capture = CaptureStream.from_file(pcm_file(tmp_path, frames), rate=RATE, channels=CHANNELS,
+                                      sample_width=SAMPLE_WIDTH, buffer_seconds=buffer_seconds).start()
+    capture.finished.wait(5)
+    return capture
+
+
+def test_tracks_are_cut_at_the_boundaries(tmp_path):
+    capture = capture_from(tmp_path, 5000)
+    track_splitter = TrackSplitter(capture, holdback_seconds=10)
+    first, second = tmp_path / "first.wav", tmp_path / "second.wav"
+    track_splitter.start_track(str(first), 500)
+    assert track_splitter.split(2000, str(second)) == str(first)
+    assert track_splitter.end_track(4200) == str(second)
+    track_splitter.close()
+    capture.stop()
+    assert read_wav(first) == list(range(500, 2000))
+    assert read_wav(second) == list(range(2000, 4200))
+
+
+def test_tail_trim_drops_the_last_frames(tmp_path):
+    capture = capture_from(tmp_path, 3000)
+    track_splitter = TrackSplitter(capture, holdback_seconds=10)
+    track = tmp_path / "track.wav"
+    track_splitter.start_track(str(track), 0)
+    track_splitter.end_track(2500, discard_frames=300)
+    track_splitter.close()
+    capture.stop()
+    assert read_wav(track) == list(range(0, 2200))
+
+
+def test_drain_stays_holdback_behind_the_capture(tmp_path):
+    capture = capture_from(tmp_path, 5000)
+    track_splitter = TrackSplitter(capture, holdback_seconds=1)  # 1000 frames
+    track = tmp_path / "track.wav"
+    track_splitter.start_track(str(track), 0)
+    deadline_frame = capture.ring.written - track_splitter.holdback
+    for _ in range(500):
+        if track_splitter.drained >= deadline_frame:
+            break
+        time.sleep(0.01)
+    # the background drain wrote up to the holdback and not past it
+    assert track_splitter.drained == 4000
+    # a boundary reported late, inside the holdback, still cuts exactly
+    track_splitter.end_track(4500)
+    track_splitter.close()
+    capture.stop()
+    assert read_wav(track) == list(range(0, 4500))
+
+
+def test_start_already_drained_keeps_the_drained_position(tmp_path):
+    capture = capture_from(tmp_path, 5000)
+    track_splitter = TrackSplitter(capture, holdback_seconds=1)
+    for _ in range(500):
+        if track_splitter.drained >= 4000:
+            break
+        time.sleep(0.01)
+    # reported later than the holdback: the track starts where the drain is
+    track = tmp_path / "late.wav"
+    track_splitter.start_track(str(track), 3000)
+    track_splitter.end_track(4800)
+    track_splitter.close()
+    capture.stop()
+    assert read_wav(track) == list(range(4000, 4800))
+
+
+def test_ring_overrun_skips_the_lost_frames(tmp_path, capsys):
+    # a 1 s ring holds 1000 frames, 3000 were captured before the track ends
+    capture = capture_from(tmp_path, 3000, buffer_seconds=1)
+    track_splitter = TrackSplitter(capture, holdback_seconds=10)
+    track = tmp_path / "track.wav"
+    track_splitter.start_track(str(track), 0)
+    track_splitter.end_track(2800)
+    track_splitter.close()
+    capture.stop()
+    assert "Capture overrun, 2000 frames lost" in capsys.readouterr().out
+    assert read_wav(track) == list(range(2000, 2800))
+
+
+def test_frame_at_maps_wall_clock_to_frames(tmp_path):
+    capture = capture_from(tmp_path, 2000)
+    anchor_time, anchor_frames = capture._anchor
+    assert anchor_frames == 2000
+    assert capture.frame_at(anchor_time - 0.5) == 1500
+    assert capture.frame_at(anchor_time - 10) == 0
+    capture.stop()
@@ -0,0 +1,69 @@
+import time
+import pytest
+from Benchmark.hifi_stub import TidalHiFiStub
+from ClientTidalHiFi import tidalhifi_client
+from ClientTidalHiFi.tidalhifi_client import TidalHiFiClient
+from SyncEngine.metrics import ApiMetrics
+
+
+TRACKS = [{"title": f"Song {i}", "artist": f"Artist {i}", "tidal_id": 1000 + i} for i in range(3)]
+
+
+@pytest.fixture
+def stub():
+    stub = TidalHiFiStub(TRACKS, track_seconds=0.3).start()
+    yield stub
+    stub.stop()
+
+
+def test_calls_reuse_one_connection(stub):
+    client = TidalHiFiClient(stub.url)
+    assert client.play()
+    for _ in range(20):
+        assert client.get_current_song_data()["title"] == "Song 0"
+    assert stub.calls["/current"] == 20
+    assert len(stub.clients) == 1
+
+
+def test_timeout_is_retried(stub):
+    metrics = ApiMetrics()
+    client = TidalHiFiClient(stub.url, timeout=0.2, metrics=metrics)
+    client.play()
+    stub.delays = [0.5]  # the first poll hangs, the retry answers
+    assert client.get_current_song_data()["title"] == "Song 0"
+    assert stub.calls["/current"] == 2
+    # both attempts are measured
+    assert metrics.to_dict()["endpoints"]["tidal-hifi./current"]["calls"] == {"ReadTimeout": 1, "ok": 1}
+
+
+def test_timeout_gives_up_after_the_retries(stub):
+    client = TidalHiFiClient(stub.url, timeout=0.2, retries=1)
+    client.play()
+    stub.delays = [0.5, 0.5]
+    started = time.perf_counter()
+    assert client.get_current_song_data(quiet=True) is None
+    assert stub.calls["/current"] == 2
+    assert time.perf_counter() - started < 1
+
+
+def test_next_is_not_retried(stub):
+    client = TidalHiFiClient(stub.url, timeout=0.2)
+    client.play()
+    stub.delays = [0.5]
+    assert not client.next()
+    assert stub.calls["/next"] == 1
+
+
+def test_watch_yields_each_track_change_once(stub, monkeypatch):
+    monkeypatch.setattr(tidalhifi_client, "IDLE_INTERVAL", 0.05)
+    client = TidalHiFiClient(stub.url)
+    client.play()
+    seen = []
+    for detected_at, song_data in client.watch_track_changes(interval=0.02):
+        seen.append((detected_at, song_data))
+        if len(seen) == len(TRACKS):
+            break
+    assert [TidalHiFiClient.track_id(song) for _, song in seen] == ["1000", "1001", "1002"]
+    # seen within a couple of polls of the real start
+    for index, (detected_at, _) in enumerate(seen):
+        assert 0 <= detected_at - stub.started[index] < 0.1
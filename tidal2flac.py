@@ -3,60 +3,224 @@ import argparse
 import copy
 from ClientTidalHiFi.tidalhifi_client import  TidalHiFiClient
 from QueueConverter.task_queue import TaskQueue
+from QueueConverter.redis_queue import RedisTaskQueue
 from QueueConverter.consumer import Consumer
+from QueueConverter.converter import safe_filename, get_art, keep_art_file
+from QueueConverter.library_index import LibraryIndex, TRACK_ID_TAG
+from QueueConverter import session_journal
+from QueueConverter.session_journal import SessionJournal
+from AudioCapture.capture import CaptureStream
+from AudioCapture.splitter import TrackSplitter, HOLDBACK_SECONDS
+from AudioCapture.sinks import FlacSink
+from SyncEngine.metrics import ApiMetrics, DEFAULT_EXPORT_INTERVAL
 import time
 import re
-import subprocess
 import uuid
 import os
+import requests
 
 
 
 class Recorder:
-    def __init__(self, task_queue, is_check_interface=False):
+    def __init__(self, task_queue, is_check_interface=False, device="hw:0,1", streaming=False,
+                 default_album='', clean_art_file=True, trim_end=0, library=None,
+                 journal=None, skip_finished=True):
         self.task_queue = task_queue
         self.recording = False
         self.tmp_filename = None
         self.original_filename = None  # Placeholder for the original filename if needed
         self.is_check_interface = is_check_interface  # Flag to check if the interface is being used
+        self.device = device
+        self.capture = None
+        self.splitter = None
+        self.streaming = streaming  # encode to FLAC while recording, no WAV on disk
+        self.default_album = default_album
+        self.clean_art_file = clean_art_file
+        self.trim_end = trim_end  # seconds cut from the end of every track, in memory
+        self.art_filename = None
+        self.library = library  # LibraryIndex of the output directory, None: no track id lookup
+        self.journal = journal  # SessionJournal, None: no resume
+        self.journal_key = None  # track key of the current recording
+        self.skip_finished = skip_finished  # False with --no-skip, journaled tracks are recorded again
+
+    def is_ripped(self, track_id):
+        return bool(self.library and self.library.find(track_id))
+
+    def is_finished(self, track_key):
+        # recorded earlier in this session or in the interrupted one
+        return bool(self.skip_finished and self.journal and self.journal.is_done(track_key))
+
+    def _journal(self, state, **fields):
+        if self.journal and self.journal_key:
+            self.journal.record(self.journal_key, state, **fields)
+
+    def conversion_finished(self, task, flac_filename):
+        # Consumer callback, flac_filename is None when the conversion failed
+        if flac_filename and self.library and task.get('track_id'):
+            self.library.add(task['track_id'], flac_filename)  # only once the FLAC exists
+        if self.journal and task.get('journal_key'):
+            state = session_journal.ENCODED if flac_filename else session_journal.FAILED
+            self.journal.record(task['journal_key'], state)
+
+    def resume(self, durable_queue=False):
+        # puts the WAVs of the interrupted session back on the queue
+        if not self.journal:
+            return
+        for task in self.journal.recover(durable_queue):
+            print(f"♻️ Re-queuing {task['tmp_file_name']} ({task['original_file_name']})")
+            self.task_queue.add_task(task)
+            self.journal.record(task['journal_key'], session_journal.QUEUED)
 
     def _check_if_file_exists(self, filename):
         return os.path.isfile(filename)
 
-    def start_recording(self):
-        # process in background with subprocess and this command arecord -D hw:0,1 -f S32_LE -r 48000 -c 2 tmp.wav
-        self.tmp_filename = f"tmp-rec-{uuid.uuid4()}.wav"  # Unique filename for each recording
+    def start_capture(self):
+        # a single arecord process for the whole session, tracks are cut from its stream
+        if self.is_check_interface:
+            return
+        if self.capture is None:
+            self.capture = CaptureStream.from_arecord(self.device).start()
+            self.splitter = TrackSplitter(self.capture)
+
+    def _flac_sink(self, track_data):
+        original_filename = safe_filename(f"{track_data['title']} - {track_data['artists']}")
+        self.art_filename = None
+        if track_data.get('image'):
+            try:
+                self.art_filename = get_art(track_data['image'])
+            except (requests.RequestException, OSError) as e:
+                print(f"❌ Art download error for {original_filename}: {e}")
+        tags = {"ARTIST": track_data.get('artist'),
+                "TITLE": track_data.get('title'),
+                "ALBUM": self.default_album,
+                TRACK_ID_TAG: TidalHiFiClient.track_id(track_data)}
+        return FlacSink(self.tmp_filename, self.capture, tags, self.art_filename)
+
+    def start_recording(self, started_at=None, track_data=None):
+        # started_at: wall clock time the track started, defaults to now
+        # track_data: tidal-hifi /current data, needed to tag while streaming
+        extension = "flac" if self.streaming and track_data else "wav"
+        self.tmp_filename = f"tmp-rec-{uuid.uuid4()}.{extension}"  # Unique filename for each recording
         print(f"Recording {self.tmp_filename} started...")
+        self.journal_key = TidalHiFiClient.track_key(track_data) if track_data else None
+        self._journal(session_journal.PLAYING, tmp_file=self.tmp_filename)
         if not self.is_check_interface:
-            subprocess.Popen(["arecord", "-D", "hw:0,1", "-f", "S16_LE", "-r", "44100", "-c", "2", self.tmp_filename])
+            self.start_capture()
+            start_frame = self.capture.frame_at(started_at or time.time())
+            sink = self._flac_sink(track_data) if extension == "flac" else None
+            self.splitter.start_track(self.tmp_filename, start_frame, sink)
         self.recording = True
 
         return self.tmp_filename  # Return the filename for reference, if needed
 
+    def _finish_streamed(self, encoded, flac_filename, clean_art_file):
+        # encoded: the flac encoder of the track exited cleanly; True when the FLAC is in place
+        finished = encoded and self._check_if_file_exists(self.tmp_filename)
+        if finished:
+            os.replace(self.tmp_filename, flac_filename)  # same directory, no copy
+            print(f"✅ Recorded {flac_filename}")
+            if self.art_filename and not clean_art_file:
+                keep_art_file(self.art_filename, os.path.splitext(flac_filename)[0])
+        else:
+            print(f"❌ Recording {flac_filename} failed")
+            if self._check_if_file_exists(self.tmp_filename):
+                os.unlink(self.tmp_filename)
+        self.art_filename = None
+        return finished
+
     def stop_recording(self, original_filename=None, art_url=None, artist_name=None,
-                       track_name=None, default_album='', clean_art_file=False):
+                       track_name=None, default_album='', clean_art_file=False, ended_at=None,
+                       track_id=None):
+        # ended_at: wall clock time the track ended, the cut is made at the frame it maps to
         print(f"Recording {self.tmp_filename} stopped...")
-        if self._check_if_file_exists(f'{original_filename}.flac'):
+        written = None
+        if not self.is_check_interface:
+            trim_frames = int(self.trim_end * self.capture.rate)
+            written = self.splitter.end_track(self.capture.frame_at(ended_at or time.time()),
+                                              discard_frames=trim_frames)
+        self.recording = False
+        flac_filename = f'{safe_filename(original_filename)}.flac'
+        if self._check_if_file_exists(flac_filename) or self.is_ripped(track_id):
             print(f"File {original_filename}.flac already exists, skipping processing.")
-            subprocess.run(["pkill", "-f", "arecord"])
-            self.recording = False
-            os.unlink(self.tmp_filename)  # Remove the temporary file
+            if self._check_if_file_exists(self.tmp_filename):
+                os.unlink(self.tmp_filename)  # Remove the temporary file
+            self._journal(session_journal.ENCODED)
             return
 
-        if not self.is_check_interface:
-            subprocess.run(["pkill", "-f", "arecord"])  # Stops the arecord process
-            self.recording = False
-            self.task_queue.add_task({'tmp_file_name':self.tmp_filename,
-                                      'original_file_name':original_filename,
-                                      'art_url':art_url,
-                                      'artist_name':artist_name,
-                                      'track_name':track_name,
-                                      'default_album':default_album,
-                                      'clean_art_file':clean_art_file})  # Add the filename to the task queue for further processing
+        if self.is_check_interface:
+            return
+        if self.tmp_filename.endswith(".flac"):
+            if self._finish_streamed(written is not None, flac_filename, clean_art_file):
+                if self.library and track_id:
+                    self.library.add(track_id, flac_filename)
+                self._journal(session_journal.ENCODED)
+            else:
+                self._journal(session_journal.FAILED)
+        else:  # added to the library by conversion_finished
+            task = {'tmp_file_name':self.tmp_filename,
+                    'original_file_name':original_filename,
+                    'art_url':art_url,
+                    'artist_name':artist_name,
+                    'track_name':track_name,
+                    'default_album':default_album,
+                    'clean_art_file':clean_art_file,
+                    'track_id':track_id,
+                    'journal_key':self.journal_key}
+            self._journal(session_journal.RECORDED, task=task)
+            self.task_queue.add_task(task)  # Add the filename to the task queue for further processing
+            self._journal(session_journal.QUEUED)
+
+    def close(self):
+        # the unfinished track is dropped
+        if self.splitter:
+            self.splitter.close()
+            self.capture.stop()
+        if self.recording and self._check_if_file_exists(self.tmp_filename):
+            os.unlink(self.tmp_filename)
+        self.recording = False
+
 
 
 
 
+def on_track_change(tidalui, recorder, previous_track_data, changed_at, current_song_data):
+    # closes the previous track at the boundary and starts the new one, or skips
+    # it when it is already done. Returns the track data being recorded, None
+    # when nothing is: after an error too, so the previous track is never
+    # stopped a second time.
+    try:
+        return _change_track(tidalui, recorder, previous_track_data, changed_at, current_song_data)
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+def _change_track(tidalui, recorder, previous_track_data, changed_at, current_song_data):
+    now_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(changed_at))
+    current_song = current_song_data['title'] + " - " + current_song_data['artists']
+    current_track_id = tidalui.track_key(current_song_data)
+    # the new track started currentInSeconds before we saw the change, whole seconds only
+    track_started_at = changed_at - (current_song_data.get('currentInSeconds') or 0)
+    if previous_track_data is not None:
+        previous_song_name = previous_track_data['title'] + " - " + previous_track_data['artists']
+        recorder.stop_recording(previous_song_name, previous_track_data['image'],
+                                previous_track_data['artist'],
+                                previous_track_data['title'],
+                                recorder.default_album,
+                                recorder.clean_art_file,
+                                ended_at=track_started_at,  # cut at the track boundary
+                                track_id=tidalui.track_id(previous_track_data))
+        print(f"{now_str} Song changed, recording new song...")
+    if not recorder.is_check_interface and (recorder.is_ripped(tidalui.track_id(current_song_data))
+                                            or recorder.is_finished(current_track_id)):
+        # already in the library, no need to play it through
+        print(f"{now_str} Skipping: {current_song} (track id: {current_track_id}) already ripped")
+        tidalui.next()
+        return None
+    recorder.start_recording(started_at=track_started_at, track_data=current_song_data)
+    print(f"{now_str} Playing: {current_song} (track id: {current_track_id})")
+    return copy.deepcopy(current_song_data)
+
 
 def main():
     parser = argparse.ArgumentParser(description="Tidal playlist to FLAC, on linux with tidal-hifi")
@@ -64,8 +228,40 @@ def main():
     parser.add_argument("--url", type=str, help="Url Tidal hifi", required=False)
     parser.add_argument("--check", action="store_true", help="Check if TIDAL hifi UI its changing the song name", required=False)
     parser.add_argument("--art-file", action="store_true", help="Preserve art files", required=False)
+    parser.add_argument("--poll", type=float, default=0.05,
+                        help="Seconds between track change checks (default 0.05)", required=False)
+    parser.add_argument("--workers", type=int,
+                        help="FLAC conversion processes (default: number of cores, 0: only remote workers)", required=False)
+    parser.add_argument("--redis", type=str,
+                        help="Durable conversion queue on Redis, ej: redis://127.0.0.1:6379/0", required=False)
+    parser.add_argument("--max-pending", type=int, default=8,
+                        help="Recorded tracks waiting for conversion before recording blocks (default 8)", required=False)
+    parser.add_argument("--wav", action="store_true",
+                        help="Record WAV files and convert them on the queue instead of encoding while recording", required=False)
+    parser.add_argument("--trim-end", type=float, default=0,
+                        help=f"Seconds removed from the end of every track, less than {HOLDBACK_SECONDS} (default 0)",
+                        required=False)
+    parser.add_argument("--library", type=str, default=".",
+                        help="Directory of the ripped FLACs, tracks found there by Tidal id are skipped (default: current)", required=False)
+    parser.add_argument("--no-skip", action="store_true",
+                        help="Record every track, even if it is already in the library", required=False)
+    parser.add_argument("--journal", type=str, default=session_journal.DEFAULT_JOURNAL_PATH,
+                        help="Session journal, an interrupted session is resumed from it (default tidal2flac-session.jsonl)",
+                        required=False)
+    parser.add_argument("--new-session", action="store_true",
+                        help="Forget the interrupted session and start from scratch", required=False)
+    parser.add_argument("--metrics", type=str,
+                        help="Write tidal-hifi call counts and latencies to this file, .prom (Prometheus textfile) or .json",
+                        required=False)
+    parser.add_argument("--metrics-interval", type=int, default=DEFAULT_EXPORT_INTERVAL,
+                        help=f"Seconds between metrics exports (default {DEFAULT_EXPORT_INTERVAL})", required=False)
     parser.add_argument("--album",  type=str, help="Set default album to organize like playlist on devices", required=False)
     args = parser.parse_args()
+    if args.workers == 0 and not args.redis:
+        parser.error("--workers 0 needs --redis, nothing else would convert the local queue")
+    if not 0 <= args.trim_end < HOLDBACK_SECONDS:
+        # the tail is cut from what the splitter still holds back, older audio is already written
+        parser.error(f"--trim-end must be at least 0 and less than {HOLDBACK_SECONDS} seconds")
     url = None
     check_interface = False
     clean_art_file = True  # Default
@@ -90,97 +286,66 @@ def main():
         print(f"Param: Default album set to {default_album}")
 
     # initialize clients
-    tidalui =  TidalHiFiClient(url)
-    task_queue = TaskQueue()
-    consumer = Consumer(task_queue)
-    consumer.start()
-    recorder = Recorder(task_queue, check_interface)
-    #while until ctrl+c
-    recorder.start_recording()  # Start recording in the background
+    metrics = None
+    if args.metrics:
+        metrics = ApiMetrics()
+        metrics.start_export(args.metrics, args.metrics_interval)
+    tidalui =  TidalHiFiClient(url, metrics=metrics)
+    if args.redis:
+        task_queue = RedisTaskQueue(args.redis, max_pending=args.max_pending)
+        print(f"Param: Conversion queue on {args.redis}")
+    else:
+        task_queue = TaskQueue(args.max_pending)
+    library = None
+    if not args.no_skip:
+        library = LibraryIndex(args.library).refresh()
+    journal = None
+    if not check_interface:
+        if args.new_session and os.path.isfile(args.journal):
+            os.unlink(args.journal)
+        journal = SessionJournal(args.journal)
+    recorder = Recorder(task_queue, check_interface, streaming=not args.wav, default_album=default_album,
+                        clean_art_file=clean_art_file, trim_end=args.trim_end, library=library,
+                        journal=journal, skip_finished=not args.no_skip)
+    consumer = None
+    if args.workers != 0:
+        consumer = Consumer(task_queue, workers=args.workers, on_result=recorder.conversion_finished)
+        consumer.start()
+    recorder.resume(durable_queue=bool(args.redis))
+    recorder.start_capture()  # Start capturing before playback so the first track is complete
     tidalui.play()
 
-    track_id = None
-    previous_track_id = ""
-    previous_track_name = ""
     previous_track_data = None
-    current_track_id = ""
-    first_run = True
-    cont_playing = 0
-    while True:
-        try:
-            cont_playing += 1
-            now_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            current_song_data = tidalui.get_current_song_data()
-            # print(current_song_data)
-            """
-            {'title': 'Forgiven', 'artists': 'Alexis Ffrench', 
-            'album': '', 'icon': '/home/zeuz/.config/tidal-hifi/notification.jpg',
-             'playingFrom': '', 'status': 'playing', 
-             'url': 'https://tidal.com/browse/track/94072682?u', 
-             'current': '0:05', 'currentInSeconds': 5, 'duration': '', 
-             'durationInSeconds': 0, 
-             'image': 'https://resources.tidal.com/images/72cb7592/255a/44b7/ac9c/625b9a0543d9/640x640.jpg', 
-             'favorite': False, 'player': {'status': 'playing', 'shuffle': False, 'repeat': 'off'}, 
-             'artist': 'Alexis Ffrench'}
-
-            """
-
-            # re  extract track id from url like https://tidal.com/browse/track/94072682?u
-
-            if current_song_data:
-                current_song = current_song_data['title'] + " - " + current_song_data['artists']
-                song_url = current_song_data['url']
-
-                if song_url:
-                    match = re.search(r'track/(\d+)', current_song_data["url"])
-                    if match:
-                        track_id = match.group(1)
-                if track_id:
-                    current_track_id = track_id
-                if first_run:
-                    print(f"{now_str} Playing: {current_song} (track id: {track_id})")
-                    previous_track_id = current_track_id
-                    previous_track_data = copy.deepcopy(current_song_data)
-                    first_run = False
-
-                if current_track_id == previous_track_id:
-                    if cont_playing >= 120:
-                        print(f"{now_str} The current song is the same as the previous one, continuing...")
-                        cont_playing = 0
-                else:
-                    tidalui.pause()  # Pause the current track
-                    previous_song_name = previous_track_data['title'] + " - " + previous_track_data['artists']
-                    recorder.stop_recording(previous_song_name, previous_track_data['image'],
-                                            previous_track_data['artist'],
-                                            previous_track_data['title'],
-                                            default_album,
-                                            clean_art_file)  # Stop recording if the track changes
-                    time.sleep(1)
-                    print(f"{now_str} Song changed, recording new song...")
-                    recorder.start_recording()
-                    previous_track_id = current_track_id
-                    previous_track_data = copy.deepcopy(current_song_data)
-                    tidalui.play()
-                    print(f"{now_str} Playing: {current_song} (track id: {current_track_id})")
-
-                    #exit(0)  # Exit the script
-            else:
-                current_song = " "
+    """
+    {'title': 'Forgiven', 'artists': 'Alexis Ffrench', 
+    'album': '', 'icon': '/home/zeuz/.config/tidal-hifi/notification.jpg',
+     'playingFrom': '', 'status': 'playing', 
+     'url': 'https://tidal.com/browse/track/94072682?u', 
+     'current': '0:05', 'currentInSeconds': 5, 'duration': '', 
+     'durationInSeconds': 0, 
+     'image': 'https://resources.tidal.com/images/72cb7592/255a/44b7/ac9c/625b9a0543d9/640x640.jpg', 
+     'favorite': False, 'player': {'status': 'playing', 'shuffle': False, 'repeat': 'off'}, 
+     'artist': 'Alexis Ffrench'}
 
-            if not current_song:
-                print(f"{now_str} songs are currently playing.")
-            else:
-                pass
-        except KeyboardInterrupt:
-            print("User interruption. Exiting...")
-            break
-        except Exception as e:
-            print(f"Error: {e}")
-        time.sleep(1)
+    """
+    try:
+        # yields as soon as /current reports another track
+        for changed_at, current_song_data in tidalui.watch_track_changes(args.poll):
+            previous_track_data = on_track_change(tidalui, recorder, previous_track_data,
+                                                  changed_at, current_song_data)
+    except KeyboardInterrupt:
+        print("User interruption. Exiting...")
+    recorder.close()
     #stop and join the consumer
-    task_queue.q.join()
-    consumer.stop()
-    consumer.join()
+    if consumer:
+        task_queue.join()
+        consumer.stop()
+        consumer.join()
+    if journal:
+        journal.finish()  # drained, the next run only resumes what is still pending
+    if metrics:
+        metrics.stop_export()
+        print(metrics.summary())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from AudioTrim.silence_trim import (trim_file, trim_directory, DEFAULT_THRESHOLD_DB, DEFAULT_WINDOW_MS,
+                                    DEFAULT_SEARCH_SECONDS, DEFAULT_MIN_GAP_MS, DEFAULT_MAX_BLEED_MS)
+
+
+def benchmark(path, workers, options):
+    # same files through cut-wav-last-seconds.sh (one file at a time) and through the python trim
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cut-wav-last-seconds.sh")
+    if os.path.isdir(path):
+        files = [f for f in os.listdir(path) if f.lower().endswith(".wav") and not f.endswith("_trimmed.wav")]
+    else:
+        path, files = os.path.split(path)
+        files = [files]
+    print(f"Benchmark on {len(files)} files")
+    with tempfile.TemporaryDirectory() as work:
+        if shutil.which("sox") and shutil.which("soxi"):
+            for f in files:
+                shutil.copy(os.path.join(path, f), work)
+            started = time.perf_counter()
+            for f in files:
+                subprocess.run(["bash", script, os.path.join(work, f), "1"], check=False,
+                               stdout=subprocess.DEVNULL)
+            print(f"cut-wav-last-seconds.sh: {time.perf_counter() - started:.2f}s")
+            for f in os.listdir(work):
+                os.unlink(os.path.join(work, f))
+        else:
+            print("cut-wav-last-seconds.sh: skipped, sox/soxi not installed")
+        for f in files:
+            shutil.copy(os.path.join(path, f), work)
+        started = time.perf_counter()
+        trim_directory(work, workers=workers, **options)
+        print(f"python trim ({workers or os.cpu_count()} workers): {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trim silence and next track bleed from recorded WAV files")
+    parser.add_argument("path", type=str, help="WAV file or directory of WAV files")
+    parser.add_argument("--in-place", action="store_true", help="Overwrite the input instead of writing *_trimmed.wav")
+    parser.add_argument("--threshold-db", type=float, default=DEFAULT_THRESHOLD_DB,
+                        help=f"Silence level in dBFS (default {DEFAULT_THRESHOLD_DB})")
+    parser.add_argument("--window-ms", type=int, default=DEFAULT_WINDOW_MS,
+                        help=f"RMS window (default {DEFAULT_WINDOW_MS} ms)")
+    parser.add_argument("--search", type=float, default=DEFAULT_SEARCH_SECONDS,
+                        help=f"Seconds searched at the start and the end (default {DEFAULT_SEARCH_SECONDS})")
+    parser.add_argument("--min-gap-ms", type=int, default=DEFAULT_MIN_GAP_MS,
+                        help=f"Shortest silence taken as a boundary (default {DEFAULT_MIN_GAP_MS} ms)")
+    parser.add_argument("--max-bleed-ms", type=int, default=DEFAULT_MAX_BLEED_MS,
+                        help=f"Longest audio of the previous/next track cut before/after a boundary (default {DEFAULT_MAX_BLEED_MS} ms)")
+    parser.add_argument("--workers", type=int, help="Parallel processes for a directory (default: number of cores)")
+    parser.add_argument("--benchmark", action="store_true", help="Compare with cut-wav-last-seconds.sh, files are not modified")
+    args = parser.parse_args()
+
+    options = {
+        "threshold_db": args.threshold_db,
+        "window_ms": args.window_ms,
+        "search_seconds": args.search,
+        "min_gap_ms": args.min_gap_ms,
+        "max_bleed_ms": args.max_bleed_ms,
+    }
+    if args.benchmark:
+        benchmark(args.path, args.workers, options)
+        return
+    if os.path.isdir(args.path):
+        results = trim_directory(args.path, workers=args.workers, in_place=args.in_place, **options)
+    else:
+        results = [trim_file(args.path, args.path if args.in_place else None, **options)]
+    for output, start, duration in results:
+        print(f"✂️ {output}: starts at {start:.3f}s, {duration:.3f}s long")
+
+
+if __name__ == "__main__":
+    main()